@@ -0,0 +1,188 @@
+# admission.py
+"""
+Admission control for the LLM-backed endpoints (/brew, /search, /api/predict).
+
+Every request to those paths goes through, in order:
+
+1. a per-client token bucket (TEATIME_CLIENT_RPS, burst TEATIME_CLIENT_BURST).
+   Empty bucket -> 429 with Retry-After = time until the next token.
+2. a global gate of TEATIME_ADMIT_CONCURRENCY requests in flight (each
+   request makes at most one embeddings call and one chat call). Requests
+   over the limit queue FIFO. The queue is bounded by TEATIME_ADMIT_QUEUE
+   and by TEATIME_ADMIT_MAX_WAIT_MS. The expected wait is (position / limit)
+   x the running average service time. If the queue is full or the expected
+   wait is too long, the request gets a 503 with Retry-After right away,
+   before doing any work. A request still queued when max wait runs out is
+   shed the same way.
+
+The client key is X-Teatime-Client if sent, else the first X-Forwarded-For hop
+when TEATIME_TRUST_PROXY=1, else the peer address.
+
+Exported on /metrics: teatime_admission_queue_depth,
+teatime_admission_inflight and teatime_admission_shed_total{reason}; time
+spent queued is the "admission_wait" stage.
+"""
+from __future__ import annotations
+import asyncio, math, os, threading, time
+from collections import OrderedDict, deque
+from typing import Deque, Iterable, Optional
+
+import metrics
+
+CLIENT_RPS = float(os.getenv("TEATIME_CLIENT_RPS", "2"))
+CLIENT_BURST = float(os.getenv("TEATIME_CLIENT_BURST", "10"))
+CONCURRENCY = int(os.getenv("TEATIME_ADMIT_CONCURRENCY", "16"))
+MAX_QUEUE = int(os.getenv("TEATIME_ADMIT_QUEUE", "64"))
+MAX_WAIT_S = float(os.getenv("TEATIME_ADMIT_MAX_WAIT_MS", "2000")) / 1000.0
+TRUST_PROXY = os.getenv("TEATIME_TRUST_PROXY", "0").lower() in ("1", "true", "yes")
+PATHS = ("/brew", "/search", "/api/predict")
+
+
+class Rejected(Exception):
+    def __init__(self, status: int, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.status, self.reason, self.retry_after = status, reason, retry_after
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate, self.burst = rate, burst
+        self.tokens, self.t = burst, time.monotonic()
+
+    def take(self) -> float:
+        """0 if a token was taken, else seconds until one is available."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.t) * self.rate)
+        self.t = now
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return 0.0
+        return (1.0 - self.tokens) / self.rate if self.rate > 0 else 60.0
+
+
+class RateLimiter:
+    def __init__(self, rate: float = CLIENT_RPS, burst: float = CLIENT_BURST, max_clients: int = 10000):
+        self.rate, self.burst, self.max_clients = rate, burst, max_clients
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def check(self, client: str):
+        if self.rate <= 0:
+            return
+        with self._lock:
+            b = self._buckets.get(client)
+            if b is None:
+                b = self._buckets[client] = TokenBucket(self.rate, self.burst)
+                while len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)  # idle clients fall out; a new bucket starts full
+            self._buckets.move_to_end(client)
+            wait = b.take()
+        if wait > 0:
+            raise Rejected(429, "rate_limited", wait)
+
+
+class Gate:
+    """Bounded FIFO concurrency gate for the event loop; sheds instead of queueing forever."""
+
+    def __init__(self, limit: int = CONCURRENCY, max_queue: int = MAX_QUEUE, max_wait_s: float = MAX_WAIT_S):
+        self.limit, self.max_queue, self.max_wait_s = max(1, limit), max_queue, max_wait_s
+        self.inflight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self.service_s: Optional[float] = None  # EWMA of time a request holds its slot
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def expected_wait(self, position: int) -> float:
+        return position / self.limit * (self.service_s or 0.0)
+
+    async def acquire(self) -> float:
+        """Seconds spent queued; raises Rejected(503) instead of waiting too long."""
+        if self.inflight < self.limit and not self._waiters:
+            self.inflight += 1
+            return 0.0
+        est = self.expected_wait(len(self._waiters) + 1)
+        if len(self._waiters) >= self.max_queue:
+            raise Rejected(503, "queue_full", max(est, 1.0))
+        if est > self.max_wait_s:
+            raise Rejected(503, "wait_too_long", est)
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.append(fut)
+        t0 = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(fut), self.max_wait_s)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as ex:
+            if fut.done() and not fut.cancelled():
+                self.release(None)  # the slot was handed over as we gave up; pass it on
+            else:
+                fut.cancel()
+                try:
+                    self._waiters.remove(fut)
+                except ValueError:
+                    pass
+            if isinstance(ex, asyncio.CancelledError):
+                raise
+            raise Rejected(503, "wait_timeout", self.expected_wait(len(self._waiters) + 1) or self.max_wait_s)
+        return time.monotonic() - t0
+
+    def release(self, held_s: Optional[float]):
+        if held_s is not None:
+            self.service_s = held_s if self.service_s is None else 0.9 * self.service_s + 0.1 * held_s
+        while self._waiters:
+            fut = self._waiters.popleft()
+            if not fut.done():
+                fut.set_result(None)  # the slot moves straight to the next waiter
+                return
+        self.inflight -= 1
+
+
+LIMITER = RateLimiter()
+GATE = Gate()
+
+metrics.register_gauge("teatime_admission_queue_depth", "Requests waiting for an admission slot.", lambda: GATE.queued)
+metrics.register_gauge("teatime_admission_inflight", "Admitted requests in flight.", lambda: GATE.inflight)
+
+
+def client_key(request) -> str:
+    key = request.headers.get("x-teatime-client")
+    if key:
+        return "h:" + key[:128]
+    if TRUST_PROXY:
+        fwd = request.headers.get("x-forwarded-for")
+        if fwd:
+            return fwd.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+
+def _reject(ex: Rejected):
+    from fastapi.responses import JSONResponse
+    metrics.shed(ex.reason)
+    retry = max(1, math.ceil(ex.retry_after))
+    msg = "Too many requests from this client" if ex.status == 429 else "Server is busy"
+    return JSONResponse({"detail": f"{msg}; retry in {retry}s", "reason": ex.reason},
+                        status_code=ex.status, headers={"Retry-After": str(retry)})
+
+
+def install(app, paths: Iterable[str] = PATHS, limiter: Optional[RateLimiter] = None, gate: Optional[Gate] = None):
+    """Add the admission middleware for `paths` (install after metrics so sheds skip all other work)."""
+    from fastapi import Request
+    paths = tuple(paths)
+    limiter = limiter or LIMITER
+    gate = gate or GATE
+
+    @app.middleware("http")
+    async def _admission(request: Request, call_next):
+        if request.method != "POST" or request.url.path not in paths:
+            return await call_next(request)
+        try:
+            limiter.check(client_key(request))
+            waited = await gate.acquire()
+        except Rejected as ex:
+            return _reject(ex)
+        metrics.STAGE_SECONDS.observe(waited, stage="admission_wait")
+        t0 = time.monotonic()
+        try:
+            return await call_next(request)
+        finally:
+            gate.release(time.monotonic() - t0)
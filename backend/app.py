@@ -7,39 +7,91 @@ Vibe: wacky ChatGPT with Twitter/X brainrot, zero mystic/oracle language.
 ASCII-only output to avoid PowerShell mojibake.
 API:
 - GET  /ping
-- POST /search  -> { start, end, results: [ {topic, score, first_seen, last_seen, days_seen} ] }
-- POST /brew    -> { prophecy, steep_level, ingredients, mode, window: {start, end} }
+- POST /search  -> { start, end, results: [ {topic, score, via, first_seen, last_seen, days_seen, longest_streak, rank_hist} ] }
+- POST /brew    -> { prophecy, steep_level, ingredients, mode, window: {start, end}, path }
+                   path: "full" (embeddings + LLM), "keyword" (LLM, keyword-only ingredients),
+                   "template" (deadline hit or every chat model circuit-open, local answer) or "error"
+- GET  /timeline?granularity=month&start&end&top -> { granularity, start, end, buckets: [ {start, end, rows, days, partial, top} ] }
+Repeated /search and /brew calls are served from in-process caches (cache.py);
+/brew paraphrases of a recent question can reuse its answer (semantic_cache.py);
+with TEATIME_QUERY_LOG set, queries are logged (query_log.py) and the most
+frequent ones are replayed in the background at startup to warm those caches.
+- GET  /metrics -> Prometheus text (stage histograms, upstream errors, cache hit ratios, LLM tokens)
+Responses that called the LLM carry X-Teatime-Tokens: prompt=, completion=, cached=
+(prompts are packed to a token budget by prompts.py).
+- GET  /admin/profiles -> recent per-request profiles (X-Teatime-Profile: 1, trusted hosts only)
+- POST /api/predict -> server.py's endpoint, mounted here so both share one engine (engine.py)
+POST /search, /brew and /api/predict pass admission control first (admission.py):
+429 over the per-client rate, 503 when the upstream queue is full; both with Retry-After.
 """
 
 from dotenv import load_dotenv
 load_dotenv()
 
-from fastapi import FastAPI
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from contextlib import asynccontextmanager
+from fastapi import Depends, FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import Optional, List, Dict, Any
 import numpy as np
-import re
-import unicodedata
-
-from retriever import TrendRetriever
-from llm_client import embed_texts, chat
+import os
+import time
+import requests
+
+import admission
+import cache
+import engine
+import metrics
+import profiling
+import prompts
+import query_log
+import retriever
+import rollups
+import sanitize
+import semantic_cache
+import server
+from llm_client import embed_texts, chat, CircuitOpen, EMBED_MODEL
 
 
 # -----------------------------------------------------------------------------
 # App setup
 # -----------------------------------------------------------------------------
 
-app = FastAPI(title="teatime.ai")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    async with engine.lifespan(app):
+        warmer = _start_warmup()
+        yield
+        if warmer is not None:
+            warmer.stop()
+
+
+app = FastAPI(title="teatime.ai", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "X-Teatime-Tokens"],
 )
+metrics.install(app)
+profiling.install(app)
+admission.install(app)
+app.include_router(server.router)
 
-R = TrendRetriever()
+# End-to-end /brew budget. Retrieval gets what is left after reserving
+# MIN_CHAT_S for the LLM; with less than half of that left when the prompt is
+# ready, the answer comes from a local template instead.
+BREW_BUDGET_S = float(os.getenv("TEATIME_BREW_BUDGET_MS", "12000")) / 1000.0
+MIN_CHAT_S = float(os.getenv("TEATIME_MIN_CHAT_MS", "1500")) / 1000.0
+
+# startup cache warm-up from the query log (needs TEATIME_QUERY_LOG; TEATIME_WARMUP_TOP=0 disables)
+WARMUP_TOP = int(os.getenv("TEATIME_WARMUP_TOP", "50"))
+WARMUP_RPS = float(os.getenv("TEATIME_WARMUP_RPS", "2"))
+WARMUP_EVERY_S = float(os.getenv("TEATIME_WARMUP_EVERY_S", "0"))
+WARMER: Optional[query_log.Warmer] = None
 
 
 # -----------------------------------------------------------------------------
@@ -52,6 +104,7 @@ class BrewReq(BaseModel):
     start: Optional[str] = None
     end: Optional[str] = None
     k: int = 8                 # number of trend ingredients to fetch
+    budget_ms: Optional[int] = None  # end-to-end deadline; capped at TEATIME_BREW_BUDGET_MS
 
 class SearchReq(BaseModel):
     query: str
@@ -86,76 +139,111 @@ LENGTH
 - Keep total output around 120–180 words.
 """
 
+# everything static goes in the system message so the prefix is byte-identical
+# across calls (provider prompt caching); the user message is per-request only.
+# STYLE above already spells out the output format; this just pins the opener.
+BREW_SYSTEM = SYSTEM_TONE + """
+Produce one answer in the STYLE layout, opening with exactly "Hot take from the timeline:". Do not add extra sections.
+"""
+
+TONE_NOTES = {
+    "wacky": "High energy, memey, but clear. No mystical language.",
+    "sensible": "Straightforward and helpful with a light wink. No slang overload.",
+    "oracle": "Dramatic cadence is fine, but absolutely no mystical or prophetic wording.",
+}
+
 
 # -----------------------------------------------------------------------------
 # Helpers
 # -----------------------------------------------------------------------------
 
-def _embed_query(q: str) -> Optional[np.ndarray]:
+def _embed_query(q: str, timeout: Optional[float] = None) -> Optional[np.ndarray]:
     """Return a float32 embedding for q or None on failure."""
+    key = cache.make_key(EMBED_MODEL, cache.normalize_query(q))
+    hit = cache.EMBEDDINGS.get(key)
+    if hit is not None:
+        return hit
     try:
-        e = embed_texts([q])[0]
-        return np.array(e, dtype=np.float32)
+        with metrics.span("embed"):
+            e = embed_texts([q], timeout=timeout)[0]
+        v = np.array(e, dtype=np.float32)
+        cache.EMBEDDINGS.set(key, v)
+        return v
     except Exception:
         return None
 
 
-def _pick_ingredients(question: str, start: Optional[str], end: Optional[str], k: int) -> List[Dict[str, Any]]:
+def _pick_ingredients(question: str, start: Optional[str], end: Optional[str], k: int,
+                      deadline: Optional[float] = None, embed: Optional[Future] = None) -> List[Dict[str, Any]]:
     """
-    Pull the top-k trend 'ingredients' using dense search; fall back to keyword.
+    Pull the top-k trend 'ingredients' with hybrid (dense + keyword, RRF) search;
+    keyword-only if the embedding misses its latency budget.
+    With a deadline (time.monotonic()), the embedding only gets the time left
+    after reserving MIN_CHAT_S for the LLM call. `embed` is a query embedding
+    already started (and waited on) by the caller: it is used if it is back,
+    and never waited on again.
     Returns simplified dicts for the LLM and UI.
     """
-    items: List[Dict[str, Any]] = []
-    q_emb = _embed_query(question)
-    if q_emb is not None:
-        items = R.dense_search(q_emb, k=k, start=start, end=end)
-    if not items:
-        items = R.keyword_search(question, k=k, start=start, end=end)
+    key = cache.make_key(cache.normalize_query(question), start, end, k)
+    hit = cache.RETRIEVAL.get(key)
+    if hit is not None:
+        return hit
+    R = engine.get_engine().R
+    budget = None
+    embed_fn = _embed_query
+    if deadline is not None:
+        budget = max(0.0, min(retriever.HYBRID_BUDGET_S, deadline - time.monotonic() - MIN_CHAT_S))
+        embed_fn = lambda q: _embed_query(q, timeout=budget)
+    if embed is not None:
+        embed_fn = lambda q: embed.result()
+        budget = retriever.HYBRID_BUDGET_S if embed.done() else 0.0
+    items = R.hybrid_search(question, k=k, start=start, end=end, embed_fn=embed_fn, budget_s=budget)
+    out = _ingredients_from_hits(items, start, end)
+    # keyword-only results are a fallback when embeddings exist; don't pin them
+    if R.emb is None or any(i["via"] != "keyword" for i in out):
+        cache.RETRIEVAL.set(key, out)
+    return out
+
 
+def _ingredients_from_hits(items: List[Dict[str, Any]], start: Optional[str], end: Optional[str]) -> List[Dict[str, Any]]:
+    """Search hits -> ingredient dicts with window-scoped and all-time topic stats."""
+    R = engine.get_engine().R
     out: List[Dict[str, Any]] = []
-    for it in items:
-        tl = R.topic_timeline(it["topic"])
-        out.append({
-            "topic": it["topic"],
-            "score": round(float(it.get("score", 0.0)), 4),
-            "first_seen": tl["first_seen"],
-            "last_seen": tl["last_seen"],
-            "days_seen": tl["days_seen"],
-        })
+    with metrics.span("timeline"):
+        # first/last/days_seen are scoped to the window; days_seen_total is all-time
+        ws = R.window_stats_batch([it["topic"] for it in items], start, end)
+        for it, w in zip(items, ws):
+            st = R.topic_stats(it["topic"])
+            out.append({
+                "topic": it["topic"],
+                "score": round(float(it.get("score", 0.0)), 4),
+                "via": it.get("via", "keyword"),
+                "first_seen": w["first_seen"],
+                "last_seen": w["last_seen"],
+                "days_seen": w["days_seen"],
+                "days_seen_total": st["days_seen"],
+                "longest_streak": st["longest_streak"],
+                "rank_hist": st["rank_hist"],
+            })
     return out
 
 
-def _build_user_prompt(q: str, ingredients: List[Dict[str, Any]], mode: str, window: Dict[str, str]) -> str:
+def _build_prompt(q: str, ingredients: List[Dict[str, Any]], mode: str, window: Dict[str, str]) -> prompts.Prompt:
     """
-    Construct the user message with a strict ASCII template and mode guidance.
+    BREW_SYSTEM + a user message of tone, window, the ingredients that fit the
+    token budget (best first) and the question last.
     """
-    tone_note = {
-        "wacky": "High energy, memey, but clear. No mystical language.",
-        "sensible": "Straightforward and helpful with a light wink. No slang overload.",
-        "oracle": "Dramatic cadence is fine, but absolutely no mystical or prophetic wording.",
-    }.get(mode, "Keep it playful but grounded. No mystical language.")
-
-    max_bullets = max(3, min(6, len(ingredients)))
-    lines: List[str] = [
-        f"Question: {q}",
+    tone_note = TONE_NOTES.get(mode, "Keep it playful but grounded. No mystical language.")
+    head = [
+        "Tone guide: " + tone_note,
         f"Date window: {window['start']} -> {window['end']}",
-        "Ingredients (CSV-derived trends):" if ingredients else "Ingredients: (none; trends were weak or unavailable)",
     ]
-    for ing in ingredients[:max_bullets]:
-        lines.append(f"- {ing['topic']} ({ing['first_seen']}->{ing['last_seen']}, {ing['days_seen']} days)")
-
-    # Strict output contract (ASCII only)
-    lines.append("")
-    lines.append("Tone guide: " + tone_note)
-    lines.append("OUTPUT FORMAT (exactly this, ASCII only):")
-    lines.append("Hot take from the timeline:")
-    lines.append("<2-5 sentences of answer. No mystical words. No emojis. ASCII only.>")
-    lines.append("Trending bits I used:")
-    lines.append("- <topic> — <first_seen> to <last_seen> (<N> days)")  # the model will substitute real bullets
-    lines.append("Confidence: Low/Medium/High — vibes-only, not facts.")
-    lines.append("")
-    lines.append("Produce one answer following OUTPUT FORMAT. Do not add extra sections.")
-    return "\n".join(lines)
+    if ingredients:
+        head.append("Ingredients (CSV-derived trends):")
+    bullets = [f"- {ing['topic']} ({ing['first_seen']}->{ing['last_seen']}, {ing['days_seen']} days)" for ing in ingredients]
+    prompt, _ = prompts.assemble(BREW_SYSTEM, head, bullets, ["", f"Question: {q}"],
+                                 empty="Ingredients: (none; trends were weak or unavailable)")
+    return prompt
 
 
 def _steep_from_ingredients(n: int) -> str:
@@ -163,27 +251,61 @@ def _steep_from_ingredients(n: int) -> str:
     return "High" if n >= 6 else ("Medium" if n >= 3 else "Low")
 
 
-_ascii_dash_re = re.compile(r"[–—]+")  # normalize long dashes to single hyphen
-_multi_blank_re = re.compile(r"\n{3,}")
+def _template_take(q: str, ingredients: List[Dict[str, Any]]) -> str:
+    """Local answer in the BREW_SYSTEM output format, for when the LLM is out of time."""
+    tops = [ing["topic"] for ing in ingredients[:3]]
+    if tops:
+        body = (f"The timeline is lagging, so here is the quick read on \"{q}\": "
+                f"the loudest related trends were {', '.join(tops)}. That is the vibe, not a forecast.")
+    else:
+        body = f"The timeline is lagging and trends were weak for \"{q}\", so no real take this time."
+    lines = ["Hot take from the timeline:", body, "Trending bits I used:"]
+    for ing in ingredients[:max(3, min(6, len(ingredients)))]:
+        lines.append(f"- {ing['topic']} - {ing['first_seen']} to {ing['last_seen']} ({ing['days_seen']} days)")
+    lines.append("Confidence: Low - vibes-only, not facts.")
+    return "\n".join(lines)
 
 
 def _sanitize_ascii(text: str) -> str:
     """
-    Normalize to ASCII for Windows terminals:
-    - NFKD normalize
-    - replace en/em dashes with '-'
-    - strip all non-ASCII
-    - collapse absurd blank lines
+    Normalize to ASCII for Windows terminals (sanitize.py):
+    - smart quotes/dashes/ellipsis -> ASCII look-alikes, runs of long dashes -> '-'
+    - other non-ASCII -> its NFKD ASCII part, or dropped
+    - collapse absurd blank lines, strip
     """
-    if not isinstance(text, str):
-        return ""
-    t = unicodedata.normalize("NFKD", text)
-    t = _ascii_dash_re.sub("-", t)
-    # strip non-ascii bytes
-    t = t.encode("ascii", "ignore").decode("ascii")
-    # tidy spaces
-    t = _multi_blank_re.sub("\n\n", t)
-    return t.strip()
+    return sanitize.to_ascii(text)
+
+
+def _brew_from_ingredients(question: str, ings: List[Dict[str, Any]], mode: str, window: Dict[str, str],
+                           deadline: float) -> tuple[str, str, str]:
+    """LLM take (or template once the deadline is too close) -> (prophecy, steep_level, path)."""
+    path = "full" if any(i["via"] != "keyword" for i in ings) else "keyword"
+    with metrics.span("prompt_build"):
+        prompt = _build_prompt(question, ings, mode, window)
+
+    remaining = deadline - time.monotonic()
+    steep = _steep_from_ingredients(len(ings))
+    try:
+        if remaining < MIN_CHAT_S / 2:
+            metrics.degraded("chat_budget")
+            raise requests.Timeout("no time left for the LLM")
+        # Slightly higher cap to allow bullets; adjust if needed by frontend
+        with metrics.span("llm_call"):
+            raw = chat(prompt.system, prompt.user, max_tokens=360, timeout=remaining)
+        with metrics.span("sanitize"):
+            prophecy = _sanitize_ascii(raw)
+    except (requests.Timeout, CircuitOpen):
+        if remaining >= MIN_CHAT_S / 2:
+            metrics.degraded("chat_timeout")
+        path = "template"
+        with metrics.span("sanitize"):
+            prophecy = _sanitize_ascii(_template_take(question, ings))
+        steep = "Low"
+    except Exception as ex:
+        path = "error"
+        prophecy = _sanitize_ascii(f"Brain lag. Could not brew a take: {ex}")
+        steep = "Low"
+    return prophecy, steep, path
 
 
 # -----------------------------------------------------------------------------
@@ -191,51 +313,128 @@ def _sanitize_ascii(text: str) -> str:
 # -----------------------------------------------------------------------------
 
 @app.get("/ping")
-def ping():
+def ping(eng: engine.Engine = Depends(engine.current)):
     """Health check + corpus metadata."""
+    R = eng.R
     return {
         "ok": True,
-        "topics": len(R.topic_dates),
+        "topics": R.n_topics,
         "has_embeddings": R.emb is not None,
         "csv_bounds": {"start": R.csv_start, "end": R.csv_end},
         "modes": ["wacky", "sensible", "oracle"],
         "encoding": "ASCII-only response text",
+        "warmup": WARMER.state if WARMER is not None else {"state": "off"},
+        "engine": eng.info(),
     }
 
 
+def _window(R, start: Optional[str], end: Optional[str]) -> tuple[str, str]:
+    try:
+        return R.clamp_window(start, end)
+    except ValueError as ex:
+        raise HTTPException(status_code=400, detail=f"Invalid window (want YYYY-MM-DD or ISO datetimes, start <= end): {ex}")
+
+
 @app.post("/search")
-def search(req: SearchReq):
+def search(req: SearchReq, eng: engine.Engine = Depends(engine.current)):
     """Search for relevant trends to a query within an optional time window."""
-    s, e = R.clamp_window(req.start, req.end)
+    s, e = _window(eng.R, req.start, req.end)
     k = max(1, min(int(req.k or 10), 50))  # simple guardrail
+    query_log.LOG.record("search", req.query, None, s, e, k)
     ings = _pick_ingredients(req.query, s, e, k)
     return {"start": s, "end": e, "results": ings}
 
 
+@app.get("/timeline")
+def timeline(granularity: str = "month", start: Optional[str] = None, end: Optional[str] = None, top: int = 3,
+             eng: engine.Engine = Depends(engine.current)):
+    """Trend density over time for the timeline scrubber (served from pre-aggregated rollups)."""
+    if granularity not in rollups.GRANULARITIES:
+        raise HTTPException(status_code=400, detail=f"granularity must be one of {', '.join(rollups.GRANULARITIES)}")
+    s, e = _window(eng.R, start, end)
+    try:
+        with metrics.span("timeline_rollup"):
+            buckets = eng.R.timeline_histogram(granularity, s, e, max(0, min(top, rollups.TOP_K)))
+    except ValueError as ex:
+        raise HTTPException(status_code=400, detail=f"Invalid date: {ex}")
+    return {"granularity": granularity, "start": s, "end": e, "buckets": buckets}
+
+
 @app.post("/brew")
-def brew(req: BrewReq):
+def brew(req: BrewReq, eng: engine.Engine = Depends(engine.current)):
     """
     Generate a timeline-fueled hot take, grounded in trends ("ingredients").
     Returns ASCII-only text as `prophecy` for frontend compatibility.
     """
-    s, e = R.clamp_window(req.start, req.end)
+    s, e = _window(eng.R, req.start, req.end)
     k = max(1, min(int(req.k or 8), 50))
-    ings = _pick_ingredients(req.question, s, e, k)
-    user_prompt = _build_user_prompt(req.question, ings, req.mode, {"start": s, "end": e})
-
-    try:
-        # Slightly higher cap to allow bullets; adjust if needed by frontend
-        raw = chat(SYSTEM_TONE, user_prompt, max_tokens=360)
-        prophecy = _sanitize_ascii(raw)
-        steep = _steep_from_ingredients(len(ings))
-    except Exception as ex:
-        prophecy = _sanitize_ascii(f"Brain lag. Could not brew a take: {ex}")
-        steep = "Low"
-
-    return {
+    query_log.LOG.record("brew", req.question, req.mode, s, e, k)
+    return _brew(req.question, req.mode, s, e, k, req.budget_ms)
+
+
+def _brew(question: str, mode: str, s: str, e: str, k: int, budget_ms: Optional[int] = None) -> Dict[str, Any]:
+    key = cache.make_key(cache.normalize_query(question), mode, s, e, k)
+    hit = cache.GENERATIONS.get(key)
+    if hit is not None:
+        return hit
+    budget = BREW_BUDGET_S if not budget_ms else min(BREW_BUDGET_S, budget_ms / 1000.0)
+    deadline = time.monotonic() + budget
+    part, q_emb, embed = (mode, s, e, k), None, None
+    # one embed, with retrieval's budget, serves the lookup and hybrid search;
+    # if it misses the budget here, retrieval goes keyword-only instead of waiting again
+    embed_s = max(0.0, min(retriever.HYBRID_BUDGET_S, budget - MIN_CHAT_S))
+    if semantic_cache.ENABLED and embed_s > 0:  # no time for an embed: no lookup, keyword-only retrieval
+        embed = retriever.submit_embed(lambda q: _embed_query(q, timeout=embed_s), question)
+        try:
+            q_emb = embed.result(timeout=embed_s)
+        except FutureTimeout:
+            pass
+        if q_emb is not None:
+            with metrics.span("semantic_lookup"):
+                near = semantic_cache.CACHE.lookup(q_emb, part)
+            if near is not None:
+                answer, orig, sim = near
+                out = {**answer, "similar_to": {"question": orig, "similarity": round(sim, 4)}}
+                cache.GENERATIONS.set(key, out)
+                return out
+    ings = _pick_ingredients(question, s, e, k, deadline=deadline, embed=embed)
+    prophecy, steep, path = _brew_from_ingredients(question, ings, mode, {"start": s, "end": e}, deadline)
+
+    out = {
         "prophecy": prophecy,              # ASCII-safe text
         "steep_level": steep,              # High/Medium/Low from ingredient count
         "ingredients": ings,               # surfaced to UI
-        "mode": req.mode,
+        "mode": mode,
         "window": {"start": s, "end": e},
+        "path": path,                      # which path served this answer
     }
+    if _cacheable(path):
+        cache.GENERATIONS.set(key, out)
+        if q_emb is not None:
+            semantic_cache.CACHE.add(q_emb, part, cache.normalize_query(question), out)
+    return out
+
+
+def _cacheable(path: str) -> bool:
+    """Only real LLM answers are pinned; keyword-only ones too if there are no embeddings to do better."""
+    return path == "full" or (path == "keyword" and engine.get_engine().R.emb is None)
+
+
+def _replay(entry: Dict[str, Any]):
+    """Warm-up: re-run one logged query so its embedding/retrieval/generation are cached."""
+    s, e = engine.get_engine().R.clamp_window(entry.get("start"), entry.get("end"))
+    if entry["endpoint"] == "search":
+        _pick_ingredients(entry["q"], s, e, int(entry.get("k") or 10))
+    elif entry["endpoint"] == "brew":
+        k, mode = int(entry.get("k") or 8), entry.get("mode") or "wacky"
+        if cache.make_key(entry["q"], mode, s, e, k) not in cache.GENERATIONS:
+            _brew(entry["q"], mode, s, e, k)
+
+
+def _start_warmup() -> Optional[query_log.Warmer]:
+    global WARMER
+    if WARMUP_TOP <= 0 or query_log.LOG.path is None:
+        return None
+    WARMER = query_log.Warmer(query_log.LOG, _replay, top_n=WARMUP_TOP, rps=WARMUP_RPS,
+                              every_s=WARMUP_EVERY_S, endpoints=["search", "brew"]).start()
+    return WARMER
@@ -0,0 +1,184 @@
+# batch_brew.py
+"""
+Offline /brew for a list of questions (cache pre-warming, nightly
+"trend of the day" content).
+
+Input JSONL, one question per line:
+
+    {"id": "tod-2025-10-01", "question": "will ai take my job", "mode": "wacky",
+     "start": "2024-01-01", "end": "2024-12-31", "k": 8}
+
+Only "question" is required; id defaults to a hash of the other fields.
+Ingredients are retrieved in chunks: one embeddings call per chunk, one
+matmul for the dense search, keyword search per question, fused the same way
+as /brew. LLM calls then run through a bounded asyncio worker pool and every
+result is appended to the output JSONL as soon as it is ready, so a rerun
+with the same output file skips ids that already have an answer (rows with
+path "error" or "template" are retried).
+
+Answers /brew would cache also go into cache.GENERATIONS under /brew's key,
+so with a shared backend (TEATIME_CACHE_BACKEND=sqlite or redis) the
+servers answer those questions from the cache; with the default in-process
+backend the seeding dies with the batch process.
+
+    python batch_brew.py questions.jsonl out.jsonl --concurrency 8
+"""
+from __future__ import annotations
+import asyncio, hashlib, json, sys, time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Set
+
+import numpy as np
+
+import cache
+import engine
+import metrics
+from llm_client import embed_texts
+
+CHUNK = 64
+
+
+def item_id(item: Dict[str, Any]) -> str:
+    if item.get("id"):
+        return str(item["id"])
+    key = json.dumps([item.get("question"), item.get("mode", "wacky"), item.get("start"), item.get("end"), item.get("k", 8)])
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:12]
+
+
+def read_items(path: Path) -> Iterator[Dict[str, Any]]:
+    with path.open("r", encoding="utf-8") as f:
+        for n, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            if not str(item.get("question") or "").strip():
+                print(f"[batch] line {n}: no question, skipped")
+                continue
+            item["id"] = item_id(item)
+            yield item
+
+
+def done_ids(out_path: Path) -> Set[str]:
+    """Ids already answered in a previous run (last row per id wins)."""
+    status: Dict[str, str] = {}
+    if out_path.exists():
+        with out_path.open("r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # half-written last line from a crash
+                status[row["id"]] = row.get("path", "")
+    return {i for i, p in status.items() if p not in ("error", "template")}
+
+
+def _embed_chunk(questions: List[str]) -> List[Optional[np.ndarray]]:
+    try:
+        with metrics.span("embed"):
+            vecs = embed_texts(questions)
+        return [np.asarray(v, dtype=np.float32) for v in vecs]
+    except Exception as ex:
+        print(f"[batch] embeddings failed for {len(questions)} questions ({ex}); keyword-only")
+        return [None] * len(questions)
+
+
+def retrieve_chunk(teatime, items: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+    """Ingredients for a chunk of items: one embeddings call + one batched dense search."""
+    R = engine.get_engine().R
+    windows = [R.clamp_window(it.get("start"), it.get("end")) for it in items]
+    k = max(int(it.get("k") or 8) for it in items)
+    questions = [it["question"] for it in items]
+    q_embs = _embed_chunk(questions) if R.emb is not None else None
+    hits = R.hybrid_search_batch(questions, q_embs, k=min(k, 50), windows=windows)
+    out = []
+    for it, (s, e), h in zip(items, windows, hits):
+        it["window"] = {"start": s, "end": e}
+        out.append(teatime._ingredients_from_hits(h[:max(1, min(int(it.get("k") or 8), 50))], s, e))
+    return out
+
+
+async def run(in_path: Path, out_path: Path, concurrency: int = 8, budget_s: Optional[float] = None) -> Dict[str, int]:
+    import app as teatime
+
+    budget = budget_s or teatime.BREW_BUDGET_S
+    skip = done_ids(out_path)
+    todo = [it for it in read_items(in_path) if it["id"] not in skip]
+    print(f"[batch] {len(todo)} to brew, {len(skip)} already done")
+    counts = {"done": 0, "error": 0, "skipped": len(skip)}
+    if not todo:
+        return counts
+
+    sem = asyncio.Semaphore(concurrency)
+    lock = asyncio.Lock()
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    with out_path.open("a+", encoding="utf-8") as out:
+        if out.tell() > 0:
+            out.seek(out.tell() - 1)
+            if out.read(1) != "\n":
+                out.write("\n")  # a crash left a half-written row; start a fresh line
+
+        async def brew_one(item: Dict[str, Any], ings: List[Dict[str, Any]]):
+            async with sem:
+                t0 = time.perf_counter()
+                mode = item.get("mode") or "wacky"
+                deadline = time.monotonic() + budget
+                prophecy, steep, path = await asyncio.to_thread(
+                    teatime._brew_from_ingredients, item["question"], ings, mode, item["window"], deadline)
+            row = {
+                "id": item["id"],
+                "question": item["question"],
+                "mode": mode,
+                "window": item["window"],
+                "prophecy": prophecy,
+                "steep_level": steep,
+                "ingredients": ings,
+                "path": path,
+                "elapsed_ms": round((time.perf_counter() - t0) * 1000, 1),
+            }
+            if teatime._cacheable(path):
+                s, e = item["window"]["start"], item["window"]["end"]
+                k = max(1, min(int(item.get("k") or 8), 50))
+                key = cache.make_key(cache.normalize_query(item["question"]), mode, s, e, k)
+                cache.GENERATIONS.set(key, {f: row[f] for f in ("prophecy", "steep_level", "ingredients", "mode", "window", "path")})
+            async with lock:
+                out.write(json.dumps(row, ensure_ascii=False) + "\n")
+                out.flush()
+            counts["error" if path == "error" else "done"] += 1
+
+        # retrieval for the next chunk overlaps the LLM calls of the previous ones;
+        # at most two chunks of brews are queued at a time
+        pending: Set[asyncio.Task] = set()
+        for i in range(0, len(todo), CHUNK):
+            chunk = todo[i:i + CHUNK]
+            ings = await asyncio.to_thread(retrieve_chunk, teatime, chunk)
+            pending |= {asyncio.create_task(brew_one(it, ing)) for it, ing in zip(chunk, ings)}
+            while len(pending) > 2 * CHUNK:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for t in done:
+                    t.result()
+            print(f"[batch] retrieved {min(i + CHUNK, len(todo))}/{len(todo)}")
+        if pending:
+            for t in await asyncio.gather(*pending, return_exceptions=True):
+                if isinstance(t, BaseException):
+                    raise t
+    return counts
+
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="Brew answers for a JSONL of questions (resumable).")
+    ap.add_argument("input", help="JSONL with question/mode/start/end/k per line")
+    ap.add_argument("output", help="results JSONL (appended; existing answers are skipped)")
+    ap.add_argument("--concurrency", type=int, default=8, help="LLM calls in flight")
+    ap.add_argument("--budget-ms", type=int, default=None, help="per-question deadline (default TEATIME_BREW_BUDGET_MS)")
+    args = ap.parse_args()
+    src = Path(args.input)
+    if not src.exists():
+        print(f"Missing {src}")
+        sys.exit(2)
+    t0 = time.perf_counter()
+    c = asyncio.run(run(src, Path(args.output), args.concurrency, args.budget_ms / 1000.0 if args.budget_ms else None))
+    mark = "✅" if not c["error"] else "❌"
+    print(f"{mark} {c['done']} brewed, {c['error']} errors, {c['skipped']} skipped in {time.perf_counter() - t0:.1f}s → {args.output}")
+    sys.exit(0 if not c["error"] else 1)
@@ -0,0 +1,233 @@
+# bench.py
+"""
+Benchmarks for the retrieval and endpoint hot paths.
+
+Each scale (1x/10x/100x) gets a synthetic corpus derived from
+data/trends_min_us.csv under bench_data/x{N}/data/ (topics are cloned with a
+suffix so the number of unique topics grows with the row count) plus random
+topic embeddings. The benchmark chdirs into that directory so every module
+that reads Path("data") sees the synthetic corpus.
+
+Upstream calls go to stub_upstream.py on a local port, so /search, /brew and
+/api/predict measure our own overhead, not OpenRouter's.
+
+    python bench.py --scales 1 10 --out bench.json
+    python bench.py --scales 1 --baseline bench.json   # print ratios vs a previous run
+"""
+from __future__ import annotations
+import csv, json, os, random, statistics, sys, time, platform
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+BACKEND = Path(__file__).resolve().parent
+SRC_CSV = BACKEND / "data" / "trends_min_us.csv"
+BENCH_DIR = BACKEND / "bench_data"
+
+QUERIES = [
+    "will ai take my job", "taylor swift tour", "nba finals", "election night",
+    "monday motivation", "climate change", "new iphone", "super bowl halftime",
+]
+WINDOWS = [(None, None), ("2020-01-01", "2020-12-31"), ("2024-06-01", "2024-09-30")]
+
+
+def rss_mb() -> Optional[float]:
+    """Current resident set size from /proc/self/statm (None off Linux).
+
+    Not ru_maxrss: that is the process high-water mark, so after the first big
+    scale every later case would report the same number."""
+    try:
+        pages = int(Path("/proc/self/statm").read_text().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+
+def make_corpus(scale: int, dim: int) -> Path:
+    """bench_data/x{scale}/ with data/trends_min_us.csv, topic_embeddings.npy, topic_index.json."""
+    root = BENCH_DIR / f"x{scale}"
+    data = root / "data"
+    csv_out = data / "trends_min_us.csv"
+    emb_out = data / "topic_embeddings.npy"
+    if csv_out.exists() and emb_out.exists() and np.load(emb_out, mmap_mode="r").shape[1] == dim:
+        return root
+    data.mkdir(parents=True, exist_ok=True)
+    with SRC_CSV.open("r", encoding="utf-8", newline="") as f:
+        base = list(csv.DictReader(f))
+
+    topics: Dict[str, list] = {}
+    rows = []
+    for copy in range(scale):
+        suffix = "" if copy == 0 else f" {copy}"
+        for r in base:
+            t = r["topic"] + suffix
+            rows.append((r["date"], r["rank"], t))
+            topics.setdefault(t, []).append(r["date"])
+    rows.sort(key=lambda x: (x[0], int(x[1])))
+    with csv_out.open("w", encoding="utf-8", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(["date", "rank", "topic"])
+        w.writerows(rows)
+
+    rng = np.random.default_rng(scale)
+    E = rng.standard_normal((len(topics), dim), dtype=np.float32)
+    np.save(emb_out, E)
+    index = [{"topic": t, "first_seen": min(ds), "last_seen": max(ds), "days_seen": len(set(ds))} for t, ds in topics.items()]
+    (data / "topic_index.json").write_text(json.dumps(index), encoding="utf-8")
+    return root
+
+
+def measure(fn: Callable[[], Any], n: int, warmup: int = 2) -> Dict[str, Any]:
+    """Latency percentiles for n calls of fn, plus RSS after the case and how much the case itself added."""
+    rss0 = rss_mb()
+    for _ in range(warmup):
+        fn()
+    lat = []
+    t0 = time.perf_counter()
+    for _ in range(n):
+        s = time.perf_counter()
+        fn()
+        lat.append(time.perf_counter() - s)
+    total = time.perf_counter() - t0
+    rss1 = rss_mb()
+    lat.sort()
+    q = lambda p: lat[min(len(lat) - 1, int(round(p * (len(lat) - 1))))]
+    return {
+        "n": n,
+        "p50_ms": round(q(0.50) * 1000, 3),
+        "p99_ms": round(q(0.99) * 1000, 3),
+        "mean_ms": round(statistics.fmean(lat) * 1000, 3),
+        "throughput_per_s": round(n / total, 2) if total else None,
+        "rss_mb": round(rss1, 1) if rss1 is not None else None,
+        "rss_delta_mb": round(rss1 - rss0, 1) if rss0 is not None and rss1 is not None else None,
+    }
+
+
+def _cycle(items: list):
+    i = [0]
+    def nxt():
+        v = items[i[0] % len(items)]
+        i[0] += 1
+        return v
+    return nxt
+
+
+def bench_scale(scale: int, dim: int, n: int, endpoints: bool, stub_url: Optional[str]) -> Dict[str, Any]:
+    root = make_corpus(scale, dim)
+    os.chdir(root)
+    import engine, retriever, server
+
+    res: Dict[str, Any] = {}
+    cold_n = max(1, min(5, n // 20))
+    res["retriever_cold_start"] = measure(lambda: retriever.TrendRetriever(), cold_n, warmup=0)
+
+    R = retriever.TrendRetriever()
+    engine.set_engine(engine.Engine(R))  # retrieve_topics(), server and app all reuse it
+    rng = np.random.default_rng(0)
+    qvecs = rng.standard_normal((16, dim), dtype=np.float32)
+    nq = _cycle(list(qvecs))
+    nw = _cycle([w for w in WINDOWS if w[0]])
+    nt = _cycle(QUERIES)
+    topics = R.stats.topics[:1000] or [i["topic"] for i in (R.index or [])[:1000]]
+    ntopic = _cycle(topics)
+
+    res["dense_search"] = measure(lambda: R.dense_search(nq(), k=8), n)
+    res["dense_search_window"] = measure(lambda: R.dense_search(nq(), 8, *nw()), n)
+    res["keyword_search"] = measure(lambda: R.keyword_search(nt(), k=10), n)
+    res["keyword_search_window"] = measure(lambda: R.keyword_search(nt(), 10, *nw()), n)
+    res["topic_timeline"] = measure(lambda: R.topic_timeline(ntopic()), n * 10)
+    res["retrieve_topics"] = measure(lambda: retriever.retrieve_topics(nt(), top_k=10, mode="keyword"), n)
+    embed = lambda q: nq()
+    res["hybrid_search"] = measure(lambda: R.hybrid_search(nt(), 10, embed_fn=embed), n)
+
+    res["load_trends_from_csv"] = measure(lambda: server.load_trends_from_csv(*nw(), limit=25), n)
+    sample = server.load_trends_from_csv(None, None, limit=25)
+    res["get_top_trend_from_list"] = measure(lambda: server.get_top_trend_from_list(sample, nt()), n * 10)
+
+    if endpoints and stub_url:
+        from fastapi.testclient import TestClient
+        import app as teatime_app
+        c_app = TestClient(teatime_app.app)
+        c_srv = TestClient(server.app)
+        res["POST /search"] = measure(lambda: c_app.post("/search", json={"query": nt(), "k": 10}).raise_for_status(), n)
+        res["POST /brew"] = measure(lambda: c_app.post("/brew", json={"question": nt(), "mode": "wacky"}).raise_for_status(), n)
+        res["POST /api/predict"] = measure(lambda: c_srv.post("/api/predict", json={"prompt": nt()}).raise_for_status(), n)
+
+    os.chdir(BACKEND)
+    return res
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]) -> List[str]:
+    lines = []
+    for scale, cases in current["results"].items():
+        for name, m in cases.items():
+            b = baseline.get("results", {}).get(scale, {}).get(name)
+            if not b:
+                continue
+            r50 = m["p50_ms"] / b["p50_ms"] if b["p50_ms"] else float("nan")
+            r99 = m["p99_ms"] / b["p99_ms"] if b["p99_ms"] else float("nan")
+            flag = "  <-- slower" if r50 > 1.2 else ""
+            lines.append(f"{scale:>5} {name:<28} p50 x{r50:5.2f}  p99 x{r99:5.2f}{flag}")
+    return lines
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    import argparse
+    ap = argparse.ArgumentParser(description="Benchmark retrieval + endpoint hot paths.")
+    ap.add_argument("--scales", type=int, nargs="+", default=[1, 10, 100])
+    ap.add_argument("--n", type=int, default=200, help="iterations per case")
+    ap.add_argument("--dim", type=int, default=256, help="synthetic embedding width")
+    ap.add_argument("--no-endpoints", action="store_true", help="skip the FastAPI end-to-end cases")
+    ap.add_argument("--out", help="write JSON results here (default: stdout)")
+    ap.add_argument("--baseline", help="previous JSON results to compare against")
+    args = ap.parse_args(argv)
+
+    sys.path.insert(0, str(BACKEND))
+    # all bench traffic is one client issuing requests back to back; admission
+    # control would throttle it (429) and the numbers would measure the limiter
+    os.environ.update({"TEATIME_CLIENT_RPS": "0", "TEATIME_ADMIT_CONCURRENCY": "256", "TEATIME_ADMIT_QUEUE": "1024"})
+    # bench cycles a handful of queries; with the generation/retrieval/semantic caches on,
+    # the endpoint cases would time cache hits after the first lap
+    os.environ.update({"TEATIME_CACHE_GENERATION_ITEMS": "0", "TEATIME_CACHE_RETRIEVAL_ITEMS": "0",
+                       "TEATIME_QUERY_LOG": "", "TEATIME_WARMUP_TOP": "0", "TEATIME_SEMANTIC_CACHE": "0"})
+    stub_url = None
+    if not args.no_endpoints:
+        from stub_upstream import start_stub
+        stub = start_stub(dim=args.dim)
+        stub_url = stub.base_url
+        # must be set before llm_client / app / server are imported
+        os.environ["OPENROUTER_BASE_URL"] = stub_url
+        os.environ["OPENROUTER_API_KEY"] = "bench"
+    random.seed(0)
+
+    out: Dict[str, Any] = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": np.__version__,
+            "n": args.n,
+            "dim": args.dim,
+            "store": os.getenv("TEATIME_STORE", "memory"),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": {},
+    }
+    for scale in args.scales:
+        print(f"[bench] scale x{scale}", file=sys.stderr)
+        out["results"][f"x{scale}"] = bench_scale(scale, args.dim, args.n, not args.no_endpoints, stub_url)
+
+    text = json.dumps(out, indent=2)
+    if args.out:
+        Path(args.out).write_text(text, encoding="utf-8")
+        print(f"[bench] wrote {args.out}", file=sys.stderr)
+    else:
+        print(text)
+    if args.baseline:
+        for line in compare(out, json.loads(Path(args.baseline).read_text(encoding="utf-8"))):
+            print(line, file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
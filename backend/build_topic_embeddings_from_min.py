@@ -1,17 +1,22 @@
 # build_topic_embeddings_from_min.py
 from __future__ import annotations
-import os, json, time
+import os, json, time, hashlib, random, threading, sys
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 import numpy as np
 import requests
 
 IN = Path("data") / "trends_topic_summary.json"
 EOUT = Path("data") / "topic_embeddings.npy"
 IOUT = Path("data") / "topic_index.json"
+# Checkpoints written by --concurrency mode so a crashed build can resume.
+EPART = Path("data") / "topic_embeddings.partial.npy"
+IPART = Path("data") / "topic_index.partial.json"
 
 API_KEY = os.getenv("OPENROUTER_API_KEY")
 MODEL = "openai/text-embedding-3-small"
-API_URL = "https://openrouter.ai/api/v1/embeddings"
+API_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1").rstrip("/") + "/embeddings"
+RETRY_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
 
 def embed_batch(batch: list[str]) -> list[list[float]]:
     headers = {"Authorization": f"Bearer {API_KEY}", "Content-Type": "application/json"}
@@ -21,7 +26,215 @@ def embed_batch(batch: list[str]) -> list[list[float]]:
     data = r.json()
     return [d["embedding"] for d in data["data"]]
 
-def main():
+def embed_batch_retry(batch: list[str], retries: int = 5, backoff: float = 1.0) -> list[list[float]]:
+    """embed_batch with exponential backoff (+ jitter) on 429/5xx and network errors."""
+    for attempt in range(retries + 1):
+        try:
+            return embed_batch(batch)
+        except requests.HTTPError as ex:
+            resp = ex.response
+            if resp is None or resp.status_code not in RETRY_STATUS or attempt == retries:
+                raise
+            try:
+                wait_s = float(resp.headers.get("Retry-After") or 0)
+            except ValueError:
+                wait_s = 0.0
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == retries:
+                raise
+            wait_s = 0.0
+        wait_s = max(wait_s, backoff * 2 ** attempt) * (0.5 + random.random() / 2)
+        print(f"[embed] retry {attempt + 1}/{retries} in {wait_s:.1f}s")
+        time.sleep(wait_s)
+    raise RuntimeError("unreachable")
+
+class RateLimiter:
+    """Spaces calls at least 1/rps seconds apart across threads."""
+
+    def __init__(self, rps: float):
+        self.interval = 1.0 / rps if rps > 0 else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+def _load_checkpoint() -> dict[str, np.ndarray]:
+    if not (EPART.exists() and IPART.exists()):
+        return {}
+    E = np.load(EPART)
+    hashes = json.loads(IPART.read_text(encoding="utf-8"))
+    if len(hashes) != E.shape[0]:
+        print("[embed] checkpoint is inconsistent; ignoring it")
+        return {}
+    return {h: E[i] for i, h in enumerate(hashes)}
+
+def _save_checkpoint(done: dict[str, np.ndarray]):
+    hashes = list(done)
+    tmp_e = EPART.with_suffix(".tmp.npy")
+    tmp_i = IPART.with_suffix(".json.tmp")
+    np.save(tmp_e, np.stack([done[h] for h in hashes]).astype(np.float32))
+    tmp_i.write_text(json.dumps(hashes), encoding="utf-8")
+    # index last: a crash between the two leaves a length mismatch, which is detected on load
+    tmp_e.replace(EPART)
+    tmp_i.replace(IPART)
+
+def embed_concurrent(docs: list[str], hashes: list[str], concurrency: int = 4, rps: float = 4.0,
+                     batch_size: int = 128, checkpoint_every: int = 8) -> list[list[float]]:
+    """
+    Embed docs with up to `concurrency` batches in flight, at most `rps` batch
+    requests per second. Finished vectors are checkpointed (keyed by content
+    hash) every `checkpoint_every` batches and reused on the next run.
+    """
+    done = _load_checkpoint()
+    if done:
+        print(f"[embed] resuming: {sum(h in done for h in hashes)}/{len(docs)} already in checkpoint")
+    todo = [i for i, h in enumerate(hashes) if h not in done]
+    batches = [todo[i:i+batch_size] for i in range(0, len(todo), batch_size)]
+    limiter = RateLimiter(rps)
+
+    def run(ids: list[int]) -> tuple[list[int], list[list[float]]]:
+        limiter.acquire()
+        return ids, embed_batch_retry([docs[i] for i in ids])
+
+    t0 = time.perf_counter()
+    n_done = since_ckpt = 0
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as ex:
+        pending = set()
+        it = iter(batches)
+        try:
+            while True:
+                while len(pending) < max(1, concurrency):
+                    ids = next(it, None)
+                    if ids is None:
+                        break
+                    pending.add(ex.submit(run, ids))
+                if not pending:
+                    break
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for f in finished:
+                    ids, vecs = f.result()
+                    for i, v in zip(ids, vecs):
+                        done[hashes[i]] = np.asarray(v, dtype=np.float32)
+                    n_done += len(ids)
+                    since_ckpt += 1
+                rate = n_done / max(time.perf_counter() - t0, 1e-9)
+                print(f"[embed] {n_done}/{len(todo)} ({rate:.1f} topics/sec, {len(pending)} in flight)")
+                if since_ckpt >= checkpoint_every:
+                    _save_checkpoint(done)
+                    since_ckpt = 0
+        except BaseException:
+            for f in pending:
+                f.cancel()
+            if done:
+                _save_checkpoint(done)
+                print(f"[embed] checkpointed {len(done)} vectors to {EPART}")
+            raise
+
+    dt = time.perf_counter() - t0
+    if todo:
+        print(f"[embed] embedded {len(todo)} topics in {dt:.1f}s ({len(todo) / max(dt, 1e-9):.1f} topics/sec)")
+    return [done[h].tolist() for h in hashes]
+
+def describe_topic(t: dict) -> str:
+    return (
+        f"Topic: {t['topic']}\n"
+        f"First seen: {t['first_seen']}\n"
+        f"Last seen: {t['last_seen']}\n"
+        f"Days active: {t['days_seen']}\n"
+        f"Years active: {', '.join(t['years_active'])}\n"
+    )
+
+def content_hash(desc: str) -> str:
+    return hashlib.sha256(desc.encode("utf-8")).hexdigest()[:16]
+
+def _load_existing() -> tuple[np.ndarray | None, list[dict]]:
+    if not (EOUT.exists() and IOUT.exists()):
+        return None, []
+    E = np.load(EOUT)
+    idx = json.loads(IOUT.read_text(encoding="utf-8"))
+    if E.ndim != 2 or E.shape[0] != len(idx):
+        print(f"[embed] {EOUT} and {IOUT} disagree ({E.shape[0]} vs {len(idx)}); rebuilding")
+        return None, []
+    return E, idx
+
+def plan(topics: list[dict], old_idx: list[dict]) -> tuple[list[dict], list[str], list[int], list[int]]:
+    """
+    Work out the new index and which rows need (re-)embedding.
+    Existing topics keep their row; new topics are appended in summary order.
+    Returns (new_index, docs_to_embed, target_rows, kept_old_rows) where
+    kept_old_rows[i] is the old row to copy into new row i (-1 if none).
+    """
+    old_row = {e["topic"]: i for i, e in enumerate(old_idx)}
+    by_topic = {t["topic"]: t for t in topics}
+
+    # keep old order for topics still present, then append new ones
+    order = [e["topic"] for e in old_idx if e["topic"] in by_topic]
+    seen = set(order)
+    order += [t["topic"] for t in topics if t["topic"] not in seen]
+
+    index, docs, targets, kept = [], [], [], []
+    for row, name in enumerate(order):
+        t = by_topic[name]
+        desc = describe_topic(t)
+        h = content_hash(desc)
+        index.append({"topic": name, "first_seen": t["first_seen"], "last_seen": t["last_seen"], "days_seen": t["days_seen"], "hash": h})
+        i = old_row.get(name, -1)
+        kept.append(i)
+        if i < 0 or old_idx[i].get("hash") != h:
+            docs.append(desc)
+            targets.append(row)
+    return index, docs, targets, kept
+
+def embed_all(docs: list[str], batch_size: int = 128) -> list[list[float]]:
+    out = []
+    for i in range(0, len(docs), batch_size):
+        batch = docs[i:i+batch_size]
+        out.extend(embed_batch(batch))
+        print(f"[embed] {i+len(batch)}/{len(docs)}")
+        if i + batch_size < len(docs):
+            time.sleep(0.25)
+    return out
+
+def save(E_old: np.ndarray | None, index: list[dict], kept: list[int], targets: list[int], vecs: list[list[float]]) -> tuple[int, ...]:
+    """
+    Patch rows in place when the row layout is unchanged, otherwise rewrite.
+    """
+    same_layout = E_old is not None and kept == list(range(E_old.shape[0]))
+    new_vecs = np.asarray(vecs, dtype=np.float32).reshape(len(targets), -1) if targets else None
+    if same_layout:
+        E = np.lib.format.open_memmap(EOUT, mode="r+")
+        if new_vecs is not None:
+            E[targets] = new_vecs
+            E.flush()
+        shape = E.shape
+        del E
+    else:
+        dim = new_vecs.shape[1] if new_vecs is not None else E_old.shape[1]
+        E = np.zeros((len(index), dim), dtype=np.float32)
+        for row, i in enumerate(kept):
+            if i >= 0:
+                E[row] = E_old[i]
+        if new_vecs is not None:
+            E[targets] = new_vecs
+        EOUT.parent.mkdir(parents=True, exist_ok=True)
+        tmp = EOUT.with_suffix(".tmp.npy")
+        np.save(tmp, E)
+        tmp.replace(EOUT)
+        shape = E.shape
+    tmp = IOUT.with_suffix(".json.tmp")
+    tmp.write_text(json.dumps(index, ensure_ascii=False, indent=2), encoding="utf-8")
+    tmp.replace(IOUT)
+    return shape
+
+def main(full: bool = False, concurrency: int = 0, rps: float = 4.0, batch_size: int = 128, checkpoint_every: int = 8):
     if not API_KEY:
         print("❌ Set OPENROUTER_API_KEY in your environment.")
         return 2
@@ -30,34 +243,35 @@ def main():
         return 2
 
     topics = json.loads(IN.read_text(encoding="utf-8"))
-    docs, index = [], []
-    for t in topics:
-        desc = (
-            f"Topic: {t['topic']}\n"
-            f"First seen: {t['first_seen']}\n"
-            f"Last seen: {t['last_seen']}\n"
-            f"Days active: {t['days_seen']}\n"
-            f"Years active: {', '.join(t['years_active'])}\n"
-        )
-        docs.append(desc)
-        index.append({"topic": t["topic"], "first_seen": t["first_seen"], "last_seen": t["last_seen"], "days_seen": t["days_seen"]})
-
-    all_embs = []
-    for i in range(0, len(docs), 128):
-        batch = docs[i:i+128]
-        embs = embed_batch(batch)
-        all_embs.extend(embs)
-        print(f"[embed] {i+len(batch)}/{len(docs)}")
-        time.sleep(0.25)
+    E_old, old_idx = (None, []) if full else _load_existing()
+    index, docs, targets, kept = plan(topics, old_idx)
+    if not docs and len(index) == len(old_idx) and kept == list(range(len(old_idx))):
+        print(f"✅ {EOUT} already up to date ({len(index)} topics)")
+        return 0
+    print(f"[embed] {len(docs)} of {len(index)} topics changed")
 
-    arr = np.array(all_embs, dtype=np.float32)
-    EOUT.parent.mkdir(parents=True, exist_ok=True)
-    np.save(EOUT, arr)
-    IOUT.write_text(json.dumps(index, ensure_ascii=False, indent=2), encoding="utf-8")
+    if concurrency > 0:
+        doc_hashes = [content_hash(d) for d in docs]
+        vecs = embed_concurrent(docs, doc_hashes, concurrency=concurrency, rps=rps,
+                                batch_size=batch_size, checkpoint_every=checkpoint_every)
+    else:
+        vecs = embed_all(docs, batch_size=batch_size)
+    shape = save(E_old, index, kept, targets, vecs)
+    EPART.unlink(missing_ok=True)
+    IPART.unlink(missing_ok=True)
 
-    print(f"✅ Saved {EOUT} ({arr.shape})")
+    print(f"✅ Saved {EOUT} ({shape})")
     print(f"✅ Saved {IOUT} ({len(index)} topics)")
     return 0
 
 if __name__ == "__main__":
-    raise SystemExit(main())
+    import argparse
+    ap = argparse.ArgumentParser(description="Embed topic descriptions; only changed topics are re-embedded.")
+    ap.add_argument("--full", action="store_true", help="re-embed every topic")
+    ap.add_argument("--concurrency", type=int, default=0, help="batches in flight (0 = serial, no checkpoints)")
+    ap.add_argument("--rps", type=float, default=4.0, help="max batch requests per second in concurrent mode")
+    ap.add_argument("--batch-size", type=int, default=128)
+    ap.add_argument("--checkpoint-every", type=int, default=8, help="batches between checkpoints")
+    args = ap.parse_args()
+    sys.exit(main(full=args.full, concurrency=args.concurrency, rps=args.rps,
+                  batch_size=args.batch_size, checkpoint_every=args.checkpoint_every))
@@ -1,17 +1,40 @@
 # build_topic_summary_from_min.py
 from __future__ import annotations
-import csv, json
+import csv, io, json, hashlib, sys
 from pathlib import Path
 from collections import defaultdict
 
 IN = Path("data") / "trends_min_us.csv"
 OUT = Path("data") / "trends_topic_summary.json"
+# Remembers how much of IN the current summary covers, so appended days can be merged.
+STATE = Path("data") / "trends_topic_summary.state.json"
+
+
+def _prefix_hash(path: Path, n_bytes: int) -> str:
+    h = hashlib.sha256()
+    with path.open("rb") as f:
+        left = n_bytes
+        while left > 0:
+            chunk = f.read(min(1 << 20, left))
+            if not chunk:
+                break
+            h.update(chunk)
+            left -= len(chunk)
+    return h.hexdigest()
 
-def main():
-    if not IN.exists():
-        print(f"Missing {IN}")
-        return 2
 
+def _summary_entry(topic: str, ds: list[str]) -> dict:
+    return {
+        "topic": topic,
+        "first_seen": ds[0],
+        "last_seen": ds[-1],
+        "days_seen": len(ds),
+        "years_active": sorted({d[:4] for d in ds}),
+        "example_dates": ds[:3],
+    }
+
+
+def build_full() -> list[dict]:
     topic_dates = defaultdict(list)
     with IN.open("r", encoding="utf-8", newline="") as f:
         rdr = csv.DictReader(f)
@@ -21,22 +44,86 @@ def main():
             if d and t:
                 topic_dates[t].append(d)
 
-    summary = []
-    for topic, dates in topic_dates.items():
-        ds = sorted(set(dates))
-        summary.append({
-            "topic": topic,
-            "first_seen": ds[0],
-            "last_seen": ds[-1],
-            "days_seen": len(ds),
-            "years_active": sorted({d[:4] for d in ds}),
-            "example_dates": ds[:3],
-        })
+    return [_summary_entry(topic, sorted(set(dates))) for topic, dates in topic_dates.items()]
+
+
+def _read_new_rows(offset: int) -> list[tuple[str, str]]:
+    """(date, topic) pairs from the bytes of IN after `offset`."""
+    with IN.open("rb") as fb:
+        header = fb.readline().decode("utf-8").strip("\r\n")
+        fb.seek(offset)
+        text = io.TextIOWrapper(fb, encoding="utf-8", newline="")
+        rdr = csv.DictReader(text, fieldnames=next(csv.reader([header])))
+        out = []
+        for row in rdr:
+            d = (row.get("date") or "").strip()
+            t = (row.get("topic") or "").strip()
+            if d and t:
+                out.append((d, t))
+        return out
+
+
+def merge_rows(summary: list[dict], rows: list[tuple[str, str]]) -> bool:
+    """
+    Merge appended (date, topic) rows into summary in place.
+    Returns False if a row lands inside a topic's existing span, since the
+    summary alone can't tell whether that day was already counted.
+    """
+    by_topic = {s["topic"]: s for s in summary}
+    for d, t in rows:
+        s = by_topic.get(t)
+        if s is None:
+            s = _summary_entry(t, [d])
+            summary.append(s)
+            by_topic[t] = s
+        elif d > s["last_seen"]:
+            s["last_seen"] = d
+            s["days_seen"] += 1
+            if d[:4] not in s["years_active"]:
+                s["years_active"] = sorted(s["years_active"] + [d[:4]])
+            if len(s["example_dates"]) < 3:
+                s["example_dates"].append(d)
+        elif d != s["last_seen"]:
+            return False
+    return True
+
+
+def main(full: bool = False):
+    if not IN.exists():
+        print(f"Missing {IN}")
+        return 2
+
+    size = IN.stat().st_size
+    state = json.loads(STATE.read_text(encoding="utf-8")) if STATE.exists() else {}
+    summary = None
+    mode = "full"
+    if not full and OUT.exists() and state.get("source") == str(IN):
+        done = int(state.get("bytes", 0))
+        same_prefix = 0 < done <= size and _prefix_hash(IN, done) == state.get("prefix_sha256")
+        if same_prefix and done == size:
+            print(f"✅ {OUT} already up to date")
+            return 0
+        if same_prefix:
+            summary = json.loads(OUT.read_text(encoding="utf-8"))
+            new_rows = _read_new_rows(done)
+            if merge_rows(summary, new_rows):
+                mode = f"incremental (+{len(new_rows)} rows)"
+            else:
+                print("[summary] appended rows overlap existing spans; rebuilding")
+                summary = None
+
+    if summary is None:
+        summary = build_full()
 
     OUT.parent.mkdir(parents=True, exist_ok=True)
     OUT.write_text(json.dumps(summary, ensure_ascii=False, indent=2), encoding="utf-8")
-    print(f"✅ Wrote {OUT} ({len(summary)} unique topics)")
+    STATE.write_text(json.dumps({"source": str(IN), "bytes": size, "prefix_sha256": _prefix_hash(IN, size)}), encoding="utf-8")
+    print(f"✅ Wrote {OUT} ({len(summary)} unique topics, {mode})")
     return 0
 
 if __name__ == "__main__":
-    raise SystemExit(main())
+    import argparse
+    ap = argparse.ArgumentParser(description="Build/refresh the per-topic summary from trends_min_us.csv.")
+    ap.add_argument("--full", action="store_true", help="ignore saved state and rebuild from scratch")
+    args = ap.parse_args()
+    sys.exit(main(full=args.full))
@@ -0,0 +1,392 @@
+# cache.py
+"""
+Caches for the API layer.
+
+- EMBEDDINGS   normalised query text -> query embedding
+- RETRIEVAL    (query, window, k)    -> ingredients
+- GENERATIONS  (query, mode, window, k) -> /brew answer
+
+Backends (TEATIME_CACHE_BACKEND, or TEATIME_CACHE_<NAME>_BACKEND per cache):
+
+- memory  thread-safe LRU in this process (default)
+- sqlite  one WAL-mode file (TEATIME_CACHE_PATH, default data/cache.sqlite)
+          shared by every worker on the host
+- redis   any RESP server at TEATIME_CACHE_URL (redis://host:port/db);
+          resp_stub.py is a local stand-in for tests and benchmarks
+
+All of them take a per-entry TTL and evict least-recently-used entries past
+TEATIME_CACHE_<NAME>_ITEMS or TEATIME_CACHE_<NAME>_MB (value bytes, as
+encoded). For redis the item/byte budget is the server's maxmemory policy;
+the client only refuses values over the byte budget. Shared backends store
+values as JSON, or raw bytes plus dtype/shape for numpy arrays, never pickle.
+A broken cache backend counts as a miss and is reported as a
+teatime_upstream_errors_total{op="cache"}; it never fails a request. Lookups
+are counted in teatime_cache_requests_total / teatime_cache_hit_ratio.
+"""
+from __future__ import annotations
+import hashlib, json, logging, os, re, socket, sqlite3, struct, threading, time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Hashable, List, Optional, Tuple
+from urllib.parse import urlparse
+
+import numpy as np
+
+import metrics
+
+log = logging.getLogger("teatime.cache")
+
+_MISSING = object()
+_ws_re = re.compile(r"\s+")
+
+BACKEND = os.getenv("TEATIME_CACHE_BACKEND", "memory").lower()
+CACHE_PATH = Path(os.getenv("TEATIME_CACHE_PATH", "data/cache.sqlite"))
+CACHE_URL = os.getenv("TEATIME_CACHE_URL", "redis://127.0.0.1:6379/0")
+
+
+def normalize_query(q: str) -> str:
+    """Case/whitespace-insensitive form of a prompt, used for cache keys and the query log."""
+    return _ws_re.sub(" ", (q or "").strip().lower())
+
+
+def make_key(*parts: Any) -> str:
+    return hashlib.sha1(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+# -----------------------------------------------------------------------------
+# Value codec for shared backends
+# -----------------------------------------------------------------------------
+
+def encode(value: Any) -> bytes:
+    if isinstance(value, np.ndarray):
+        head = json.dumps({"dtype": value.dtype.str, "shape": value.shape}).encode("utf-8")
+        return b"N" + struct.pack("<I", len(head)) + head + np.ascontiguousarray(value).tobytes()
+    return b"J" + json.dumps(value, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def decode(blob: bytes) -> Any:
+    tag, body = blob[:1], blob[1:]
+    if tag == b"N":
+        (n,) = struct.unpack("<I", body[:4])
+        head = json.loads(body[4:4 + n])
+        return np.frombuffer(body[4 + n:], dtype=np.dtype(head["dtype"])).reshape(head["shape"]).copy()
+    if tag == b"J":
+        return json.loads(body)
+    raise ValueError(f"unknown cache value tag {tag!r}")
+
+
+def sizeof(value: Any) -> int:
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (bytes, str)):
+        return len(value)
+    return len(encode(value))
+
+
+# -----------------------------------------------------------------------------
+# Backends
+# -----------------------------------------------------------------------------
+
+class Cache:
+    """get/set/in/len/clear with hit accounting; backends implement _load/_store/_count/_clear."""
+
+    backend = "none"
+
+    def __init__(self, name: str, max_items: int = 1024, ttl: Optional[float] = None, max_bytes: Optional[int] = None):
+        self.name, self.max_items, self.ttl, self.max_bytes = name, max_items, ttl, max_bytes
+        self._warned = False
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        item = self._safe(self._load, key, default=_MISSING)
+        metrics.cache_event(self.name, item is not _MISSING)
+        return default if item is _MISSING else item
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        if self.max_items <= 0:
+            return
+        self._safe(self._store, key, value, ttl or None)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self._safe(self._load, key, default=_MISSING) is not _MISSING
+
+    def __len__(self) -> int:
+        return self._safe(self._count, default=0)
+
+    def clear(self):
+        self._safe(self._clear)
+
+    def _safe(self, fn, *args, default: Any = None):
+        try:
+            return fn(*args)
+        except (OSError, sqlite3.Error, RespError, ValueError) as ex:
+            metrics.upstream_error("cache", self.backend)
+            if not self._warned:
+                self._warned = True
+                log.warning("%s cache %r unavailable (%s); treating as a miss", self.backend, self.name, ex)
+            return default
+
+    def _load(self, key: Hashable) -> Any: raise NotImplementedError
+    def _store(self, key: Hashable, value: Any, ttl: Optional[float]): raise NotImplementedError
+    def _count(self) -> int: raise NotImplementedError
+    def _clear(self): raise NotImplementedError
+
+
+class LRUCache(Cache):
+    backend = "memory"
+
+    def __init__(self, name: str, max_items: int = 1024, ttl: Optional[float] = None, max_bytes: Optional[int] = None):
+        super().__init__(name, max_items, ttl, max_bytes)
+        self._data: "OrderedDict[Hashable, Tuple[float, int, Any]]" = OrderedDict()  # key -> (expires_at, size, value)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def _load(self, key: Hashable) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return _MISSING
+            if item[0] < now:
+                self._bytes -= self._data.pop(key)[1]
+                return _MISSING
+            self._data.move_to_end(key)
+            return item[2]
+
+    def _store(self, key: Hashable, value: Any, ttl: Optional[float]):
+        size = sizeof(value) if self.max_bytes else 0
+        if self.max_bytes and size > self.max_bytes:
+            return
+        expires = time.monotonic() + ttl if ttl else float("inf")
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._data[key] = (expires, size, value)
+            self._bytes += size
+            while len(self._data) > self.max_items or (self.max_bytes and self._bytes > self.max_bytes):
+                self._bytes -= self._data.popitem(last=False)[1][1]
+
+    def _count(self) -> int:
+        return len(self._data)
+
+    def _clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+
+class SqliteCache(Cache):
+    """
+    One table shared by all caches (namespaced by name) in a WAL-mode file, so
+    every worker process on the host sees the same entries. A read bumps the
+    entry's access time (LRU); a write evicts expired entries, then the least
+    recently used ones past max_items / max_bytes.
+    """
+
+    backend = "sqlite"
+
+    def __init__(self, name: str, max_items: int = 1024, ttl: Optional[float] = None, max_bytes: Optional[int] = None,
+                 path: Path = CACHE_PATH):
+        super().__init__(name, max_items, ttl, max_bytes)
+        self.path = Path(path)
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        c = getattr(self._local, "conn", None)
+        if c is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            c = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            c.execute("PRAGMA journal_mode=WAL")
+            c.execute("PRAGMA synchronous=NORMAL")
+            c.execute("""CREATE TABLE IF NOT EXISTS cache (
+                ns TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL, size INTEGER NOT NULL,
+                expires REAL NOT NULL, atime REAL NOT NULL, PRIMARY KEY (ns, key)) WITHOUT ROWID""")
+            c.execute("CREATE INDEX IF NOT EXISTS cache_lru ON cache (ns, atime)")
+            self._local.conn = c
+        return c
+
+    def _load(self, key: Hashable) -> Any:
+        c = self._conn()
+        now = time.time()
+        row = c.execute("SELECT value, expires FROM cache WHERE ns = ? AND key = ?", (self.name, str(key))).fetchone()
+        if row is None or row[1] < now:
+            return _MISSING
+        c.execute("UPDATE cache SET atime = ? WHERE ns = ? AND key = ?", (now, self.name, str(key)))
+        return decode(row[0])
+
+    def _store(self, key: Hashable, value: Any, ttl: Optional[float]):
+        blob = encode(value)
+        if self.max_bytes and len(blob) > self.max_bytes:
+            return
+        now = time.time()
+        expires = now + ttl if ttl else float("inf")
+        c = self._conn()
+        with c:  # one transaction: insert + evict
+            c.execute("BEGIN IMMEDIATE")
+            c.execute("INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?, ?)",
+                      (self.name, str(key), blob, len(blob), expires, now))
+            c.execute("DELETE FROM cache WHERE ns = ? AND expires < ?", (self.name, now))
+            n, total = c.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache WHERE ns = ?", (self.name,)).fetchone()
+            if n > self.max_items or (self.max_bytes and total > self.max_bytes):
+                drop, freed = 0, 0
+                for (size,) in c.execute("SELECT size FROM cache WHERE ns = ? ORDER BY atime", (self.name,)):
+                    if n - drop <= self.max_items and (not self.max_bytes or total - freed <= self.max_bytes):
+                        break
+                    drop += 1
+                    freed += size
+                c.execute("DELETE FROM cache WHERE ns = ? AND key IN "
+                          "(SELECT key FROM cache WHERE ns = ? ORDER BY atime LIMIT ?)", (self.name, self.name, drop))
+
+    def _count(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM cache WHERE ns = ? AND expires >= ?",
+                                    (self.name, time.time())).fetchone()[0]
+
+    def _clear(self):
+        self._conn().execute("DELETE FROM cache WHERE ns = ?", (self.name,))
+
+
+class RespError(Exception):
+    pass
+
+
+class RespClient:
+    """Minimal RESP2 client (one socket per thread) for the handful of commands the cache needs."""
+
+    def __init__(self, url: str = CACHE_URL, timeout: float = 0.5):
+        u = urlparse(url)
+        self.host, self.port = u.hostname or "127.0.0.1", u.port or 6379
+        self.db = int((u.path or "/0").lstrip("/") or 0)
+        self.password = u.password
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _sock(self):
+        s = getattr(self._local, "sock", None)
+        if s is None:
+            s = socket.create_connection((self.host, self.port), timeout=self.timeout)
+            s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._local.sock, self._local.rfile = s, s.makefile("rb")
+            if self.password:
+                self._roundtrip(("AUTH", self.password))
+            if self.db:
+                self._roundtrip(("SELECT", str(self.db)))
+        return s
+
+    def execute(self, *args: Any) -> Any:
+        try:
+            self._sock()
+            return self._roundtrip(args)
+        except (OSError, RespError):
+            self.close()  # drop the connection; the next call reconnects
+            raise
+
+    def _roundtrip(self, args) -> Any:
+        out = [b"*%d\r\n" % len(args)]
+        for a in args:
+            b = a if isinstance(a, bytes) else str(a).encode("utf-8")
+            out.append(b"$%d\r\n%s\r\n" % (len(b), b))
+        self._local.sock.sendall(b"".join(out))
+        return self._read()
+
+    def _read(self) -> Any:
+        line = self._local.rfile.readline()
+        if not line:
+            raise RespError("connection closed")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode()
+        if kind == b"-":
+            raise RespError(rest.decode())
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            n = int(rest)
+            if n < 0:
+                return None
+            data = self._local.rfile.read(n + 2)
+            return data[:-2]
+        if kind == b"*":
+            n = int(rest)
+            return None if n < 0 else [self._read() for _ in range(n)]
+        raise RespError(f"bad reply {line!r}")
+
+    def close(self):
+        s = getattr(self._local, "sock", None)
+        if s is not None:
+            try:
+                s.close()
+            except OSError:
+                pass
+        self._local.sock = self._local.rfile = None
+
+
+class RedisCache(Cache):
+    """Keys are teatime:<name>:<key>; TTL via SET PX. Eviction is the server's maxmemory LRU policy."""
+
+    backend = "redis"
+
+    def __init__(self, name: str, max_items: int = 1024, ttl: Optional[float] = None, max_bytes: Optional[int] = None,
+                 client: Optional[RespClient] = None):
+        super().__init__(name, max_items, ttl, max_bytes)
+        self.client = client or RespClient()
+        self.prefix = f"teatime:{name}:"
+
+    def _load(self, key: Hashable) -> Any:
+        blob = self.client.execute("GET", self.prefix + str(key))
+        return _MISSING if blob is None else decode(blob)
+
+    def _store(self, key: Hashable, value: Any, ttl: Optional[float]):
+        blob = encode(value)
+        if self.max_bytes and len(blob) > self.max_bytes:
+            return
+        args: List[Any] = ["SET", self.prefix + str(key), blob]
+        if ttl:
+            args += ["PX", int(ttl * 1000)]
+        self.client.execute(*args)
+
+    def _keys(self) -> List[bytes]:
+        keys, cursor = [], "0"
+        while True:
+            cursor, batch = self.client.execute("SCAN", cursor, "MATCH", self.prefix + "*", "COUNT", 1000)
+            keys += batch
+            cursor = cursor.decode() if isinstance(cursor, bytes) else cursor
+            if cursor == "0":
+                return keys
+
+    def _count(self) -> int:
+        return len(self._keys())
+
+    def _clear(self):
+        keys = self._keys()
+        for i in range(0, len(keys), 500):
+            self.client.execute("DEL", *keys[i:i + 500])
+
+
+def make_cache(name: str, max_items: int, ttl: Optional[float], max_bytes: Optional[int] = None,
+               backend: Optional[str] = None) -> Cache:
+    backend = (backend or BACKEND).lower()
+    if backend == "memory":
+        return LRUCache(name, max_items, ttl, max_bytes)
+    if backend == "sqlite":
+        return SqliteCache(name, max_items, ttl, max_bytes)
+    if backend == "redis":
+        return RedisCache(name, max_items, ttl, max_bytes)
+    raise ValueError(f"unknown cache backend {backend!r} (memory, sqlite, redis)")
+
+
+def _env_cache(name: str, items: int, ttl: float, mb: float) -> Cache:
+    up = name.upper()
+    mb = float(os.getenv(f"TEATIME_CACHE_{up}_MB", str(mb)))
+    return make_cache(
+        name,
+        max_items=int(os.getenv(f"TEATIME_CACHE_{up}_ITEMS", str(items))),
+        ttl=float(os.getenv(f"TEATIME_CACHE_{up}_TTL_S", str(ttl))),
+        max_bytes=int(mb * 1024 * 1024) if mb > 0 else None,
+        backend=os.getenv(f"TEATIME_CACHE_{up}_BACKEND"),
+    )
+
+
+EMBEDDINGS = _env_cache("embed", 4096, 24 * 3600, 64)
+RETRIEVAL = _env_cache("retrieval", 2048, 3600, 32)
+GENERATIONS = _env_cache("generation", 1024, 3600, 32)
@@ -0,0 +1,104 @@
+# engine.py
+"""
+The one retrieval engine a process serves from.
+
+Engine bundles the TrendRetriever (rows or trends.sqlite, topic stats,
+embeddings, rollups) with the relevance index server.py ranks /api/predict
+candidates with, so app.py and server.py no longer each load their own copy.
+
+get_engine() builds it once per process. The FastAPI apps load it in their
+lifespan and hand it to routes with `Depends(engine.current)`; scripts
+(batch_brew, bench, retriever.get_retriever) call get_engine() directly and
+get the same object. Under serve.py every worker attaches to one shared
+read-only snapshot (snapshot.py) instead of loading its own copy.
+"""
+from __future__ import annotations
+import logging, os, random, threading, time
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from fastapi import Request
+
+import executor
+import relevance
+from retriever import TrendRetriever
+
+log = logging.getLogger("teatime.engine")
+
+
+class Engine:
+    def __init__(self, retriever: Optional[TrendRetriever] = None):
+        t0 = time.perf_counter()
+        self.R = retriever if retriever is not None else TrendRetriever()
+        self.load_s = time.perf_counter() - t0
+
+    @property
+    def relevance(self) -> relevance.TopicIndex:
+        """Token index over every corpus topic (shared with keyword search), built on first use."""
+        return self.R.topic_index
+
+    def sample_trends(self, start: Optional[str], end: Optional[str], limit: int = 30,
+                      rng: Optional[random.Random] = None) -> List[Dict[str, Any]]:
+        """Up to `limit` rows in [start, end], half rank 1 and half the rest, shuffled for variety."""
+        rng = rng or random
+        half = limit // 2
+        cols = self.R.rows
+        if cols is None:  # sqlite store
+            rank1, others = [], []
+            for r in self.R.rows_in_window(start, end):
+                (rank1 if str(r["rank"]) == "1" else others).append(r)
+            picked = rng.sample(rank1, min(half, len(rank1))) + rng.sample(others, min(half, len(others)))
+        else:
+            lo, hi = cols.span(start, end)
+            is1 = np.asarray(cols.ranks[lo:hi]) == 1
+            rank1, others = np.flatnonzero(is1) + lo, np.flatnonzero(~is1) + lo
+            idx = ([int(rank1[j]) for j in rng.sample(range(len(rank1)), min(half, len(rank1)))] +
+                   [int(others[j]) for j in rng.sample(range(len(others)), min(half, len(others)))])
+            picked = [cols.row(i) for i in idx]
+        rng.shuffle(picked)
+        return [{"date": r["date"], "rank": str(r["rank"]), "topic": r["topic"], "year": r["date"][:4]}
+                for r in picked[:limit]]
+
+    def info(self) -> Dict[str, Any]:
+        return {"topics": self.R.n_topics, "has_embeddings": self.R.emb is not None,
+                "store": "sqlite" if self.R.db is not None else "memory",
+                "snapshot": os.getenv("TEATIME_SNAPSHOT") or None, "pid": os.getpid(), "load_s": round(self.load_s, 3)}
+
+
+_engine: Optional[Engine] = None
+_engine_lock = threading.Lock()
+
+
+def get_engine() -> Engine:
+    """The process engine; with TEATIME_SNAPSHOT set it attaches to that snapshot (serve.py) instead of loading the files."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                snap = os.getenv("TEATIME_SNAPSHOT")
+                _engine = Engine(TrendRetriever.from_snapshot(Path(snap)) if snap else None)
+    return _engine
+
+
+def set_engine(e: Optional[Engine]) -> Optional[Engine]:
+    """Swap the process engine (bench, a reload); returns the previous one."""
+    global _engine
+    with _engine_lock:
+        prev, _engine = _engine, e
+    return prev
+
+
+def current(request: Request) -> Engine:
+    """FastAPI dependency: the engine the app loaded at startup."""
+    e = getattr(request.app.state, "engine", None)
+    return e if e is not None else get_engine()
+
+
+@asynccontextmanager
+async def lifespan(app):
+    executor.configure_sync_threads()
+    app.state.engine = get_engine()
+    log.info("engine: %s", app.state.engine.info())
+    yield
@@ -0,0 +1,87 @@
+# executor.py
+"""
+Keeps blocking work off the event loop in async endpoints.
+
+- await run_cpu(fn, *args)  retrieval / ranking / prompt assembly on a bounded
+                            thread pool (TEATIME_CPU_WORKERS, default 4)
+- await run_io(fn, *args)   blocking upstream calls (requests / llm_client.chat)
+                            on their own pool (TEATIME_IO_WORKERS, default 32),
+                            so slow LLM calls cannot starve retrieval threads
+
+Threads rather than processes: the engine is this process's memory (or its
+snapshot maps), and a process pool would have to pickle candidate lists both
+ways for sub-millisecond work. The request context is copied into the worker,
+so metrics spans still land in the request's Server-Timing; time spent
+queued for a pool shows up as the "<pool>_wait" stage.
+
+Sync `def` endpoints already run on anyio's thread pool; TEATIME_SYNC_THREADS
+sizes it (anyio default 40). TEATIME_OFFLOAD=0 runs everything inline on the
+loop (the old behaviour; loadtest.py uses it as the baseline).
+"""
+from __future__ import annotations
+import asyncio, contextvars, functools, os, threading, time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, TypeVar
+
+import metrics
+
+CPU_WORKERS = int(os.getenv("TEATIME_CPU_WORKERS", "4"))
+IO_WORKERS = int(os.getenv("TEATIME_IO_WORKERS", "32"))
+SYNC_THREADS = int(os.getenv("TEATIME_SYNC_THREADS", "0"))
+OFFLOAD = os.getenv("TEATIME_OFFLOAD", "1").lower() not in ("0", "false", "no")
+
+T = TypeVar("T")
+
+
+class Pool:
+    def __init__(self, name: str, workers: int):
+        self.name = name
+        self._ex = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix=f"teatime-{name}")
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        metrics.register_gauge(f"teatime_{name}_pool_queued", f"Calls waiting for a {name} pool thread.", lambda: self.queued)
+        metrics.register_gauge(f"teatime_{name}_pool_running", f"Calls running on the {name} pool.", lambda: self.running)
+
+    def _call(self, submitted: float, fn: Callable[..., T]) -> T:
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+        try:
+            metrics.STAGE_SECONDS.observe(time.perf_counter() - submitted, stage=f"{self.name}_wait")
+            return fn()
+        finally:
+            with self._lock:
+                self.running -= 1
+
+    async def run(self, fn: Callable[..., T], *args: Any, **kw: Any) -> T:
+        call = functools.partial(fn, *args, **kw)
+        if not OFFLOAD:
+            return call()
+        ctx = contextvars.copy_context()
+        with self._lock:
+            self.queued += 1
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._ex, ctx.run, self._call, time.perf_counter(), call)
+
+    def stats(self) -> Dict[str, int]:
+        return {"queued": self.queued, "running": self.running}
+
+
+CPU = Pool("cpu", CPU_WORKERS)
+IO = Pool("io", IO_WORKERS)
+
+
+async def run_cpu(fn: Callable[..., T], *args: Any, **kw: Any) -> T:
+    return await CPU.run(fn, *args, **kw)
+
+
+async def run_io(fn: Callable[..., T], *args: Any, **kw: Any) -> T:
+    return await IO.run(fn, *args, **kw)
+
+
+def configure_sync_threads():
+    """Apply TEATIME_SYNC_THREADS to anyio's pool for sync endpoints (call from a lifespan)."""
+    if SYNC_THREADS > 0:
+        import anyio.to_thread
+        anyio.to_thread.current_default_thread_limiter().total_tokens = SYNC_THREADS
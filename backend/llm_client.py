@@ -1,37 +1,260 @@
 # llm_client.py
+"""
+OpenRouter calls (embeddings + chat).
+
+chat() walks CHAT_MODEL then TEATIME_BACKUP_MODELS, skipping models whose
+circuit breaker is open, and fails over to the next one on error. With
+TEATIME_HEDGE=1 it also fires a second request when the first has not
+answered within the model's recent p95 latency and takes whichever comes
+back first. requests cannot abort a call already on the wire, so the loser
+is abandoned: its result is dropped and its worker frees up when it ends.
+
+chat_with_usage() also returns the call's token usage (provider-reported,
+else counted locally by prompts.py) and records it on
+teatime_llm_tokens_total and the request's X-Teatime-Tokens header. With
+TEATIME_PROMPT_CACHE_CONTROL=1 the system message carries a cache_control
+breakpoint for providers that only cache prompts on request (Anthropic,
+Gemini via OpenRouter); OpenAI models cache long prefixes automatically.
+"""
 from __future__ import annotations
-import os, requests, json
+import os, requests, json, threading, time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Iterator, Optional, Tuple
+
+import metrics
+import prompts
 
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY", "")
 CHAT_MODEL = os.getenv("TEATIME_MODEL", "openai/gpt-4o")
 EMBED_MODEL = os.getenv("TEATIME_EMBED_MODEL", "openai/text-embedding-3-small")
+# Override to point at a local stand-in (see stub_upstream.py)
+BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1").rstrip("/")
+
+# seconds; callers with a deadline pass a smaller timeout
+DEFAULT_TIMEOUT = 60
+
+BACKUP_MODELS = [m.strip() for m in os.getenv("TEATIME_BACKUP_MODELS", "").split(",") if m.strip()]
+HEDGE = os.getenv("TEATIME_HEDGE", "0").lower() in ("1", "true", "yes")
+HEDGE_PERCENTILE = float(os.getenv("TEATIME_HEDGE_PERCENTILE", "95"))
+# used until a model has HEDGE_MIN_SAMPLES successful calls on record
+HEDGE_DELAY_S = float(os.getenv("TEATIME_HEDGE_DELAY_MS", "2000")) / 1000.0
+HEDGE_MIN_DELAY_S = float(os.getenv("TEATIME_HEDGE_MIN_DELAY_MS", "250")) / 1000.0
+HEDGE_MIN_SAMPLES = 20
+BREAKER_FAILURES = int(os.getenv("TEATIME_BREAKER_FAILURES", "5"))
+BREAKER_COOLDOWN_S = float(os.getenv("TEATIME_BREAKER_COOLDOWN_S", "30"))
+PROMPT_CACHE_CONTROL = os.getenv("TEATIME_PROMPT_CACHE_CONTROL", "0").lower() in ("1", "true", "yes")
 
 HEADERS = {
     "Authorization": f"Bearer {OPENROUTER_API_KEY}",
     "Content-Type": "application/json",
 }
 
-def embed_texts(texts: list[str]) -> list[list[float]]:
+# one keep-alive pool per process instead of a new TLS handshake per call
+_session = requests.Session()
+_session.mount("https://", requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=32))
+_session.mount("http://", requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=32))
+
+def _post(op: str, url: str, timeout: float | None = None, **kw) -> dict:
+    """POST and return JSON, counting failures in teatime_upstream_errors_total."""
+    if timeout is not None and timeout <= 0:
+        raise requests.Timeout(f"{op}: no time left before the deadline")  # not sent, not an upstream error
+    try:
+        r = _session.post(url, headers=HEADERS, timeout=DEFAULT_TIMEOUT if timeout is None else timeout, **kw)
+        r.raise_for_status()
+        return r.json()
+    except requests.HTTPError as ex:
+        metrics.upstream_error(op, ex.response.status_code if ex.response is not None else "http")
+        raise
+    except requests.Timeout:
+        metrics.upstream_error(op, "timeout")
+        raise
+    except Exception:
+        metrics.upstream_error(op, "error")
+        raise
+
+def embed_texts(texts: list[str], timeout: float | None = None) -> list[list[float]]:
     if not OPENROUTER_API_KEY:
         raise RuntimeError("OPENROUTER_API_KEY not set")
     payload = {"model": EMBED_MODEL, "input": texts}
-    r = requests.post("https://openrouter.ai/api/v1/embeddings", headers=HEADERS, json=payload, timeout=60)
-    r.raise_for_status()
-    data = r.json()
+    data = _post("embed", f"{BASE_URL}/embeddings", timeout=timeout, json=payload)
     return [d["embedding"] for d in data["data"]]
 
-def chat(system: str, user: str, max_tokens: int = 320) -> str:
+class CircuitOpen(RuntimeError):
+    pass
+
+
+class CircuitBreaker:
+    """
+    closed -> open after `failures` consecutive upstream failures; after
+    `cooldown` seconds one trial call is let through (half-open), which
+    closes the breaker on success or re-opens it on failure.
+    """
+
+    def __init__(self, model: str, failures: int = BREAKER_FAILURES, cooldown: float = BREAKER_COOLDOWN_S):
+        self.model, self.max_failures, self.cooldown = model, failures, cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "open" if time.monotonic() - self.opened_at < self.cooldown else "half_open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.cooldown or self._trial:
+                return False
+            self._trial = True
+            return True
+
+    def success(self):
+        with self._lock:
+            self.failures, self.opened_at, self._trial = 0, None, False
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial = False
+            if self.opened_at is not None or self.failures >= self.max_failures:
+                if self.opened_at is None:
+                    metrics.llm_event("breaker_open", self.model)
+                self.opened_at = time.monotonic()
+
+
+class LatencyWindow:
+    """Recent successful call latencies for one model, for the hedge delay."""
+
+    def __init__(self, size: int = 200):
+        self._lat: deque = deque(maxlen=size)
+
+    def add(self, seconds: float):
+        self._lat.append(seconds)
+
+    def hedge_delay(self) -> float:
+        lat = sorted(self._lat)
+        if len(lat) < HEDGE_MIN_SAMPLES:
+            return HEDGE_DELAY_S
+        i = min(len(lat) - 1, int(len(lat) * HEDGE_PERCENTILE / 100.0))
+        return max(HEDGE_MIN_DELAY_S, lat[i])
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_latency: Dict[str, LatencyWindow] = {}
+_state_lock = threading.Lock()
+_chat_pool = ThreadPoolExecutor(max_workers=int(os.getenv("TEATIME_LLM_WORKERS", "16")), thread_name_prefix="teatime-llm")
+
+
+metrics.register_gauge("teatime_llm_breakers_open", "Chat models whose circuit breaker is open or half-open.",
+                       lambda: sum(b.state != "closed" for b in list(_breakers.values())))
+
+
+def breaker(model: str) -> CircuitBreaker:
+    with _state_lock:
+        if model not in _breakers:
+            _breakers[model] = CircuitBreaker(model)
+            _latency[model] = LatencyWindow()
+        return _breakers[model]
+
+
+def _trips_breaker(ex: Exception) -> bool:
+    """Upstream trouble (timeouts, 429/5xx, dropped connections), not our own bad request."""
+    if isinstance(ex, requests.HTTPError):
+        code = ex.response.status_code if ex.response is not None else 500
+        return code == 429 or code >= 500
+    return isinstance(ex, (requests.Timeout, requests.ConnectionError))
+
+
+def _chat_once(model: str, payload: dict, timeout: float) -> Tuple[str, Optional[dict], str]:
+    b = breaker(model)
+    t0 = time.monotonic()
+    try:
+        j = _post("chat", f"{BASE_URL}/chat/completions", timeout=timeout, data=json.dumps({**payload, "model": model}))
+        text = j["choices"][0]["message"]["content"].strip()
+    except Exception as ex:
+        if _trips_breaker(ex):
+            b.failure()
+        else:
+            b.success()  # the model answered; the request itself was bad
+        raise
+    b.success()
+    _latency[model].add(time.monotonic() - t0)
+    return text, j.get("usage"), model
+
+
+def _candidates() -> Iterator[str]:
+    """Models in preference order whose breaker lets a call through (checked lazily)."""
+    for m in dict.fromkeys([CHAT_MODEL] + BACKUP_MODELS):
+        if breaker(m).allow():
+            yield m
+
+
+def chat(system: str, user: str, max_tokens: int = 320, timeout: float | None = None, hedge: Optional[bool] = None) -> str:
+    return chat_with_usage(system, user, max_tokens, timeout, hedge)[0]
+
+
+def chat_with_usage(system: str, user: str, max_tokens: int = 320, timeout: float | None = None,
+                    hedge: Optional[bool] = None) -> Tuple[str, dict]:
+    """chat() plus {prompt_tokens, completion_tokens, cached_tokens, source, model}."""
     if not OPENROUTER_API_KEY:
         raise RuntimeError("OPENROUTER_API_KEY not set")
+    sys_content = [{"type": "text", "text": system, "cache_control": {"type": "ephemeral"}}] if PROMPT_CACHE_CONTROL else system
     payload = {
-        "model": CHAT_MODEL,
         "messages": [
-            {"role": "system", "content": system},
+            {"role": "system", "content": sys_content},
             {"role": "user", "content": user},
         ],
         "max_tokens": max_tokens,
     }
-    r = requests.post("https://openrouter.ai/api/v1/chat/completions", headers=HEADERS, data=json.dumps(payload), timeout=60)
-    r.raise_for_status()
-    j = r.json()
-    return j["choices"][0]["message"]["content"].strip()
+    hedge = HEDGE if hedge is None else hedge
+    timeout = DEFAULT_TIMEOUT if timeout is None else timeout
+    if timeout <= 0:
+        raise requests.Timeout("chat: no time left before the deadline")
+    deadline = time.monotonic() + timeout
+    models = _candidates()
+    first = next(models, None)
+    if first is None:
+        metrics.llm_event("all_open", CHAT_MODEL)
+        raise CircuitOpen("every chat model's circuit breaker is open")
+
+    pending = {_chat_pool.submit(_chat_once, first, payload, deadline - time.monotonic()): first}
+    hedge_at = time.monotonic() + _latency[first].hedge_delay() if hedge else float("inf")
+    hedged = not hedge
+    last: Optional[Exception] = None
+    while pending:
+        now = time.monotonic()
+        if now >= deadline:
+            break
+        wake = deadline if hedged else min(hedge_at, deadline)
+        done, _ = wait(pending, timeout=max(0.0, wake - now), return_when=FIRST_COMPLETED)
+        for f in done:
+            pending.pop(f)
+            try:
+                text, reported, model = f.result()
+            except Exception as ex:
+                last = ex
+                continue
+            for other in pending:
+                other.cancel()
+            usage = {**prompts.usage(system, user, text, reported), "model": model}
+            metrics.llm_tokens(usage)
+            return text, usage
+        fire_hedge = not hedged and time.monotonic() >= hedge_at
+        if not pending or fire_hedge:
+            # failover after an error, or hedge a slow call (same model if no backup is available)
+            hedged = hedged or fire_hedge
+            m = next(models, None) or (first if fire_hedge and breaker(first).state == "closed" else None)
+            if m is None:
+                continue
+            metrics.llm_event("hedge" if fire_hedge else "failover", m)
+            remaining = deadline - time.monotonic()
+            if remaining > 0:
+                pending[_chat_pool.submit(_chat_once, m, payload, remaining)] = m
+    if last is not None and not pending:
+        raise last
+    raise requests.Timeout(f"chat did not answer within {timeout:.1f}s")
@@ -0,0 +1,127 @@
+# loadtest.py
+"""
+Closed-loop load test: throughput and latency vs concurrency.
+
+Starts the stub upstream (fixed LLM latency) and one uvicorn worker serving
+app:app, then for each concurrency level keeps that many requests in flight
+and reports req/s, p50 and p99. With blocking work on the event loop,
+throughput stays flat at ~1/latency however many clients there are; with
+executor.py in place it should grow with concurrency until a pool fills.
+
+    python loadtest.py --endpoint predict --concurrency 1 4 16 32 --latency 0.2
+    python loadtest.py --compare        # also run with TEATIME_OFFLOAD=0 (old inline behaviour)
+    python loadtest.py --admit-concurrency 8 --admit-queue 16   # watch admission control shed (429/503)
+"""
+from __future__ import annotations
+import asyncio, json, os, socket, subprocess, sys, time
+from pathlib import Path
+from typing import Any, Dict, List
+
+import numpy as np
+
+BACKEND = Path(__file__).resolve().parent
+
+PAYLOADS = {
+    "predict": ("/api/predict", lambda i: {"prompt": f"will ai take my job {i}"}),
+    "brew": ("/brew", lambda i: {"question": f"will ai take my job {i}", "mode": "wacky"}),
+    "search": ("/search", lambda i: {"query": f"taylor swift {i}", "k": 10}),
+}
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(stub_url: str, offload: bool, admission: Dict[str, str]) -> tuple:
+    port = _free_port()
+    env = {**os.environ, **admission, "OPENROUTER_API_KEY": "stub", "OPENROUTER_BASE_URL": stub_url,
+           "TEATIME_OFFLOAD": "1" if offload else "0", "TEATIME_QUERY_LOG": "", "TEATIME_WARMUP_TOP": "0",
+           "TEATIME_CACHE_GENERATION_ITEMS": "0", "TEATIME_CACHE_RETRIEVAL_ITEMS": "0"}
+    proc = subprocess.Popen([sys.executable, "-m", "uvicorn", "app:app", "--port", str(port), "--log-level", "warning"],
+                            cwd=BACKEND, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    import requests
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(600):
+        try:
+            requests.get(f"{url}/ping", timeout=1).raise_for_status()
+            return proc, url
+        except Exception:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError("server did not come up")
+
+
+async def run_level(url: str, endpoint: str, concurrency: int, n: int) -> Dict[str, Any]:
+    import httpx
+    path, body = PAYLOADS[endpoint]
+    lat: List[float] = []
+    errors = 0
+    shed = {429: 0, 503: 0}
+    counter = iter(range(n))
+
+    async def client(c: "httpx.AsyncClient"):
+        nonlocal errors
+        for i in counter:
+            t = time.perf_counter()
+            try:
+                r = await c.post(url + path, json=body(i))
+                if r.status_code in shed:
+                    shed[r.status_code] += 1
+                    continue  # shed requests are fast by design; keep them out of the latency numbers
+                r.raise_for_status()
+            except Exception:
+                errors += 1
+            lat.append(time.perf_counter() - t)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(timeout=120, limits=limits) as c:
+        t0 = time.perf_counter()
+        await asyncio.gather(*(client(c) for _ in range(concurrency)))
+        wall = time.perf_counter() - t0
+    ms = np.array(lat or [0.0]) * 1000
+    return {"concurrency": concurrency, "n": n, "errors": errors, "shed_429": shed[429], "shed_503": shed[503],
+            "rps": round(len(lat) / wall, 1),
+            "p50_ms": round(float(np.percentile(ms, 50)), 1), "p99_ms": round(float(np.percentile(ms, 99)), 1)}
+
+
+def run(endpoint: str, levels: List[int], per_level: int, offload: bool, stub_url: str,
+        admission: Dict[str, str]) -> List[Dict[str, Any]]:
+    proc, url = start_server(stub_url, offload, admission)
+    try:
+        return [asyncio.run(run_level(url, endpoint, c, max(per_level, c * 4))) for c in levels]
+    finally:
+        proc.terminate()
+        proc.wait(30)
+
+
+if __name__ == "__main__":
+    import argparse
+    from stub_upstream import start_stub
+    ap = argparse.ArgumentParser(description="Throughput vs concurrency against a stub upstream.")
+    ap.add_argument("--endpoint", choices=sorted(PAYLOADS), default="predict")
+    ap.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    ap.add_argument("--requests", type=int, default=64, help="requests per level (at least 4x concurrency)")
+    ap.add_argument("--latency", type=float, default=0.2, help="stub upstream latency in seconds")
+    ap.add_argument("--compare", action="store_true", help="also run with TEATIME_OFFLOAD=0")
+    ap.add_argument("--client-rps", type=float, default=0, help="per-client rate limit (0 = off; all load comes from one client)")
+    ap.add_argument("--admit-concurrency", type=int, default=256, help="TEATIME_ADMIT_CONCURRENCY for the server")
+    ap.add_argument("--admit-queue", type=int, default=1024, help="TEATIME_ADMIT_QUEUE for the server")
+    args = ap.parse_args()
+    admission = {"TEATIME_CLIENT_RPS": str(args.client_rps), "TEATIME_ADMIT_CONCURRENCY": str(args.admit_concurrency),
+                 "TEATIME_ADMIT_QUEUE": str(args.admit_queue)}
+
+    stub = start_stub(latency=args.latency)
+    modes = [("offload", True)] + ([("inline", False)] if args.compare else [])
+    out: Dict[str, Any] = {"endpoint": args.endpoint, "upstream_latency_s": args.latency}
+    for name, offload in modes:
+        out[name] = run(args.endpoint, args.concurrency, args.requests, offload, stub.base_url, admission)
+    stub.shutdown()
+    print(json.dumps(out, indent=2))
+    for name, _ in modes:
+        print(f"{name:>8}: " + "  ".join(f"c={r['concurrency']}:{r['rps']}/s" + (f" (shed {r['shed_429']}/{r['shed_503']})" if r["shed_429"] or r["shed_503"] else "")
+                                       for r in out[name]))
+    bad = sum(r["errors"] for name, _ in modes for r in out[name])
+    print("✅ no errors" if not bad else f"❌ {bad} failed requests")
+    sys.exit(0 if not bad else 1)
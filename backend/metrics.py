@@ -0,0 +1,223 @@
+# metrics.py
+"""
+In-process request metrics for the FastAPI apps.
+
+- span("stage") times a block, feeds the stage histogram and the current
+  request's Server-Timing header
+- upstream_error(op, status) / cache_event(cache, hit) count failures and hits
+- degraded(reason) counts requests answered on a fallback path
+- llm_event(event, model) counts hedges, failovers and breaker trips
+- shed(reason) counts requests turned away by admission control
+- semantic_similarity(sim) records each semantic cache lookup's best match
+- llm_tokens(usage) counts chat tokens; a request's totals go out as
+  X-Teatime-Tokens: prompt=<n>, completion=<n>, cached=<n>
+- install(app) adds the timing middleware and a Prometheus-style GET /metrics
+
+Everything lives in this process; with several workers, scrape each one.
+"""
+from __future__ import annotations
+import bisect, contextvars, threading, time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+# seconds; upstream calls dominate the top buckets
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets=BUCKETS):
+        self.name, self.help, self.buckets = name, help, tuple(buckets)
+        self._lock = threading.Lock()
+        self._series: Dict[Labels, List[float]] = {}  # counts per bucket + [+Inf, sum]
+
+    def observe(self, value: float, **labels: str):
+        key = tuple(sorted(labels.items()))
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            s = self._series.get(key)
+            if s is None:
+                s = self._series[key] = [0.0] * (len(self.buckets) + 2)
+            s[i] += 1
+            s[-1] += value
+
+    def render(self) -> List[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._series.items()]
+        for key, s in sorted(items):
+            cum = 0.0
+            for b, c in zip(self.buckets + (float("inf"),), s[:-1]):
+                cum += c
+                le = "+Inf" if b == float("inf") else repr(b)
+                out.append(f"{self.name}_bucket{_fmt_labels(key + (('le', le),))} {cum:g}")
+            out.append(f"{self.name}_sum{_fmt_labels(key)} {s[-1]:.6f}")
+            out.append(f"{self.name}_count{_fmt_labels(key)} {cum:g}")
+        return out
+
+
+class Counter:
+    def __init__(self, name: str, help: str):
+        self.name, self.help = name, help
+        self._lock = threading.Lock()
+        self._values: Dict[Labels, float] = defaultdict(float)
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] += amount
+
+    def get(self, **labels: str) -> float:
+        return self._values.get(tuple(sorted(labels.items())), 0.0)
+
+    def items(self) -> List[Tuple[Labels, float]]:
+        with self._lock:
+            return sorted(self._values.items())
+
+    def render(self) -> List[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        out += [f"{self.name}{_fmt_labels(k)} {v:g}" for k, v in self.items()]
+        return out
+
+
+def _fmt_labels(key: Labels) -> str:
+    if not key:
+        return ""
+    esc = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in key) + "}"
+
+
+STAGE_SECONDS = Histogram("teatime_stage_seconds", "Time spent per pipeline stage.")
+REQUEST_SECONDS = Histogram("teatime_request_seconds", "End-to-end request latency.")
+REQUESTS = Counter("teatime_requests_total", "Requests by route and status.")
+UPSTREAM_ERRORS = Counter("teatime_upstream_errors_total", "Failed upstream (OpenRouter) calls.")
+CACHE = Counter("teatime_cache_requests_total", "Cache lookups by cache and result.")
+DEGRADED = Counter("teatime_degraded_total", "Requests answered on a fallback path, by reason.")
+LLM_EVENTS = Counter("teatime_llm_events_total", "Chat hedges, failovers and circuit breaker trips by model.")
+SHED = Counter("teatime_admission_shed_total", "Requests rejected by admission control, by reason.")
+LLM_TOKENS = Counter("teatime_llm_tokens_total", "Chat tokens by model and kind (prompt, completion, cached).")
+SEMANTIC_SIMILARITY = Histogram("teatime_semantic_similarity", "Best cosine similarity per semantic cache lookup.",
+                                buckets=(0.5, 0.6, 0.7, 0.8, 0.85, 0.88, 0.9, 0.92, 0.94, 0.96, 0.98, 0.99, 1.0))
+
+_REGISTRY: List = [REQUEST_SECONDS, STAGE_SECONDS, REQUESTS, UPSTREAM_ERRORS, CACHE, DEGRADED, LLM_EVENTS, SHED,
+             LLM_TOKENS, SEMANTIC_SIMILARITY]
+_GAUGES: Dict[str, Tuple[str, Callable[[], float]]] = {}
+
+# per-request list of (stage, seconds); None outside a request
+_spans: contextvars.ContextVar[Optional[List[Tuple[str, float]]]] = contextvars.ContextVar("teatime_spans", default=None)
+# per-request token totals; None outside a request
+_tokens: contextvars.ContextVar[Optional[Dict[str, int]]] = contextvars.ContextVar("teatime_tokens", default=None)
+
+
+@contextmanager
+def span(stage: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        dt = time.perf_counter() - t0
+        STAGE_SECONDS.observe(dt, stage=stage)
+        spans = _spans.get()
+        if spans is not None:
+            spans.append((stage, dt))
+
+
+def upstream_error(op: str, status: object = "error"):
+    UPSTREAM_ERRORS.inc(op=op, status=str(status))
+
+
+def cache_event(cache: str, hit: bool):
+    CACHE.inc(cache=cache, result="hit" if hit else "miss")
+
+
+def degraded(reason: str):
+    DEGRADED.inc(reason=reason)
+
+
+def llm_event(event: str, model: str):
+    LLM_EVENTS.inc(event=event, model=model)
+
+
+def shed(reason: str):
+    SHED.inc(reason=reason)
+
+
+def llm_tokens(usage: Dict):
+    model = usage.get("model", "")
+    totals = _tokens.get()
+    for kind in ("prompt", "completion", "cached"):
+        n = int(usage.get(f"{kind}_tokens") or 0)
+        LLM_TOKENS.inc(n, kind=kind, model=model)
+        if totals is not None:
+            totals[kind] = totals.get(kind, 0) + n
+
+
+def semantic_similarity(sim: float):
+    SEMANTIC_SIMILARITY.observe(sim)
+
+
+def register_gauge(name: str, help: str, fn):
+    """fn() -> float, sampled on every scrape."""
+    _GAUGES[name] = (help, fn)
+
+
+def render() -> str:
+    lines: List[str] = []
+    for m in _REGISTRY:
+        lines += m.render()
+    caches = {dict(k)["cache"] for k, _ in CACHE.items()}
+    if caches:
+        lines += ["# HELP teatime_cache_hit_ratio Hits / lookups per cache.", "# TYPE teatime_cache_hit_ratio gauge"]
+        for c in sorted(caches):
+            hits, misses = CACHE.get(cache=c, result="hit"), CACHE.get(cache=c, result="miss")
+            lines.append(f"teatime_cache_hit_ratio{_fmt_labels((('cache', c),))} {hits / max(hits + misses, 1):.4f}")
+    for name, (help, fn) in sorted(_GAUGES.items()):
+        lines += [f"# HELP {name} {help}", f"# TYPE {name} gauge", f"{name} {float(fn()):g}"]
+    return "\n".join(lines) + "\n"
+
+
+def server_timing(spans: List[Tuple[str, float]], total: float) -> str:
+    agg: Dict[str, float] = {}
+    for stage, dt in spans:
+        agg[stage] = agg.get(stage, 0.0) + dt
+    parts = [f"{stage};dur={dt * 1000:.1f}" for stage, dt in agg.items()]
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+
+def install(app):
+    """Add the timing middleware and GET /metrics to a FastAPI app."""
+    from fastapi import Request
+    from fastapi.responses import PlainTextResponse
+
+    @app.middleware("http")
+    async def _timing(request: Request, call_next):
+        spans: List[Tuple[str, float]] = []
+        tokens: Dict[str, int] = {}
+        token = _spans.set(spans)
+        tok_token = _tokens.set(tokens)
+        t0 = time.perf_counter()
+        status = 500
+        try:
+            response = await call_next(request)
+            status = response.status_code
+        finally:
+            dt = time.perf_counter() - t0
+            _spans.reset(token)
+            _tokens.reset(tok_token)
+            route = request.scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            REQUEST_SECONDS.observe(dt, route=path)
+            REQUESTS.inc(route=path, status=str(status))
+        response.headers["Server-Timing"] = server_timing(spans, dt)
+        if tokens:
+            response.headers["X-Teatime-Tokens"] = ", ".join(f"{k}={v}" for k, v in tokens.items())
+        return response
+
+    @app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+    def metrics_endpoint():
+        return PlainTextResponse(render(), media_type="text/plain; version=0.0.4")
+
+    return app
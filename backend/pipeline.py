@@ -0,0 +1,294 @@
+# pipeline.py
+"""
+One-pass offline pipeline: trends_top3_us.csv -> clean CSV, min CSV,
+topic summary (JSON + CSV) and per-day stats.
+
+Rows are streamed through the same cleaning stages as clean_trends_csv.py
+(iso_ok -> rank check -> tidy_topic -> is_junk). A reader thread parses and
+cleans, a writer thread streams the clean/min CSVs, and the main thread
+aggregates the summary/stats. The final artifacts are written concurrently,
+plus Parquet copies of the min CSV and summary when pyarrow is installed
+(see trend_store.py) and the timeline rollup cache (see rollups.py).
+
+Outputs are only rebuilt when the input hash (or an output's own hash) no
+longer matches data/pipeline_manifest.json. Use --force to rebuild anyway.
+"""
+from __future__ import annotations
+import csv, json, hashlib, queue, threading, time, sys
+from pathlib import Path
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Iterator, List, Optional
+
+from clean_trends_csv import tidy_topic, is_junk, iso_ok, IN_PATH, OUT_PATH, MIN_PATH
+import rollups
+import trend_store
+
+DATA_DIR = Path("data")
+SUMMARY_JSON = DATA_DIR / "trends_topic_summary.json"
+SUMMARY_CSV = DATA_DIR / "trends_topic_summary.csv"
+STATS_CSV = DATA_DIR / "trends_stats.csv"
+MANIFEST = DATA_DIR / "pipeline_manifest.json"
+
+# Bump when the cleaning/aggregation logic changes so old outputs are rebuilt.
+PIPELINE_VERSION = 1
+BATCH = 512
+
+CLEAN_FIELDS = ["date", "country", "rank", "topic", "popularity", "raw", "source"]
+MIN_FIELDS = ["date", "rank", "topic"]
+
+
+def file_hash(path: Path) -> Optional[str]:
+    if not path.exists():
+        return None
+    h = hashlib.sha256()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def clean_row(r: Dict[str, str]) -> Optional[Dict[str, Any]]:
+    """Single-row version of clean_trends_csv.main's filter; None if dropped."""
+    d = (r.get("date") or "").strip()
+    if not iso_ok(d):
+        return None
+    try:
+        rank = int((r.get("rank") or "").strip())
+    except ValueError:
+        rank = 0
+    if rank not in (1, 2, 3):
+        return None
+    topic = tidy_topic(r.get("topic", ""))
+    if is_junk(topic):
+        return None
+    return {
+        "date": d,
+        "country": (r.get("country") or "us").strip(),
+        "rank": rank,
+        "topic": topic,
+        "popularity": "",
+        "raw": topic,
+        "source": "trend-calendar",
+    }
+
+
+def stream_clean_rows(path: Path) -> Iterator[Dict[str, Any]]:
+    with path.open("r", encoding="utf-8", newline="") as f:
+        for r in csv.DictReader(f):
+            row = clean_row(r)
+            if row is not None:
+                yield row
+
+
+class _Aggregate:
+    """Incremental topic summary + per-day row counts."""
+
+    def __init__(self):
+        self.topic_dates: Dict[str, List[str]] = {}
+        self.day_rows: Counter = Counter()
+
+    def add(self, row: Dict[str, Any]):
+        ds = self.topic_dates.setdefault(row["topic"], [])
+        # rows arrive in date order, so only the tail can repeat
+        if not ds or ds[-1] != row["date"]:
+            ds.append(row["date"])
+        self.day_rows[row["date"]] += 1
+
+    def summary(self) -> List[Dict[str, Any]]:
+        out = []
+        for topic, dates in self.topic_dates.items():
+            ds = sorted(set(dates))
+            out.append({
+                "topic": topic,
+                "first_seen": ds[0],
+                "last_seen": ds[-1],
+                "days_seen": len(ds),
+                "years_active": sorted({d[:4] for d in ds}),
+                "example_dates": ds[:3],
+            })
+        return out
+
+
+def _sort_key(r: Dict[str, Any]):
+    return (r["date"], r["rank"])
+
+
+def _write_csv(path: Path, fields: List[str], rows):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    with tmp.open("w", encoding="utf-8", newline="") as f:
+        w = csv.DictWriter(f, fieldnames=fields, extrasaction="ignore")
+        w.writeheader()
+        w.writerows(rows)
+    tmp.replace(path)
+
+
+def _write_json(path: Path, obj):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_text(json.dumps(obj, ensure_ascii=False, indent=2), encoding="utf-8")
+    tmp.replace(path)
+
+
+def _stale_outputs(in_hash: str, manifest: Dict[str, Any], outputs: Dict[str, Path]) -> List[str]:
+    if manifest.get("version") != PIPELINE_VERSION or manifest.get("input_sha256") != in_hash:
+        return list(outputs)
+    recorded = manifest.get("outputs", {})
+    return [name for name, p in outputs.items() if file_hash(p) != recorded.get(name)]
+
+
+def run(in_path: Path = IN_PATH, force: bool = False) -> int:
+    if not in_path.exists():
+        print(f"Missing input {in_path}")
+        return 2
+
+    outputs = {
+        "clean": OUT_PATH,
+        "min": MIN_PATH,
+        "summary_json": SUMMARY_JSON,
+        "summary_csv": SUMMARY_CSV,
+        "stats": STATS_CSV,
+        "rollups": rollups.ROLLUPS_PATH,
+    }
+    if trend_store.HAS_ARROW:
+        outputs["trends_parquet"] = trend_store.TRENDS_PARQUET
+        outputs["summary_parquet"] = trend_store.SUMMARY_PARQUET
+    in_hash = file_hash(in_path)
+    manifest = json.loads(MANIFEST.read_text(encoding="utf-8")) if MANIFEST.exists() else {}
+    stale = list(outputs) if force else _stale_outputs(in_hash, manifest, outputs)
+    if not stale:
+        print("[pipeline] inputs unchanged, nothing to rebuild")
+        return 0
+
+    t0 = time.perf_counter()
+    rows_q: "queue.Queue[Optional[List[Dict[str, Any]]]]" = queue.Queue(maxsize=8)
+    write_q: "queue.Queue[Optional[List[Dict[str, Any]]]]" = queue.Queue(maxsize=8)
+    errors: List[BaseException] = []
+
+    def reader():
+        try:
+            batch = []
+            for row in stream_clean_rows(in_path):
+                batch.append(row)
+                if len(batch) >= BATCH:
+                    rows_q.put(batch); batch = []
+            if batch:
+                rows_q.put(batch)
+        except BaseException as ex:
+            errors.append(ex)
+        finally:
+            rows_q.put(None)
+
+    # clean/min CSVs are streamed straight to temp files by the writer thread;
+    # if the input turns out to be unsorted they are rewritten at the end.
+    write_csvs = "clean" in stale or "min" in stale
+    tmp_clean = OUT_PATH.with_suffix(".csv.tmp")
+    tmp_min = MIN_PATH.with_suffix(".csv.tmp")
+
+    def writer():
+        try:
+            OUT_PATH.parent.mkdir(parents=True, exist_ok=True)
+            with tmp_clean.open("w", encoding="utf-8", newline="") as fc, \
+                 tmp_min.open("w", encoding="utf-8", newline="") as fm:
+                wc = csv.DictWriter(fc, fieldnames=CLEAN_FIELDS)
+                wm = csv.DictWriter(fm, fieldnames=MIN_FIELDS, extrasaction="ignore")
+                wc.writeheader(); wm.writeheader()
+                while (batch := write_q.get()) is not None:
+                    wc.writerows(batch)
+                    wm.writerows(batch)
+        except BaseException as ex:
+            errors.append(ex)
+            while write_q.get() is not None:  # keep draining so the producer never blocks
+                pass
+
+    threads = [threading.Thread(target=reader, daemon=True)]
+    if write_csvs:
+        threads.append(threading.Thread(target=writer, daemon=True))
+    for th in threads:
+        th.start()
+
+    agg = _Aggregate()
+    last_key = None
+    in_order = True
+    all_rows: List[Dict[str, Any]] = []
+    n = 0
+    while (batch := rows_q.get()) is not None:
+        if write_csvs:
+            write_q.put(batch)
+        for row in batch:
+            k = _sort_key(row)
+            if last_key is not None and k < last_key:
+                in_order = False
+            last_key = k
+            if in_order:
+                agg.add(row)
+        n += len(batch)
+    if write_csvs:
+        write_q.put(None)
+    for th in threads:
+        th.join()
+    if errors:
+        raise errors[0]
+
+    if in_order:
+        if write_csvs:
+            tmp_clean.replace(OUT_PATH)
+            tmp_min.replace(MIN_PATH)
+    else:
+        # rare (e.g. a scraper backfill appended old days): re-read and sort in memory
+        print("[pipeline] input not sorted by (date, rank); sorting in memory")
+        all_rows = sorted(stream_clean_rows(in_path), key=_sort_key)
+        agg = _Aggregate()
+        for row in all_rows:
+            agg.add(row)
+        if write_csvs:
+            tmp_clean.unlink(missing_ok=True)
+            tmp_min.unlink(missing_ok=True)
+
+    summary = agg.summary()
+    jobs = {}
+    with ThreadPoolExecutor(max_workers=4) as ex:
+        if write_csvs and not in_order:
+            jobs["clean"] = ex.submit(_write_csv, OUT_PATH, CLEAN_FIELDS, all_rows)
+            jobs["min"] = ex.submit(_write_csv, MIN_PATH, MIN_FIELDS, all_rows)
+        if "summary_json" in stale:
+            jobs["summary_json"] = ex.submit(_write_json, SUMMARY_JSON, summary)
+        if "summary_csv" in stale:
+            by_days = sorted(summary, key=lambda s: (-s["days_seen"], s["topic"]))
+            jobs["summary_csv"] = ex.submit(_write_csv, SUMMARY_CSV, ["topic", "days_seen", "first_seen", "last_seen"], by_days)
+        if "stats" in stale:
+            stats = [{"date": d, "rows": c} for d, c in sorted(agg.day_rows.items())]
+            jobs["stats"] = ex.submit(_write_csv, STATS_CSV, ["date", "rows"], stats)
+        for f in jobs.values():
+            f.result()
+    # Parquet copies are derived from the files written above
+    if "trends_parquet" in outputs and {"min", "trends_parquet"} & set(stale):
+        trend_store.write_trends_parquet(MIN_PATH, trend_store.TRENDS_PARQUET)
+    if "summary_parquet" in outputs and {"summary_json", "summary_parquet"} & set(stale):
+        trend_store.write_summary_parquet(SUMMARY_JSON, trend_store.SUMMARY_PARQUET)
+    if {"min", "rollups"} & set(stale):
+        with MIN_PATH.open("r", encoding="utf-8", newline="") as f:
+            rollups.Rollups.from_rows(csv.DictReader(f)).save(rollups.ROLLUPS_PATH)
+
+    _write_json(MANIFEST, {
+        "version": PIPELINE_VERSION,
+        "input": str(in_path),
+        "input_sha256": in_hash,
+        "outputs": {name: file_hash(p) for name, p in outputs.items()},
+    })
+
+    dt = time.perf_counter() - t0
+    print(f"[pipeline] {n} clean rows, {len(summary)} topics in {dt:.2f}s")
+    for name in stale:
+        print(f"→ {outputs[name]}")
+    return 0
+
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="Clean, minimise and summarise the trends CSV in one pass.")
+    ap.add_argument("--input", default=str(IN_PATH), help="raw scraper CSV (default: %(default)s)")
+    ap.add_argument("--force", action="store_true", help="rebuild every output even if hashes match")
+    args = ap.parse_args()
+    sys.exit(run(Path(args.input), force=args.force))
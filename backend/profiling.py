@@ -0,0 +1,176 @@
+# profiling.py
+"""
+Opt-in per-request sampling profiler.
+
+Send `X-Teatime-Profile: 1` (or `?profile=1`) from a trusted host and that one
+request runs with a background sampler taking stack snapshots every few ms.
+The result is written under PROFILE_DIR as:
+
+- <id>.collapsed   one "frame;frame;frame count" line per stack, ready for
+                   flamegraph.pl / speedscope / inferno
+- <id>.json        route, duration, sample count and the hottest frames
+
+GET /admin/profiles lists recent profiles, GET /admin/profiles/{id} returns
+the collapsed stacks. Both are limited to the same trusted hosts.
+
+Sync endpoints run on a worker thread, so every busy thread is sampled;
+threads parked in a lock/select/queue wait are skipped. Under concurrent load
+other requests can show up in the profile - use it on a quiet worker.
+"""
+from __future__ import annotations
+import asyncio, json, os, sys, threading, time, uuid
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List
+
+# at module level: the routes below annotate with Request, resolved from these globals
+from fastapi import HTTPException, Request
+from fastapi.responses import PlainTextResponse
+
+PROFILE_DIR = Path(os.getenv("TEATIME_PROFILE_DIR", "profiles"))
+TRUSTED_HOSTS = {h.strip() for h in os.getenv("TEATIME_PROFILE_HOSTS", "127.0.0.1,::1,localhost").split(",") if h.strip()}
+INTERVAL = float(os.getenv("TEATIME_PROFILE_INTERVAL_MS", "5")) / 1000.0
+KEEP = int(os.getenv("TEATIME_PROFILE_KEEP", "50"))
+
+# innermost frames that mean "this thread is idle, not working for anyone"
+_IDLE = {
+    ("threading.py", "wait"), ("threading.py", "_wait_for_tstate_lock"),
+    ("selectors.py", "select"), ("queue.py", "get"), ("thread.py", "_worker"),
+}
+
+
+class Sampler:
+    def __init__(self, interval: float = INTERVAL):
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="teatime-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        me = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            names.update({t.ident: t.name for t in threading.enumerate()})
+            for tid, frame in sys._current_frames().items():
+                if tid == me:
+                    continue
+                code = frame.f_code
+                if (os.path.basename(code.co_filename), code.co_name) in _IDLE:
+                    continue
+                stack = []
+                f = frame
+                while f is not None:
+                    c = f.f_code
+                    stack.append(f"{c.co_name} ({os.path.basename(c.co_filename)}:{f.f_lineno})")
+                    f = f.f_back
+                stack.append(names.get(tid, str(tid)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def collapsed(self) -> str:
+        return "\n".join(f"{s} {n}" for s, n in self.stacks.most_common()) + "\n"
+
+    def top_frames(self, n: int = 15) -> List[Dict[str, object]]:
+        """Self time: how often each frame was the innermost one."""
+        leaf = Counter()
+        for s, c in self.stacks.items():
+            leaf[s.rsplit(";", 1)[-1]] += c
+        total = sum(leaf.values()) or 1
+        return [{"frame": f, "samples": c, "pct": round(100.0 * c / total, 1)} for f, c in leaf.most_common(n)]
+
+
+def wants_profile(request) -> bool:
+    flag = request.headers.get("x-teatime-profile") or request.query_params.get("profile")
+    return bool(flag) and flag not in ("0", "false", "no")
+
+
+def is_trusted(request) -> bool:
+    return request.client is not None and request.client.host in TRUSTED_HOSTS
+
+
+def _prune():
+    metas = sorted(PROFILE_DIR.glob("*.json"), key=lambda p: p.stat().st_mtime, reverse=True)
+    for meta in metas[KEEP:]:
+        meta.unlink(missing_ok=True)
+        meta.with_suffix(".collapsed").unlink(missing_ok=True)
+
+
+def save(sampler: Sampler, method: str, path: str, status: int, duration: float) -> str:
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    pid = time.strftime("%Y%m%d-%H%M%S") + "-" + uuid.uuid4().hex[:6]
+    (PROFILE_DIR / f"{pid}.collapsed").write_text(sampler.collapsed(), encoding="utf-8")
+    (PROFILE_DIR / f"{pid}.json").write_text(json.dumps({
+        "id": pid,
+        "method": method,
+        "path": path,
+        "status": status,
+        "duration_ms": round(duration * 1000, 1),
+        "samples": sampler.samples,
+        "interval_ms": sampler.interval * 1000,
+        "created": time.time(),
+        "top_frames": sampler.top_frames(),
+    }, indent=2), encoding="utf-8")
+    _prune()
+    return pid
+
+
+def list_profiles(limit: int = KEEP) -> List[Dict[str, object]]:
+    if not PROFILE_DIR.exists():
+        return []
+    metas = sorted(PROFILE_DIR.glob("*.json"), key=lambda p: p.stat().st_mtime, reverse=True)[:limit]
+    out = []
+    for m in metas:
+        d = json.loads(m.read_text(encoding="utf-8"))
+        d.pop("top_frames", None)
+        out.append(d)
+    return out
+
+
+def install(app):
+    """Add the profiling middleware and /admin/profiles routes to a FastAPI app."""
+
+    @app.middleware("http")
+    async def _profile(request: Request, call_next):
+        if not wants_profile(request) or not is_trusted(request):
+            return await call_next(request)
+        sampler = Sampler().start()
+        t0 = time.perf_counter()
+        status = 500
+        try:
+            response = await call_next(request)
+            status = response.status_code
+        finally:
+            dt = time.perf_counter() - t0
+            # joining the sampler and writing the files block: keep them off the event loop
+            await asyncio.to_thread(sampler.stop)
+            pid = await asyncio.to_thread(save, sampler, request.method, request.url.path, status, dt)
+        response.headers["X-Teatime-Profile-Id"] = pid
+        return response
+
+    def _guard(request: Request):
+        if not is_trusted(request):
+            raise HTTPException(status_code=403, detail="profiles are only available from trusted hosts")
+
+    @app.get("/admin/profiles", include_in_schema=False)
+    def profiles_index(request: Request, limit: int = 20):
+        _guard(request)
+        return {"dir": str(PROFILE_DIR.resolve()), "profiles": list_profiles(max(1, min(limit, KEEP)))}
+
+    @app.get("/admin/profiles/{pid}", response_class=PlainTextResponse, include_in_schema=False)
+    def profile_stacks(pid: str, request: Request):
+        _guard(request)
+        p = PROFILE_DIR / f"{Path(pid).name}.collapsed"
+        if not p.exists():
+            raise HTTPException(status_code=404, detail="no such profile")
+        return PlainTextResponse(p.read_text(encoding="utf-8"))
+
+    return app
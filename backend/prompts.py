@@ -0,0 +1,122 @@
+# prompts.py
+"""
+Prompt assembly under a token budget.
+
+Prompts are laid out static-first so provider prompt caching can apply: the
+system message is a module constant per endpoint and never varies, the user
+message starts with the few per-mode lines and ends with the per-request
+window, ingredients and question. Ingredient lines are packed in relevance
+order into TEATIME_PROMPT_INGREDIENT_TOKENS (at most TEATIME_PROMPT_MAX_ITEMS
+lines); a line that does not fit is skipped so a shorter, less relevant one
+can still go in.
+
+Token counts are local: tiktoken when it is installed and its encoding loads
+(the chat model's, else o200k_base), otherwise a word/punctuation heuristic
+that errs slightly high on English prompts. They size the budget and stand in
+for provider usage when a response comes back without it.
+"""
+from __future__ import annotations
+import math, os, re
+from functools import lru_cache
+from typing import List, Optional, Sequence, Tuple
+
+INGREDIENT_TOKENS = int(os.getenv("TEATIME_PROMPT_INGREDIENT_TOKENS", "160"))
+MAX_ITEMS = int(os.getenv("TEATIME_PROMPT_MAX_ITEMS", "12"))
+# chat formatting per message (role, separators), OpenAI-style accounting
+MESSAGE_OVERHEAD = 4
+
+_word_re = re.compile(r"[A-Za-z]+|\d+|[^\sA-Za-z\d]")
+
+
+def _load_encoder(model: str):
+    try:
+        import tiktoken
+    except ImportError:
+        return None, "heuristic"
+    try:
+        try:
+            enc = tiktoken.encoding_for_model(model.split("/")[-1])
+        except KeyError:
+            enc = tiktoken.get_encoding("o200k_base")
+    except Exception:  # the BPE file is fetched on first use; offline that fails
+        return None, "heuristic"
+    return enc, f"tiktoken:{enc.name}"
+
+
+_ENCODER, TOKENIZER = _load_encoder(os.getenv("TEATIME_MODEL", "openai/gpt-4o"))
+
+
+def _heuristic(text: str) -> int:
+    # BPE keeps common short words whole and splits long ones roughly every 4-5 chars;
+    # digit runs go in groups of three, punctuation is mostly a token each
+    return sum(math.ceil(len(w) / 5) if w[0].isalpha() else math.ceil(len(w) / 3) if w[0].isdigit() else 1
+               for w in _word_re.findall(text))
+
+
+@lru_cache(maxsize=8192)
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    if _ENCODER is not None:
+        return len(_ENCODER.encode(text, disallowed_special=()))
+    return _heuristic(text)
+
+
+def pack(lines: Sequence[str], budget: int = INGREDIENT_TOKENS, max_items: int = MAX_ITEMS) -> List[int]:
+    """Indices of `lines` (best first) that fit in `budget` tokens, in their original order."""
+    kept: List[int] = []
+    used = 0
+    for i, line in enumerate(lines):
+        if len(kept) >= max_items:
+            break
+        n = count_tokens(line) + 1  # + newline
+        if used + n > budget and kept:
+            continue
+        kept.append(i)  # the best line always goes in, even over budget
+        used += n
+    return kept
+
+
+class Prompt:
+    """A system + user message pair with its local token count and packing stats."""
+
+    def __init__(self, system: str, user: str, packed: int, dropped: int):
+        self.system, self.user = system, user
+        self.packed, self.dropped = packed, dropped
+        self.tokens = count_tokens(system) + count_tokens(user) + 2 * MESSAGE_OVERHEAD
+
+    def __repr__(self) -> str:
+        return f"Prompt(tokens={self.tokens}, packed={self.packed}, dropped={self.dropped})"
+
+
+def assemble(system: str, head: Sequence[str], items: Sequence[str], tail: Sequence[str],
+             empty: str = "", budget: int = INGREDIENT_TOKENS, max_items: int = MAX_ITEMS) -> Tuple[Prompt, List[int]]:
+    """
+    User message = head lines, the packed item lines (or `empty` if none),
+    then tail lines. Returns the prompt and the indices of the items used.
+    """
+    kept = pack(items, budget, max_items)
+    body = [items[i] for i in kept] or ([empty] if empty else [])
+    user = "\n".join([*head, *body, *tail])
+    return Prompt(system, user, len(kept), len(items) - len(kept)), kept
+
+
+def usage(system: str, user: str, text: str, reported: Optional[dict]) -> dict:
+    """Provider usage if it came back, else local counts for the messages and the reply."""
+    if reported and reported.get("prompt_tokens") is not None:
+        details = reported.get("prompt_tokens_details") or {}
+        return {"prompt_tokens": int(reported["prompt_tokens"]),
+                "completion_tokens": int(reported.get("completion_tokens") or 0),
+                "cached_tokens": int(details.get("cached_tokens") or 0), "source": "provider"}
+    return {"prompt_tokens": count_tokens(system) + count_tokens(user) + 2 * MESSAGE_OVERHEAD,
+            "completion_tokens": count_tokens(text), "cached_tokens": 0, "source": TOKENIZER}
+
+
+if __name__ == "__main__":
+    import argparse, sys
+    ap = argparse.ArgumentParser(description="Count prompt tokens locally.")
+    ap.add_argument("files", nargs="*", help="text files (default: stdin)")
+    args = ap.parse_args()
+    texts = [open(f, encoding="utf-8").read() for f in args.files] or [sys.stdin.read()]
+    for name, t in zip(args.files or ["<stdin>"], texts):
+        print(f"{count_tokens(t):>7}  {name}  ({TOKENIZER})")
@@ -0,0 +1,139 @@
+# query_log.py
+"""
+Query log + cache warm-up.
+
+Off by default: questions are user text, so nothing is written to disk
+unless TEATIME_QUERY_LOG names a file, e.g.
+
+    TEATIME_QUERY_LOG=logs/query_log.jsonl
+
+which start-up warm-up (app.py, TEATIME_WARMUP_TOP) and
+`semantic_cache.py tune` both read. record() then appends
+{ts, endpoint, q, mode, start, end, k} from a background thread, with q
+normalised (see cache.normalize_query). The file rolls over to <name>.1 at
+TEATIME_QUERY_LOG_MAX_MB.
+
+Warmer replays the top-N most frequent entries through a callback on a
+daemon thread, at most `rps` per second, once at startup and then every
+`every_s` seconds if set. It never blocks startup; /ping shows its progress.
+"""
+from __future__ import annotations
+import json, logging, os, queue, threading, time
+from collections import Counter
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from cache import normalize_query
+
+log = logging.getLogger("teatime.query_log")
+
+LOG_PATH = os.getenv("TEATIME_QUERY_LOG", "")  # empty: no log
+MAX_BYTES = int(float(os.getenv("TEATIME_QUERY_LOG_MAX_MB", "50")) * 1024 * 1024)
+
+_FIELDS = ("endpoint", "q", "mode", "start", "end", "k")
+
+
+class QueryLog:
+    def __init__(self, path: Optional[str] = LOG_PATH, max_bytes: int = MAX_BYTES):
+        self.path = Path(path) if path else None
+        self.max_bytes = max_bytes
+        self._q: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=10000)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def record(self, endpoint: str, query: str, mode: Optional[str] = None,
+               start: Optional[str] = None, end: Optional[str] = None, k: Optional[int] = None):
+        if self.path is None or not query:
+            return
+        self._ensure_writer()
+        entry = {"ts": round(time.time(), 3), "endpoint": endpoint, "q": normalize_query(query),
+                 "mode": mode, "start": start, "end": end, "k": k}
+        try:
+            self._q.put_nowait(entry)
+        except queue.Full:
+            pass  # never slow a request down for the log
+
+    def _ensure_writer(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._writer, name="teatime-query-log", daemon=True)
+                    self._thread.start()
+
+    def _writer(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        while True:
+            batch = [self._q.get()]
+            while len(batch) < 500:
+                try:
+                    batch.append(self._q.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                if self.path.exists() and self.path.stat().st_size > self.max_bytes:
+                    self.path.replace(self.path.with_name(self.path.name + ".1"))
+                with self.path.open("a", encoding="utf-8") as f:
+                    f.writelines(json.dumps(e, ensure_ascii=False) + "\n" for e in batch)
+            except OSError as ex:
+                log.warning("query log write failed: %s", ex)
+
+    def top(self, n: int, endpoints: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Most frequent (endpoint, q, mode, window, k) entries across the log and its rollover."""
+        if self.path is None:
+            return []
+        counts: Counter = Counter()
+        for p in (self.path.with_name(self.path.name + ".1"), self.path):
+            if not p.exists():
+                continue
+            with p.open("r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        e = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    if endpoints and e.get("endpoint") not in endpoints:
+                        continue
+                    counts[tuple(e.get(k) for k in _FIELDS)] += 1
+        return [{**dict(zip(_FIELDS, key)), "count": c} for key, c in counts.most_common(n)]
+
+
+class Warmer:
+    def __init__(self, log: QueryLog, replay: Callable[[Dict[str, Any]], None], top_n: int = 50,
+                 rps: float = 2.0, every_s: float = 0.0, endpoints: Optional[List[str]] = None):
+        self.log, self.replay = log, replay
+        self.top_n, self.rps, self.every_s, self.endpoints = top_n, rps, every_s, endpoints
+        self.state = {"state": "idle", "done": 0, "failed": 0, "total": 0, "last_run": None}
+        self._stop = threading.Event()
+
+    def start(self) -> "Warmer":
+        threading.Thread(target=self._run, name="teatime-warmup", daemon=True).start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def run_once(self):
+        entries = self.log.top(self.top_n, self.endpoints)
+        self.state.update(state="running", done=0, failed=0, total=len(entries))
+        gap = 1.0 / self.rps if self.rps > 0 else 0.0
+        for e in entries:
+            if self._stop.is_set():
+                break
+            t0 = time.monotonic()
+            try:
+                self.replay(e)
+                self.state["done"] += 1
+            except Exception as ex:
+                self.state["failed"] += 1
+                log.warning("warmup %s %r failed: %s", e["endpoint"], e["q"], ex)
+            self._stop.wait(max(0.0, gap - (time.monotonic() - t0)))
+        self.state.update(state="idle", last_run=time.strftime("%Y-%m-%dT%H:%M:%S"))
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.run_once()
+            if self.every_s <= 0 or self._stop.wait(self.every_s):
+                break
+
+
+LOG = QueryLog()
@@ -0,0 +1,171 @@
+# relevance.py
+"""
+Prompt -> trend relevance scoring for server.get_top_trend_from_list.
+
+Topics are tokenised once into a corpus-wide index:
+- hashtags are split on case/digit boundaries (#MondayMotivation -> monday,
+  motivation; #NBADraft -> nba, draft)
+- tokens are lowercased and lightly stemmed (jobs -> job, tours -> tour,
+  trending -> trend)
+
+and stored as flat token-id arrays with per-topic offsets, so scoring a
+batch of candidates is a gather + isin + bincount (and np.char.find for
+substring hits) instead of a loop per topic per word. Short candidate lists
+(under VECTOR_MIN, e.g. /api/predict's 25) use the same precomputed token
+sets with plain set intersections, which beats numpy's per-call overhead.
+Score = 20 per stemmed token shared with the prompt, 15 per prompt word
+(> 3 chars) found as a substring of the topic, +10 for rank 1, +5 for
+non-hashtags - the same weights the old loop used.
+"""
+from __future__ import annotations
+import re, threading
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+W_TOKEN, W_PARTIAL, W_RANK1, W_PLAIN = 20, 15, 10, 5
+VECTOR_MIN = 256
+# too common to say anything about relevance
+STOPWORDS = frozenset("""
+a an and are as at be but by can could did do does for from had has have how i if in into is it its
+just me my of on or our so than that the their them then there these they this to was we were what
+when where which who why will with would you your
+""".split())
+
+_camel_re = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+")
+_word_re = re.compile(r"[a-z0-9]+")
+
+
+def stem(w: str) -> str:
+    """Tiny suffix stripper; enough to line up plurals and -ing/-ed forms."""
+    if len(w) <= 3:
+        return w
+    if w.endswith("ies") and len(w) > 4:
+        return w[:-3] + "y"
+    if w.endswith("sses"):
+        return w[:-2]
+    for suf, min_len in (("ing", 6), ("ed", 5), ("es", 5), ("s", 4)):
+        if w.endswith(suf) and len(w) >= min_len and not w.endswith("ss"):
+            w = w[:-len(suf)]
+            break
+    if len(w) > 3 and w[-1] == w[-2] and w[-1] not in "lsz":
+        w = w[:-1]  # running -> runn -> run
+    elif len(w) > 3 and w.endswith("e"):
+        w = w[:-1]  # take / taking -> tak
+    return w
+
+
+def topic_tokens(topic: str) -> List[str]:
+    parts: List[str] = []
+    for chunk in re.split(r"[\s_#@\-./]+", topic):
+        if chunk:
+            parts += _camel_re.findall(chunk) or [chunk]
+    return [stem(p.lower()) for p in parts if p]
+
+
+def prompt_words(prompt: str) -> List[str]:
+    return [w for w in _word_re.findall((prompt or "").lower()) if w not in STOPWORDS]
+
+
+class TopicIndex:
+    def __init__(self, topics: Iterable[str] = ()):
+        self._lock = threading.Lock()
+        self.ids: Dict[str, int] = {}
+        self.vocab: Dict[str, int] = {}
+        self._tok: List[int] = []
+        self._owner: List[int] = []
+        self._lower: List[str] = []
+        self._hashtag: List[bool] = []
+        self._sets: List[frozenset] = []
+        self._arrays: Optional[Tuple[np.ndarray, ...]] = None
+        self.add(topics)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def add(self, topics: Iterable[str]):
+        with self._lock:
+            for t in topics:
+                if t in self.ids:
+                    continue
+                i = self.ids[t] = len(self.ids)
+                toks = frozenset(self.vocab.setdefault(tok, len(self.vocab)) for tok in topic_tokens(t))
+                self._tok += toks
+                self._owner += [i] * len(toks)
+                self._sets.append(toks)
+                self._lower.append(t.lower())
+                self._hashtag.append(t.startswith("#"))
+            self._arrays = None
+
+    def _snapshot(self) -> Tuple[np.ndarray, ...]:
+        a = self._arrays
+        if a is None:
+            with self._lock:
+                owner = np.asarray(self._owner, dtype=np.int64)
+                a = self._arrays = (
+                    np.asarray(self._tok, dtype=np.int64),
+                    np.searchsorted(owner, np.arange(len(self.ids) + 1)),  # topic i -> tok[off[i]:off[i+1]]
+                    np.asarray(self._hashtag, dtype=bool),
+                    np.asarray(self._lower, dtype=str),
+                )
+        return a
+
+    def score(self, topics: Sequence[str], prompt: str, ranks: Optional[Sequence[str]] = None,
+              bonus: bool = True) -> np.ndarray:
+        """Relevance score per candidate topic (same order as `topics`); bonus=False scores word matches only."""
+        missing = [t for t in topics if t not in self.ids]
+        if missing:
+            self.add(missing)
+        words = prompt_words(prompt)
+        stems = [self.vocab[s] for s in set(map(stem, words)) if s in self.vocab]
+        long_words = {w for w in words if len(w) > 3}
+        if len(topics) < VECTOR_MIN:
+            rs = ranks if ranks is not None else [None] * len(topics)
+            return np.array([self._score_one(self.ids[t], stems, long_words, r, bonus) for t, r in zip(topics, rs)], dtype=np.int64)
+
+        tok, off, hashtag, lower = self._snapshot()
+        ids = np.fromiter((self.ids[t] for t in topics), dtype=np.int64, count=len(topics))
+        scores = W_PLAIN * (~hashtag[ids]).astype(np.int64) if bonus else np.zeros(len(ids), dtype=np.int64)
+        if ranks is not None and bonus:
+            scores += W_RANK1 * (_rank_ints(ranks) == 1)
+
+        if stems:
+            lens = off[ids + 1] - off[ids]
+            cand = np.repeat(np.arange(len(ids)), lens)
+            pos = off[ids][cand] + np.arange(lens.sum()) - np.repeat(np.cumsum(lens) - lens, lens)
+            hit = np.isin(tok[pos], stems)
+            scores += W_TOKEN * np.bincount(cand[hit], minlength=len(ids))
+        low = lower[ids]
+        for w in long_words:
+            scores += W_PARTIAL * (np.char.find(low, w) >= 0)
+        return scores
+
+    def _score_one(self, i: int, stems: List[int], long_words: set, rank, bonus: bool = True) -> int:
+        low = self._lower[i]
+        words = W_TOKEN * len(self._sets[i].intersection(stems)) + W_PARTIAL * sum(w in low for w in long_words)
+        if not bonus:
+            return words
+        return words + W_PLAIN * (not self._hashtag[i]) + W_RANK1 * (str(rank) == "1")
+
+    def rank(self, topics: Sequence[str], prompt: str, ranks: Optional[Sequence[str]] = None,
+             n: Optional[int] = None) -> List[Tuple[int, str]]:
+        """Top-n (score, topic), best first; ties go to the better trend rank, then list order."""
+        if not topics:
+            return []
+        scores = self.score(topics, prompt, ranks)
+        rk = _rank_ints(ranks) if ranks is not None else np.zeros(len(topics), dtype=np.int64)
+        if len(topics) < VECTOR_MIN:
+            sc, rl = scores.tolist(), rk.tolist()
+            order = sorted(range(len(topics)), key=lambda i: (-sc[i], rl[i], i))[:n]
+        else:
+            order = np.lexsort((np.arange(len(topics)), rk, -scores))[:n].tolist()
+        return [(int(scores[i]), topics[i]) for i in order]
+
+
+def _rank_ints(ranks: Sequence) -> np.ndarray:
+    """Trend ranks as ints; anything that isn't a number sorts last."""
+    a = np.asarray(ranks).astype(str)
+    out = np.full(len(a), 9, dtype=np.int64)
+    ok = np.char.isdigit(a)
+    out[ok] = a[ok].astype(np.int64)
+    return out
@@ -0,0 +1,225 @@
+# resp_stub.py
+"""
+Local Redis-protocol (RESP2) stand-in for the redis cache backend.
+
+Speaks enough of the protocol for cache.RedisCache and redis-cli smoke tests:
+PING, AUTH, SELECT, GET, SET (EX/PX/NX/XX), DEL, EXISTS, PTTL, SCAN (MATCH/COUNT),
+DBSIZE, FLUSHDB/FLUSHALL, INFO. Expiry is lazy on access plus a sweep on
+SCAN/DBSIZE. Past --maxmemory-mb (key + value bytes) it evicts least
+recently used keys, like maxmemory-policy allkeys-lru.
+
+    python resp_stub.py --port 6399 --maxmemory-mb 64
+    TEATIME_CACHE_BACKEND=redis TEATIME_CACHE_URL=redis://127.0.0.1:6399/0 uvicorn app:app
+"""
+from __future__ import annotations
+import fnmatch, socketserver, threading, time
+from collections import OrderedDict
+from typing import Any, List, Optional, Tuple
+
+
+class Store:
+    def __init__(self, maxmemory: int = 0):
+        self.maxmemory = maxmemory
+        self.data: "OrderedDict[bytes, Tuple[bytes, float]]" = OrderedDict()  # key -> (value, expires_at or inf)
+        self.used = 0
+        self.evicted = 0
+        self.lock = threading.Lock()
+
+    def _live(self, key: bytes) -> Optional[Tuple[bytes, float]]:
+        item = self.data.get(key)
+        if item is not None and item[1] <= time.monotonic():
+            self._drop(key)
+            return None
+        return item
+
+    def _drop(self, key: bytes):
+        v, _ = self.data.pop(key)
+        self.used -= len(key) + len(v)
+
+    def _sweep(self):
+        now = time.monotonic()
+        for k in [k for k, (_, exp) in self.data.items() if exp <= now]:
+            self._drop(k)
+
+    def get(self, key: bytes) -> Optional[bytes]:
+        with self.lock:
+            item = self._live(key)
+            if item is None:
+                return None
+            self.data.move_to_end(key)
+            return item[0]
+
+    def set(self, key: bytes, value: bytes, ttl: Optional[float], nx: bool, xx: bool) -> bool:
+        with self.lock:
+            exists = self._live(key) is not None
+            if (nx and exists) or (xx and not exists):
+                return False
+            if exists:
+                self._drop(key)
+            self.data[key] = (value, time.monotonic() + ttl if ttl else float("inf"))
+            self.used += len(key) + len(value)
+            while self.maxmemory and self.used > self.maxmemory and len(self.data) > 1:
+                old = next(iter(self.data))
+                self._drop(old)
+                self.evicted += 1
+            return True
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    server: "RespStub"
+
+    def _read_command(self) -> Optional[List[bytes]]:
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            return line.strip().split()  # inline command (telnet / nc)
+        args = []
+        for _ in range(int(line[1:-2])):
+            n = int(self.rfile.readline()[1:-2])
+            args.append(self.rfile.read(n + 2)[:-2])
+        return args
+
+    def _reply(self, v: Any):
+        self.wfile.write(_encode(v))
+
+    def handle(self):
+        while True:
+            try:
+                cmd = self._read_command()
+            except (ConnectionError, ValueError):
+                return
+            if cmd is None:
+                return
+            if not cmd:
+                continue
+            try:
+                self._reply(self.server.dispatch(cmd))
+            except _Err as ex:
+                self.wfile.write(b"-ERR " + str(ex).encode() + b"\r\n")
+            except (BrokenPipeError, ConnectionResetError):
+                return
+
+
+class _Err(Exception):
+    pass
+
+
+class _Status(str):
+    pass
+
+
+def _encode(v: Any) -> bytes:
+    if v is None:
+        return b"$-1\r\n"
+    if isinstance(v, _Status):
+        return b"+" + v.encode() + b"\r\n"
+    if isinstance(v, bool):
+        return b":%d\r\n" % int(v)
+    if isinstance(v, int):
+        return b":%d\r\n" % v
+    if isinstance(v, str):
+        v = v.encode()
+    if isinstance(v, bytes):
+        return b"$%d\r\n%s\r\n" % (len(v), v)
+    if isinstance(v, list):
+        return b"*%d\r\n" % len(v) + b"".join(_encode(x) for x in v)
+    raise TypeError(type(v))
+
+
+class RespStub(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, addr: Tuple[str, int], maxmemory: int = 0):
+        super().__init__(addr, _Handler)
+        self.store = Store(maxmemory)
+        self.commands = 0
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"redis://{host}:{port}/0"
+
+    def dispatch(self, cmd: List[bytes]) -> Any:
+        self.commands += 1
+        name, args = cmd[0].upper().decode(), cmd[1:]
+        st = self.store
+        if name == "PING":
+            return _Status("PONG") if not args else args[0]
+        if name in ("AUTH", "SELECT"):
+            return _Status("OK")
+        if name == "GET":
+            return st.get(args[0])
+        if name == "SET":
+            key, value, ttl, nx, xx = args[0], args[1], None, False, False
+            opts = [a.upper() for a in args[2:]]
+            i = 0
+            while i < len(opts):
+                if opts[i] in (b"EX", b"PX"):
+                    n = float(opts[i + 1])
+                    ttl = n if opts[i] == b"EX" else n / 1000.0
+                    i += 2
+                    continue
+                nx, xx = nx or opts[i] == b"NX", xx or opts[i] == b"XX"
+                i += 1
+            return _Status("OK") if st.set(key, value, ttl, nx, xx) else None
+        if name in ("DEL", "EXISTS"):
+            with st.lock:
+                live = [k for k in args if st._live(k) is not None]
+                if name == "DEL":
+                    for k in live:
+                        st._drop(k)
+            return len(live)
+        if name == "PTTL":
+            with st.lock:
+                item = st._live(args[0])
+            if item is None:
+                return -2
+            return -1 if item[1] == float("inf") else int((item[1] - time.monotonic()) * 1000)
+        if name == "SCAN":
+            # single pass: every key in one reply, cursor 0 (valid RESP, fine for a stand-in)
+            pattern = b"*"
+            for i in range(1, len(args) - 1):
+                if args[i].upper() == b"MATCH":
+                    pattern = args[i + 1]
+            with st.lock:
+                st._sweep()
+                keys = [k for k in st.data if fnmatch.fnmatchcase(k.decode("utf-8", "replace"), pattern.decode())]
+            return [b"0", keys]
+        if name == "DBSIZE":
+            with st.lock:
+                st._sweep()
+                return len(st.data)
+        if name in ("FLUSHDB", "FLUSHALL"):
+            with st.lock:
+                st.data.clear()
+                st.used = 0
+            return _Status("OK")
+        if name == "INFO":
+            return (f"# Memory\r\nused_memory:{st.used}\r\nmaxmemory:{st.maxmemory}\r\n"
+                    f"maxmemory_policy:allkeys-lru\r\n# Stats\r\nevicted_keys:{st.evicted}\r\n"
+                    f"# Keyspace\r\ndb0:keys={len(st.data)}\r\n")
+        raise _Err(f"unknown command '{name}'")
+
+
+def start_resp_stub(host: str = "127.0.0.1", port: int = 0, maxmemory: int = 0) -> RespStub:
+    """Start a stand-in on a background thread (port 0 = pick a free one)."""
+    srv = RespStub((host, port), maxmemory)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    return srv
+
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="Local Redis-protocol stand-in for the cache backend.")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=6399)
+    ap.add_argument("--maxmemory-mb", type=float, default=64, help="LRU-evict past this many key+value MB (0 = unbounded)")
+    args = ap.parse_args()
+    srv = RespStub((args.host, args.port), int(args.maxmemory_mb * 1024 * 1024))
+    print(f"[resp-stub] listening on {srv.url} (maxmemory {args.maxmemory_mb} MB)")
+    try:
+        srv.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -1,17 +1,38 @@
 # retriever.py
 from __future__ import annotations
-import json, csv
+import json, csv, contextvars, os, re, threading, time
+from functools import lru_cache
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
 from pathlib import Path
-from typing import List, Dict, Any, Optional, Tuple
-from datetime import date
+from typing import List, Dict, Any, Optional, Tuple, Iterable, Callable
+from datetime import date, datetime
 import numpy as np
 
+import metrics
+import relevance
+import rollups
+import trend_store
+import trend_db
+
 DATA_DIR = Path("data")
 TRENDS_MIN = DATA_DIR / "trends_min_us.csv"
 EMB_PATH = DATA_DIR / "topic_embeddings.npy"
 IDX_PATH = DATA_DIR / "topic_index.json"
 
+# hybrid_search: how long to wait for the query embedding before answering
+# keyword-only, and the RRF damping constant
+HYBRID_BUDGET_S = float(os.getenv("TEATIME_HYBRID_BUDGET_MS", "1500")) / 1000.0
+RRF_K = int(os.getenv("TEATIME_RRF_K", "60"))
+_embed_pool = ThreadPoolExecutor(max_workers=int(os.getenv("TEATIME_EMBED_WORKERS", "8")), thread_name_prefix="teatime-embed")
+
+
+def submit_embed(embed_fn: Callable[[str], Optional[np.ndarray]], query: str) -> "Future[Optional[np.ndarray]]":
+    """Run embed_fn(query) on the embedding pool; the embed span still lands in this request's Server-Timing."""
+    return _embed_pool.submit(contextvars.copy_context().run, embed_fn, query)
+
 def _load_trend_rows() -> List[Dict[str, str]]:
+    if TRENDS_MIN == trend_store.TRENDS_CSV and trend_store.trends_parquet_ready():
+        return trend_store.read_trend_rows()
     rows = []
     with TRENDS_MIN.open("r", encoding="utf-8", newline="") as f:
         rdr = csv.DictReader(f)
@@ -30,20 +51,311 @@ def _csv_bounds(rows) -> tuple[str, str]:
     dates = sorted({r["date"] for r in rows})
     return dates[0], dates[-1]
 
+class TopicStats:
+    """
+    Per-topic stats computed once at load, stored column-wise so enrichment
+    is an index lookup: first/last seen, days seen, years active, longest run
+    of consecutive trending days and how often the topic hit rank 1/2/3.
+
+    The distinct trending days of every topic are also kept as one sorted
+    array of date ordinals (day_ords) with prefix-sum offsets per topic, so
+    days seen / first / last inside any [start, end] window is two binary
+    searches instead of a scan over the topic's dates. That array is as long
+    as the corpus, so the SQLite store (from_topic_days) skips it and answers
+    window queries from the database instead.
+    """
+
+    def __init__(self, rows: Iterable[Dict[str, str]]):
+        per_topic: Dict[str, Dict[int, int]] = {}  # topic -> {date ordinal: best rank}
+        for r in rows:
+            days = per_topic.setdefault(r["topic"], {})
+            o = date.fromisoformat(r["date"]).toordinal()
+            rk = int(r["rank"])
+            days[o] = min(days.get(o, rk), rk)
+        self._build(((t, sorted(days.items())) for t, days in per_topic.items()), keep_days=True)
+
+    @classmethod
+    def from_topic_days(cls, topic_days: Iterable[Tuple[str, List[Tuple[str, int]]]]) -> "TopicStats":
+        """From TrendDB.iter_topic_days(): one topic's (date, best rank) list at a time, no day_ords."""
+        self = cls.__new__(cls)
+        self._build(((t, [(date.fromisoformat(d).toordinal(), rk) for d, rk in days]) for t, days in topic_days),
+                    keep_days=False)
+        return self
+
+    def _build(self, topic_days: Iterable[Tuple[str, List[Tuple[int, int]]]], keep_days: bool):
+        topics: List[str] = []
+        cols: Dict[str, List[int]] = {c: [] for c in ("days_seen", "longest_streak", "streak_start", "first_ord", "last_ord")}
+        rank_hist: List[Tuple[int, int, int]] = []
+        years: List[int] = []
+        year_offsets = [0]
+        day_ords: List[int] = []
+        offsets = [0]
+        for t, days in topic_days:  # days: [(ordinal, best rank)] sorted by ordinal
+            ords = [o for o, _ in days]
+            topics.append(t)
+            best, best_start, run, run_start = 1, ords[0], 1, ords[0]
+            for prev, o in zip(ords, ords[1:]):
+                if o == prev + 1:
+                    run += 1
+                else:
+                    run, run_start = 1, o
+                if run > best:
+                    best, best_start = run, run_start
+            for c, v in zip(cols, (len(ords), best, best_start, ords[0], ords[-1])):
+                cols[c].append(v)
+            rank_hist.append(tuple(sum(rk == n for _, rk in days) for n in (1, 2, 3)))
+            years += sorted({date.fromordinal(o).year for o in ords})
+            year_offsets.append(len(years))
+            if keep_days:
+                day_ords += ords
+                offsets.append(len(day_ords))
+
+        n = len(topics)
+        self.topics = topics
+        self.ids: Dict[str, int] = {t: i for i, t in enumerate(topics)}
+        self.days_seen = np.asarray(cols["days_seen"], dtype=np.int32)
+        self.longest_streak = np.asarray(cols["longest_streak"], dtype=np.int32)
+        self.streak_start = np.asarray(cols["streak_start"], dtype=np.int64)  # ordinal of the longest run's first day
+        self.first_ord = np.asarray(cols["first_ord"], dtype=np.int64)
+        self.last_ord = np.asarray(cols["last_ord"], dtype=np.int64)
+        self.rank_hist = np.asarray(rank_hist, dtype=np.int32).reshape(n, 3)
+        # year_offsets[i]:year_offsets[i+1] is topic i's slice of years
+        self.years = np.asarray(years, dtype=np.int32)
+        self.year_offsets = np.asarray(year_offsets, dtype=np.int64)
+        self.offsets = self.day_ords = self._keys = None
+        if keep_days:
+            # offsets[i]:offsets[i+1] is topic i's slice of day_ords
+            self.offsets = np.asarray(offsets, dtype=np.int64)
+            self.day_ords = np.asarray(day_ords, dtype=np.int64)
+            # (topic id, ordinal) packed into one sorted key so a batch of topics
+            # is searched with a single vectorised searchsorted
+            topic_of = np.repeat(np.arange(n, dtype=np.int64), np.diff(self.offsets))
+            self._keys = (topic_of << 32) | self.day_ords
+
+    ARRAYS = ("days_seen", "longest_streak", "streak_start", "first_ord", "last_ord", "rank_hist",
+              "years", "year_offsets", "offsets", "day_ords", "_keys")
+
+    @classmethod
+    def from_arrays(cls, topics: List[str], arrays: Dict[str, np.ndarray]) -> "TopicStats":
+        """Rebuild from arrays() output (e.g. read-only memory maps from a snapshot)."""
+        self = cls.__new__(cls)
+        self.topics = topics
+        self.ids = {t: i for i, t in enumerate(topics)}
+        for name in cls.ARRAYS:
+            setattr(self, name, arrays.get(name))
+        return self
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        return {name: getattr(self, name) for name in self.ARRAYS if getattr(self, name) is not None}
+
+    def __len__(self) -> int:
+        return len(self.topics)
+
+    def get(self, topic: str) -> Optional[Dict[str, Any]]:
+        i = self.ids.get(topic)
+        if i is None:
+            return None
+        return {
+            "topic": topic,
+            "first_seen": date.fromordinal(int(self.first_ord[i])).isoformat(),
+            "last_seen": date.fromordinal(int(self.last_ord[i])).isoformat(),
+            "days_seen": int(self.days_seen[i]),
+            "years_active": [str(y) for y in self.years[self.year_offsets[i]:self.year_offsets[i + 1]]],
+            "longest_streak": int(self.longest_streak[i]),
+            "longest_streak_start": date.fromordinal(int(self.streak_start[i])).isoformat(),
+            "rank_hist": {"1": int(self.rank_hist[i, 0]), "2": int(self.rank_hist[i, 1]), "3": int(self.rank_hist[i, 2])},
+        }
+
+    def dates(self, topic: str, start: Optional[str] = None, end: Optional[str] = None) -> List[str]:
+        i = self.ids.get(topic)
+        if i is None:
+            return []
+        lo, hi = self.window_bounds(np.array([i]), start, end)
+        return [date.fromordinal(int(o)).isoformat() for o in self.day_ords[lo[0]:hi[0]]]
+
+    def window_bounds(self, ids: np.ndarray, start: Optional[str], end: Optional[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """[lo, hi) positions in day_ords of each topic's days inside [start, end]."""
+        ids = np.asarray(ids, dtype=np.int64) << 32
+        s = date.fromisoformat(start).toordinal() if start else 0
+        e = date.fromisoformat(end).toordinal() if end else (1 << 32) - 1
+        lo = np.searchsorted(self._keys, ids | s, side="left")
+        hi = np.searchsorted(self._keys, ids | e, side="right")
+        return lo, hi
+
+    def window_days(self, topics: List[str], start: Optional[str], end: Optional[str]) -> np.ndarray:
+        """Days seen inside [start, end] per topic (0 for unknown topics)."""
+        ids = np.array([self.ids.get(t, -1) for t in topics], dtype=np.int64)
+        known = ids >= 0
+        out = np.zeros(len(topics), dtype=np.int64)
+        if known.any():
+            lo, hi = self.window_bounds(ids[known], start, end)
+            out[known] = hi - lo
+        return out
+
+    def window_batch(self, topics: List[str], start: Optional[str], end: Optional[str]) -> List[Dict[str, Any]]:
+        """days_seen / first_seen / last_seen restricted to [start, end], per topic."""
+        ids = np.array([self.ids.get(t, -1) for t in topics], dtype=np.int64)
+        lo, hi = self.window_bounds(np.maximum(ids, 0), start, end)
+        out = []
+        for t, i, a, b in zip(topics, ids, lo, hi):
+            if i < 0 or b <= a:
+                out.append({"topic": t, "first_seen": None, "last_seen": None, "days_seen": 0})
+                continue
+            out.append({
+                "topic": t,
+                "first_seen": date.fromordinal(int(self.day_ords[a])).isoformat(),
+                "last_seen": date.fromordinal(int(self.day_ords[b - 1])).isoformat(),
+                "days_seen": int(b - a),
+            })
+        return out
+
+    def window(self, topic: str, start: Optional[str], end: Optional[str]) -> Dict[str, Any]:
+        return self.window_batch([topic], start, end)[0]
+
+
+class RowColumns:
+    """
+    Trend rows as date-sorted columns: day ordinal, rank and topic id (into
+    TopicStats.topics). A window is a searchsorted slice; dicts are only built
+    for the rows a caller actually returns.
+    """
+
+    ARRAYS = ("ords", "ranks", "topic_ids")
+
+    def __init__(self, ords: np.ndarray, ranks: np.ndarray, topic_ids: np.ndarray, topics: List[str]):
+        self.ords, self.ranks, self.topic_ids, self.topics = ords, ranks, topic_ids, topics
+
+    @classmethod
+    def from_rows(cls, rows: List[Dict[str, str]], stats: TopicStats) -> "RowColumns":
+        ords = np.fromiter((date.fromisoformat(r["date"]).toordinal() for r in rows), dtype=np.int32, count=len(rows))
+        order = np.argsort(ords, kind="stable")
+        ranks = np.fromiter((int(r["rank"]) for r in rows), dtype=np.int8, count=len(rows))
+        tids = np.fromiter((stats.ids[r["topic"]] for r in rows), dtype=np.int32, count=len(rows))
+        return cls(ords[order], ranks[order], tids[order], stats.topics)
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        return {name: getattr(self, name) for name in self.ARRAYS}
+
+    def __len__(self) -> int:
+        return len(self.ords)
+
+    def span(self, start: Optional[str], end: Optional[str]) -> Tuple[int, int]:
+        lo = int(np.searchsorted(self.ords, date.fromisoformat(start).toordinal(), side="left")) if start else 0
+        hi = int(np.searchsorted(self.ords, date.fromisoformat(end).toordinal(), side="right")) if end else len(self.ords)
+        return lo, max(lo, hi)
+
+    def row(self, i: int) -> Dict[str, str]:
+        return {"date": _iso_day(int(self.ords[i])), "rank": str(int(self.ranks[i])), "topic": self.topics[int(self.topic_ids[i])]}
+
+    def window(self, start: Optional[str], end: Optional[str]) -> List[Dict[str, str]]:
+        lo, hi = self.span(start, end)
+        return [self.row(i) for i in range(lo, hi)]
+
+
+def _iso_date(v: str) -> str:
+    """Date part of an ISO date or datetime ("2024-10-01T00:00:00.000Z" -> "2024-10-01")."""
+    try:
+        return date.fromisoformat(v).isoformat()
+    except ValueError:
+        return datetime.fromisoformat(v.replace("Z", "+00:00")).date().isoformat()
+
+
+@lru_cache(maxsize=1 << 16)
+def _iso_day(o: int) -> str:
+    return date.fromordinal(o).isoformat()
+
+
+_EMPTY_STATS = {
+    "first_seen": None, "last_seen": None, "days_seen": 0, "years_active": [],
+    "longest_streak": 0, "longest_streak_start": None, "rank_hist": {"1": 0, "2": 0, "3": 0},
+}
+
+
+_index_lock = threading.Lock()
+
+
 class TrendRetriever:
     def __init__(self):
-        self.rows = _load_trend_rows()
-        self.csv_start, self.csv_end = _csv_bounds(self.rows)
+        # TEATIME_STORE=sqlite keeps rows in trends.sqlite instead of Python lists
+        self.db: Optional[trend_db.TrendDB] = trend_db.TrendDB() if trend_db.enabled() else None
         self.emb, self.index = _load_index_and_embs()
-        self.topic_dates: Dict[str, list[str]] = {}
-        for r in self.rows:
-            self.topic_dates.setdefault(r["topic"], []).append(r["date"])
-        for t in self.topic_dates:
-            self.topic_dates[t] = sorted(set(self.topic_dates[t]))
+        self.rows: Optional[RowColumns] = None
+        if self.db is not None:
+            self.csv_start, self.csv_end = self.db.bounds()
+            self.stats = TopicStats.from_topic_days(self.db.iter_topic_days())
+            self.rollups = rollups.load_or_build(self.db.iter_rows, self.db.path)
+            return
+        rows = _load_trend_rows()
+        self.csv_start, self.csv_end = _csv_bounds(rows)
+        self.stats = TopicStats(rows)
+        self.rollups = rollups.load_or_build(lambda: rows, TRENDS_MIN)
+        self.rows = RowColumns.from_rows(rows, self.stats)
+        self._build_keyword_index()
+
+    @classmethod
+    def from_snapshot(cls, path: Optional[Path] = None) -> "TrendRetriever":
+        """
+        A retriever over a snapshot written by snapshot.write: the arrays
+        (normalised embeddings included) are read-only memory maps, so every
+        worker attached to the same snapshot shares one copy via the page cache.
+        """
+        import snapshot
+        snap = snapshot.read(path)
+        self = cls.__new__(cls)
+        self.db = trend_db.TrendDB() if snap.meta["store"] == "sqlite" else None
+        self.csv_start, self.csv_end = snap.meta["csv_start"], snap.meta["csv_end"]
+        self.stats = TopicStats.from_arrays(snap.strings("topics"), snap.group("stats"))
+        self.rows = RowColumns(**snap.group("rows"), topics=self.stats.topics) if self.db is None else None
+        self.rollups = rollups.Rollups(snap.group("rollups"), topics=snap.strings("rollup_topics"))
+        self.emb = snap.arrays.get("emb_normed")
+        self.index = [{"topic": t} for t in snap.strings("index_topics")] if self.emb is not None else None
+        self._emb_src = self._emb_n = self.emb  # already row-normalised; dense search uses it as is
+        if self.db is None:
+            self._build_keyword_index()
+        return self
+
+    def _build_keyword_index(self):
+        # keyword index: every topic lowercased in one newline-joined string,
+        # with start offsets to map a match position back to a topic id
+        lowered = [t.lower() for t in self.stats.topics]
+        self._kw_blob = "\n".join(lowered)
+        self._kw_starts = np.cumsum([0] + [len(t) + 1 for t in lowered[:-1]]).astype(np.int64)
+
+    @property
+    def n_topics(self) -> int:
+        return len(self.stats)
+
+    def topic_stats(self, topic: str) -> Dict[str, Any]:
+        """Precomputed stats for one topic (no date list); zeros if unknown."""
+        return self.stats.get(topic) or {"topic": topic, **_EMPTY_STATS}
+
+    def window_stats(self, topic: str, start: Optional[str], end: Optional[str]) -> Dict[str, Any]:
+        """first_seen / last_seen / days_seen of one topic inside [start, end]."""
+        return self.window_stats_batch([topic], start, end)[0]
+
+    def window_stats_batch(self, topics: List[str], start: Optional[str], end: Optional[str]) -> List[Dict[str, Any]]:
+        if self.db is not None:
+            ws = self.db.window_stats(topics, start, end)
+            return [{"topic": t, "first_seen": ws[t][0], "last_seen": ws[t][1], "days_seen": ws[t][2]} if t in ws
+                    else {"topic": t, "first_seen": None, "last_seen": None, "days_seen": 0} for t in topics]
+        return self.stats.window_batch(topics, start, end)
+
+    def timeline_histogram(self, granularity: str, start: Optional[str], end: Optional[str], top: int = 3) -> List[Dict[str, Any]]:
+        """Row/day counts and top topics per day/week/month/year bucket in [start, end]."""
+        return self.rollups.histogram(granularity, start, end, top)
+
+    def rows_in_window(self, start: Optional[str], end: Optional[str]) -> List[Dict[str, str]]:
+        if self.db is not None:
+            return self.db.rows_in_window(start, end)
+        return self.rows.window(start, end)
     
     def clamp_window(self, start: Optional[str], end: Optional[str]) -> tuple[str, str]:
-        s = start or self.csv_start
-        e = end or self.csv_end
+        """[start, end] as YYYY-MM-DD inside the corpus bounds; ValueError for anything not an ISO date/datetime
+        or for start after end."""
+        s = _iso_date(start) if start else self.csv_start
+        e = _iso_date(end) if end else self.csv_end
+        if start and end and s > e:
+            raise ValueError(f"start {s} is after end {e}")
         return max(s, self.csv_start), min(e, self.csv_end)
     
     @staticmethod
@@ -51,64 +363,206 @@ class TrendRetriever:
         a = a / (np.linalg.norm(a) + 1e-8)
         Bn = B / (np.linalg.norm(B, axis=1, keepdims=True) + 1e-8)
         return Bn @ a
+
+    def _normed_emb(self) -> np.ndarray:
+        """Row-normalised float32 copy of self.emb, computed once per matrix."""
+        if getattr(self, "_emb_src", None) is not self.emb:
+            E = self.emb.astype(np.float32)
+            self._emb_n = E / (np.linalg.norm(E, axis=1, keepdims=True) + 1e-8)
+            self._emb_src = self.emb
+        return self._emb_n
     
     def _filter_by_window(self, topics: List[str], start: Optional[str], end: Optional[str]) -> List[str]:
         if not start and not end:
             return topics
-        s = start or "0000-01-01"
-        e = end or "9999-12-31"
-        out = []
-        for t in topics:
-            ds = self.topic_dates.get(t, [])
-            if any(s <= d <= e for d in ds):
-                out.append(t)
-        return out
+        if self.db is not None:
+            return self.db.topics_in_window(topics, start, end)
+        days = self.stats.window_days(topics, start, end)
+        return [t for t, n in zip(topics, days) if n > 0]
     
     def dense_search(self, q_emb: np.ndarray, k: int = 8, start: Optional[str]=None, end: Optional[str]=None) -> List[Dict[str, Any]]:
         if self.emb is None or self.index is None:
             return []
-        scores = self._cosine(q_emb.astype(np.float32), self.emb.astype(np.float32))
-        order = np.argsort(-scores)
-        prelim = [{"topic": self.index[int(i)]["topic"], "score": float(scores[int(i)])} for i in order[:64]]
-        allowed = set(self._filter_by_window([p["topic"] for p in prelim], start, end))
-        winners = [p for p in prelim if p["topic"] in allowed][:k]
-        return winners
+        return self.dense_search_batch(np.asarray(q_emb, dtype=np.float32)[None, :], k, [(start, end)])[0]
+
+    def dense_search_batch(self, Q: np.ndarray, k: int = 8, windows: Optional[List[Tuple[Optional[str], Optional[str]]]] = None) -> List[List[Dict[str, Any]]]:
+        """dense_search for a (m, dim) matrix of query embeddings in one matmul; windows[i] = (start, end)."""
+        if self.emb is None or self.index is None:
+            return [[] for _ in range(len(Q))]
+        Q = np.asarray(Q, dtype=np.float32)
+        Q = Q / (np.linalg.norm(Q, axis=1, keepdims=True) + 1e-8)
+        S = Q @ self._normed_emb().T
+        n_pre = min(64, S.shape[1])
+        top = np.argpartition(-S, n_pre - 1, axis=1)[:, :n_pre]
+        out = []
+        for qi in range(len(Q)):
+            cand = top[qi][np.argsort(-S[qi, top[qi]], kind="stable")]
+            prelim = [{"topic": self.index[int(i)]["topic"], "score": float(S[qi, int(i)])} for i in cand]
+            start, end = windows[qi] if windows else (None, None)
+            with metrics.span("window_filter"):
+                allowed = set(self._filter_by_window([p["topic"] for p in prelim], start, end))
+            out.append([p for p in prelim if p["topic"] in allowed][:k])
+        return out
     
+    @property
+    def topic_index(self) -> relevance.TopicIndex:
+        """Token index over every corpus topic, built on first use."""
+        if getattr(self, "_topic_index", None) is None:
+            with _index_lock:
+                if getattr(self, "_topic_index", None) is None:
+                    self._topic_index = relevance.TopicIndex(self.stats.topics)
+        return self._topic_index
+
     def keyword_search(self, query: str, k: int = 8, start: Optional[str]=None, end: Optional[str]=None) -> List[Dict[str, Any]]:
-        q = query.lower().split()
-        candidates: Dict[str, int] = {}
-        for r in self.rows:
-            t = r["topic"]; tl = t.lower()
-            if any(tok in tl for tok in q) or (tl.startswith("#") and any(tok in tl[1:] for tok in q)):
-                candidates[t] = max(candidates.get(t, 0), 1)
-        allowed = set(self._filter_by_window(list(candidates.keys()), start, end))
-        items = [{"topic": t, "score": float(candidates[t])} for t in candidates if t in allowed]
+        """
+        Topics sharing words with the query, best first. Candidates are
+        substring hits on the query's words (stopwords and words of 2 chars or
+        less dropped); the score is relevance.TopicIndex's word match
+        (whole-token hits over substring ones) scaled to 0..1.
+        """
+        q = [w for w in relevance.prompt_words(query) if len(w) > 2]
+        if not q or not self.stats.topics:
+            return []
+        if self.db is not None:
+            candidates = self.db.keyword_topics(q, start, end)  # all of them: TopicIndex does the ranking
+        else:
+            pat = re.compile("|".join(re.escape(tok) for tok in sorted(set(q), key=len, reverse=True)))
+            pos = np.fromiter((m.start() for m in pat.finditer(self._kw_blob)), dtype=np.int64)
+            ids = np.unique(np.searchsorted(self._kw_starts, pos, side="right") - 1)
+            with metrics.span("window_filter"):
+                candidates = self._filter_by_window([self.stats.topics[int(i)] for i in ids], start, end)
+        if not candidates:
+            return []
+        scores = self.topic_index.score(candidates, " ".join(q), bonus=False) / ((relevance.W_TOKEN + relevance.W_PARTIAL) * len(set(q)))
+        items = [{"topic": t, "score": round(float(sc), 4)} for t, sc in zip(candidates, scores) if sc > 0]
         items.sort(key=lambda x: (-x["score"], x["topic"]))
         return items[:k]
     
-    def topic_timeline(self, topic: str) -> Dict[str, Any]:
-        dates = self.topic_dates.get(topic, [])
+    def hybrid_search(
+        self,
+        query: str,
+        k: int = 8,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        embed_fn: Optional[Callable[[str], Optional[np.ndarray]]] = None,
+        budget_s: Optional[float] = None,
+        fusion: str = "rrf",
+        dense_weight: float = 0.5,
+    ) -> List[Dict[str, Any]]:
+        """
+        Keyword + dense search fused with reciprocal rank fusion ("rrf") or a
+        weighted score ("weighted"). The query embedding runs on a worker
+        thread while the keyword lookup runs here; if it is not back within
+        budget_s (default TEATIME_HYBRID_BUDGET_MS) or fails, the keyword
+        results are returned alone; budget_s=0 skips the embedding. Each hit carries "via": dense/keyword/both.
+        """
+        t0 = time.perf_counter()
+        budget = HYBRID_BUDGET_S if budget_s is None else budget_s
+        fut = None
+        if budget <= 0:
+            metrics.degraded("embed_budget")
+        elif self.emb is not None:
+            if embed_fn is None:
+                embed_fn = _default_embed
+            fut = submit_embed(embed_fn, query)
+        pool = max(k * 2, 16)
+        with metrics.span("keyword_search"):
+            kw = self.keyword_search(query, k=pool, start=start, end=end)
+
+        dense: List[Dict[str, Any]] = []
+        if fut is not None:
+            try:
+                q_emb = fut.result(timeout=max(0.0, budget - (time.perf_counter() - t0)))
+                if q_emb is None:
+                    metrics.degraded("embed_error")
+            except FutureTimeout:
+                q_emb = None
+                metrics.degraded("embed_budget")
+            except Exception:
+                q_emb = None
+                metrics.degraded("embed_error")
+            if q_emb is not None:
+                with metrics.span("dense_search"):
+                    dense = self.dense_search(q_emb, k=pool, start=start, end=end)
+        if not dense:
+            return [{**it, "via": "keyword"} for it in kw[:k]]
+        return _fuse(dense, kw, k, fusion, dense_weight)
+
+    def hybrid_search_batch(
+        self,
+        queries: List[str],
+        q_embs: Optional[List[Optional[np.ndarray]]],
+        k: int = 8,
+        windows: Optional[List[Tuple[Optional[str], Optional[str]]]] = None,
+        fusion: str = "rrf",
+        dense_weight: float = 0.5,
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        hybrid_search for many queries whose embeddings were fetched up front
+        (one embeddings call per batch); q_embs[i] None -> keyword-only.
+        """
+        windows = windows or [(None, None)] * len(queries)
+        pool = max(k * 2, 16)
+        have = [i for i, e in enumerate(q_embs or []) if e is not None]
+        dense: Dict[int, List[Dict[str, Any]]] = {}
+        if have and self.emb is not None:
+            with metrics.span("dense_search"):
+                res = self.dense_search_batch(np.stack([q_embs[i] for i in have]), pool, [windows[i] for i in have])
+            dense = dict(zip(have, res))
+        out = []
+        for i, q in enumerate(queries):
+            kw = self.keyword_search(q, k=pool, start=windows[i][0], end=windows[i][1])
+            if dense.get(i):
+                out.append(_fuse(dense[i], kw, k, fusion, dense_weight))
+            else:
+                out.append([{**it, "via": "keyword"} for it in kw[:k]])
+        return out
+
+    def topic_timeline(self, topic: str, start: Optional[str]=None, end: Optional[str]=None) -> Dict[str, Any]:
+        """Trending days of a topic; with a window, only the days inside it."""
+        dates = self.db.topic_dates(topic, start, end) if self.db is not None else self.stats.dates(topic, start, end)
         if not dates:
             return {"topic": topic, "first_seen": None, "last_seen": None, "days_seen": 0, "dates": []}
         return {"topic": topic, "first_seen": dates[0], "last_seen": dates[-1], "days_seen": len(dates), "dates": dates}
 
 
-# Global retriever instance
-_retriever: Optional[TrendRetriever] = None
+def _default_embed(q: str) -> Optional[np.ndarray]:
+    from llm_client import embed_texts  # imported lazily: only hybrid_search needs the network
+    try:
+        with metrics.span("embed"):
+            return np.asarray(embed_texts([q])[0], dtype=np.float32)
+    except Exception:
+        return None
+
+
+def _fuse(dense: List[Dict[str, Any]], kw: List[Dict[str, Any]], k: int, fusion: str, dense_weight: float) -> List[Dict[str, Any]]:
+    scores: Dict[str, float] = {}
+    via: Dict[str, set] = {}
+    for name, hits in (("dense", dense), ("keyword", kw)):
+        w = dense_weight if name == "dense" else 1.0 - dense_weight
+        for rank, it in enumerate(hits):
+            t = it["topic"]
+            if fusion == "weighted":
+                scores[t] = scores.get(t, 0.0) + w * float(it.get("score", 0.0))
+            else:
+                scores[t] = scores.get(t, 0.0) + 1.0 / (RRF_K + rank + 1)
+            via.setdefault(t, set()).add(name)
+    ranked = sorted(scores.items(), key=lambda kv: (-kv[1], kv[0]))[:k]
+    return [{"topic": t, "score": sc, "via": "both" if len(via[t]) == 2 else next(iter(via[t]))} for t, sc in ranked]
+
 
 def get_retriever() -> TrendRetriever:
-    """Lazy-load the global retriever instance"""
-    global _retriever
-    if _retriever is None:
-        _retriever = TrendRetriever()
-    return _retriever
+    """The process-wide retriever (see engine.get_engine)."""
+    import engine  # engine imports this module
+    return engine.get_engine().R
 
 
 def retrieve_topics(
     query: str,
     start_date: Optional[date] = None,
     end_date: Optional[date] = None,
-    top_k: int = 10
+    top_k: int = 10,
+    mode: str = "keyword",
 ) -> List[Dict[str, Any]]:
     """
     Main API function to retrieve topics based on a query and optional date range.
@@ -118,6 +572,8 @@ def retrieve_topics(
         start_date: Optional start date filter
         end_date: Optional end date filter
         top_k: Number of results to return
+        mode: "keyword" (local only), or "hybrid" to add a query embedding
+            call (see hybrid_search)
     
     Returns:
         List of topic dictionaries with 'topic', 'date', 'year', etc.
@@ -128,19 +584,14 @@ def retrieve_topics(
     start_str = start_date.isoformat() if start_date else None
     end_str = end_date.isoformat() if end_date else None
     
-    # Try keyword search first (simpler, no embeddings needed)
-    results = retriever.keyword_search(query, k=top_k, start=start_str, end=end_str)
+    if mode == "hybrid":
+        results = retriever.hybrid_search(query, k=top_k, start=start_str, end=end_str)
+    else:
+        results = retriever.keyword_search(query, k=top_k, start=start_str, end=end_str)
     
     # If no results, try getting all topics in date range
     if not results:
-        filtered_rows = []
-        for r in retriever.rows:
-            row_date = r["date"]
-            if start_str and row_date < start_str:
-                continue
-            if end_str and row_date > end_str:
-                continue
-            filtered_rows.append(r)
+        filtered_rows = retriever.rows_in_window(start_str, end_str)
         
         # Get unique topics, prioritize by rank
         seen = set()
@@ -160,17 +611,21 @@ def retrieve_topics(
     
     # Enrich results with date and year info
     enriched = []
-    for r in results:
+    windowed = retriever.window_stats_batch([r["topic"] for r in results], start_str, end_str)
+    for r, w in zip(results, windowed):
         topic = r["topic"]
-        timeline = retriever.topic_timeline(topic)
+        # all-time stats, with first/last/days_seen narrowed to the window
+        st = {**retriever.topic_stats(topic), **w}
         enriched.append({
             "topic": topic,
-            "date": timeline.get("first_seen", ""),
-            "year": timeline.get("first_seen", "")[:4] if timeline.get("first_seen") else "",
+            "date": st["first_seen"] or "",
+            "year": st["first_seen"][:4] if st["first_seen"] else "",
             "score": r.get("score", 1.0),
-            "days_seen": timeline.get("days_seen", 0),
-            "first_seen": timeline.get("first_seen"),
-            "last_seen": timeline.get("last_seen"),
+            "days_seen": st["days_seen"],
+            "first_seen": st["first_seen"],
+            "last_seen": st["last_seen"],
+            "longest_streak": st["longest_streak"],
+            "rank_hist": st["rank_hist"],
         })
     
     return enriched[:top_k]
\ No newline at end of file
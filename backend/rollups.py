@@ -0,0 +1,183 @@
+# rollups.py
+"""
+Pre-aggregated timeline rollups for the scrubber in Timeline.jsx.
+
+For each granularity (day/week/month/year) we keep the sorted bucket start
+ordinals and the top topics per bucket; row/day counts come from per-day
+prefix sums, so any [start, end] window is a few binary searches and the
+edge buckets clipped by the window still get exact counts.
+
+Topic score inside a bucket = sum of (4 - rank) over its rows, so a day at
+#1 outweighs a day at #3. Weeks start on Monday.
+
+The arrays are cached in data/trends_rollups.npz and rebuilt when the
+trends CSV (or trends.sqlite) is newer than the cache:
+
+    python rollups.py build
+"""
+from __future__ import annotations
+import logging, sys, time
+from collections import Counter
+from datetime import date
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+DATA_DIR = Path("data")
+ROLLUPS_PATH = DATA_DIR / "trends_rollups.npz"
+
+log = logging.getLogger("teatime.rollups")
+
+GRANULARITIES = ("day", "week", "month", "year")
+TOP_K = 5
+_EPOCH = date(1970, 1, 1).toordinal()
+
+
+def _bucket_starts(ords: np.ndarray, g: str) -> np.ndarray:
+    if g == "day":
+        return ords
+    if g == "week":
+        return ords - (ords - 1) % 7  # ordinal 1 (0001-01-01) is a Monday
+    d = (ords - _EPOCH).astype("datetime64[D]")
+    unit = "datetime64[M]" if g == "month" else "datetime64[Y]"
+    return d.astype(unit).astype("datetime64[D]").astype(np.int64) + _EPOCH
+
+
+def _bucket_ends(starts: np.ndarray, g: str) -> np.ndarray:
+    if g == "day":
+        return starts
+    if g == "week":
+        return starts + 6
+    d = (starts - _EPOCH).astype("datetime64[D]")
+    unit = "datetime64[M]" if g == "month" else "datetime64[Y]"
+    nxt = d.astype(unit) + 1
+    return nxt.astype("datetime64[D]").astype(np.int64) + _EPOCH - 1
+
+
+def _iso(o) -> str:
+    return date.fromordinal(int(o)).isoformat()
+
+
+class Rollups:
+    def __init__(self, arrays: Dict[str, np.ndarray], topics: Optional[List[str]] = None):
+        self.a = arrays
+        self.topics: List[str] = topics if topics is not None else arrays["topics"].tolist()
+        self.day_ord = arrays["day_ord"]
+        self.row_cum = arrays["row_cum"]
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Dict[str, str]]) -> "Rollups":
+        topic_id: Dict[str, int] = {}
+        per_day: Dict[int, Counter] = {}
+        day_rows: Counter = Counter()
+        for r in rows:
+            o = date.fromisoformat(r["date"]).toordinal()
+            tid = topic_id.setdefault(r["topic"], len(topic_id))
+            per_day.setdefault(o, Counter())[tid] += 4 - int(r["rank"])
+            day_rows[o] += 1
+
+        day_ord = np.array(sorted(per_day), dtype=np.int64)
+        a: Dict[str, np.ndarray] = {
+            "topics": np.array(list(topic_id), dtype=str),
+            "day_ord": day_ord,
+            "row_cum": np.concatenate([[0], np.cumsum([day_rows[o] for o in day_ord])]).astype(np.int64),
+        }
+        for g in GRANULARITIES:
+            starts_per_day = _bucket_starts(day_ord, g)
+            starts, first_day = np.unique(starts_per_day, return_index=True)
+            bounds = list(first_day) + [len(day_ord)]
+            top_ids = np.full((len(starts), TOP_K), -1, dtype=np.int32)
+            top_scores = np.zeros((len(starts), TOP_K), dtype=np.int32)
+            for b in range(len(starts)):
+                score: Counter = Counter()
+                for o in day_ord[bounds[b]:bounds[b + 1]]:
+                    score.update(per_day[int(o)])
+                best = sorted(score.items(), key=lambda kv: (-kv[1], kv[0]))[:TOP_K]
+                for j, (tid, sc) in enumerate(best):
+                    top_ids[b, j], top_scores[b, j] = tid, sc
+            a[f"{g}_start"] = starts
+            a[f"{g}_top"] = top_ids
+            a[f"{g}_score"] = top_scores
+        return cls(a)
+
+    def save(self, path: Path = ROLLUPS_PATH):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp.npz")
+        np.savez(tmp, **self.a)
+        tmp.replace(path)
+
+    @classmethod
+    def load(cls, path: Path = ROLLUPS_PATH) -> "Rollups":
+        with np.load(path, allow_pickle=False) as z:
+            return cls({k: z[k] for k in z.files})
+
+    def histogram(self, granularity: str, start: Optional[str], end: Optional[str], top: int = 3) -> List[Dict[str, Any]]:
+        """Buckets overlapping [start, end] that have data, oldest first."""
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"granularity must be one of {GRANULARITIES}")
+        if not len(self.day_ord):
+            return []
+        s = date.fromisoformat(start).toordinal() if start else int(self.day_ord[0])
+        e = date.fromisoformat(end).toordinal() if end else int(self.day_ord[-1])
+        if e < s:
+            return []
+        starts = self.a[f"{granularity}_start"]
+        lo = max(int(np.searchsorted(starts, s, side="right")) - 1, 0)
+        hi = int(np.searchsorted(starts, e, side="right"))
+        b_start = starts[lo:hi]
+        b_end = _bucket_ends(b_start, granularity)
+        c_start = np.maximum(b_start, s)
+        c_end = np.minimum(b_end, e)
+        d_lo = np.searchsorted(self.day_ord, c_start, side="left")
+        d_hi = np.searchsorted(self.day_ord, c_end, side="right")
+        rows = self.row_cum[d_hi] - self.row_cum[d_lo]
+        top_ids = self.a[f"{granularity}_top"][lo:hi, :max(0, min(top, TOP_K))]
+        top_scores = self.a[f"{granularity}_score"][lo:hi]
+
+        out = []
+        for i in range(len(b_start)):
+            if d_hi[i] <= d_lo[i]:
+                continue
+            out.append({
+                "start": _iso(b_start[i]),
+                "end": _iso(b_end[i]),
+                "rows": int(rows[i]),
+                "days": int(d_hi[i] - d_lo[i]),
+                # top topics are for the whole bucket, even when the window clips it
+                "partial": bool(c_start[i] > b_start[i] or c_end[i] < b_end[i]),
+                "top": [{"topic": self.topics[t], "score": int(top_scores[i, j])}
+                        for j, t in enumerate(top_ids[i]) if t >= 0],
+            })
+        return out
+
+
+def load_or_build(rows_fn, source: Optional[Path], path: Path = ROLLUPS_PATH) -> Rollups:
+    """Cached rollups if newer than `source`, else rebuilt from rows_fn() and saved."""
+    if path.exists() and (source is None or not source.exists() or path.stat().st_mtime >= source.stat().st_mtime):
+        try:
+            return Rollups.load(path)
+        except Exception as ex:
+            log.warning("could not read %s: %s; rebuilding", path, ex)
+    r = Rollups.from_rows(rows_fn())
+    try:
+        r.save(path)
+    except OSError as ex:
+        log.warning("could not write %s: %s", path, ex)
+    return r
+
+
+if __name__ == "__main__":
+    import argparse
+    from retriever import TRENDS_MIN, _load_trend_rows
+    ap = argparse.ArgumentParser(description="Build the timeline rollup cache from trends_min_us.csv.")
+    ap.add_argument("cmd", choices=["build"])
+    args = ap.parse_args()
+    if not TRENDS_MIN.exists():
+        print(f"Missing {TRENDS_MIN}")
+        sys.exit(2)
+    t0 = time.perf_counter()
+    r = Rollups.from_rows(_load_trend_rows())
+    r.save()
+    print(f"✅ Wrote {ROLLUPS_PATH} ({len(r.day_ord)} days, {len(r.topics)} topics) in {time.perf_counter() - t0:.2f}s")
+    sys.exit(0)
@@ -0,0 +1,189 @@
+# sanitize.py
+"""
+ASCII-only response text (PowerShell-safe).
+
+to_ascii(text) gives what the old NFKD + regex + encode/decode pipeline did,
+without touching the Unicode normaliser on the hot path:
+
+- ASCII passes through; only runs of non-ASCII characters are rewritten,
+  and each distinct run's result is memoised (replies repeat the same few:
+  "’", " — ", "é")
+- within a run, en/em dashes (and their compatibility forms) collapse to one
+  "-", and every other character goes through one str.translate table:
+  common punctuation with no NFKD decomposition (smart quotes, primes,
+  guillemets, hyphen/minus/figure dash) maps to its ASCII look-alike instead
+  of being dropped, anything else to the ASCII part of its NFKD decomposition
+  ("é" -> "e", "ﬁ" -> "fi", "…" -> "...", emoji -> ""). Table entries are
+  computed the first time a character shows up.
+- 3+ newlines collapse to a blank line; leading/trailing whitespace goes
+
+    python sanitize.py check [responses.jsonl ...]   # equivalence vs the old pipeline + timings
+
+tests/test_sanitize.py runs the same equivalence checks.
+"""
+from __future__ import annotations
+import re, unicodedata
+from typing import Dict, Union
+
+# ASCII stand-ins for punctuation NFKD leaves alone (the old sanitizer dropped these)
+PUNCT = {
+    "‘": "'", "’": "'", "‚": "'", "‛": "'", "′": "'", "‵": "'",
+    "‹": "'", "›": "'",
+    "“": '"', "”": '"', "„": '"', "‟": '"', "″": '"', "‶": '"',
+    "«": '"', "»": '"',
+    "‐": "-", "‑": "-", "‒": "-", "―": "-", "⁃": "-", "−": "-",
+    "…": "...",
+}
+# every codepoint whose NFKD is an en or em dash (none decompose to a dash plus something else)
+DASHES = "–—︱︲﹘"
+_TABLE_MAX = 65536
+_RUNS_MAX = 4096
+
+_dash_re = re.compile(f"[{DASHES}]+")
+_nonascii_re = re.compile(r"[^\x00-\x7f]+")
+_multi_blank_re = re.compile(r"\n{3,}")
+
+
+def _nfkd_ascii(c: str) -> str:
+    return unicodedata.normalize("NFKD", c).encode("ascii", "ignore").decode("ascii")
+
+
+TABLE: Dict[int, Union[int, str]] = {i: i for i in range(128)}
+TABLE.update({ord(k): v for k, v in PUNCT.items()})
+for _cp in range(0x80, 0x250):  # Latin-1 and Latin Extended up front; the rest on first sight
+    TABLE.setdefault(_cp, _nfkd_ascii(chr(_cp)))
+
+
+def _translate(t: str) -> str:
+    t = _dash_re.sub("-", t).translate(TABLE)
+    if not t.isascii():
+        # characters not in the table yet pass through untouched; learn them and go again
+        new = {ord(c) for c in set(t) if c > "\x7f"}
+        for cp in new:
+            if len(TABLE) < _TABLE_MAX:  # arbitrary user text can't grow it without bound
+                TABLE[cp] = _nfkd_ascii(chr(cp))
+        t = t.translate(TABLE)
+        if not t.isascii():
+            t = "".join(c if c < "\x80" else _nfkd_ascii(c) for c in t)
+    return t
+
+
+_RUNS: Dict[str, str] = {}
+
+
+def _run(m: "re.Match[str]") -> str:
+    run = m.group()
+    out = _RUNS.get(run)
+    if out is None:
+        out = _translate(run)
+        if len(_RUNS) < _RUNS_MAX:
+            _RUNS[run] = out
+    return out
+
+
+def to_ascii(text: str) -> str:
+    if not isinstance(text, str):
+        return ""
+    t = text if text.isascii() else _nonascii_re.sub(_run, text)
+    if "\n\n\n" in t:
+        t = _multi_blank_re.sub("\n\n", t)
+    return t.strip()
+
+
+def _legacy(text: str) -> str:
+    """The pre-table sanitizer, kept as the reference for `check`."""
+    t = unicodedata.normalize("NFKD", text)
+    t = re.sub(r"[–—]+", "-", t)
+    t = t.encode("ascii", "ignore").decode("ascii")
+    t = _multi_blank_re.sub("\n\n", t)
+    return t.strip()
+
+
+_REMAP = str.maketrans(PUNCT)
+
+
+def _expected(text: str) -> str:
+    # the old output, except that PUNCT characters now map instead of vanishing
+    return _legacy(text.translate(_REMAP))
+
+
+def _corpus(n: int, seed: int = 0):
+    import random
+    rng = random.Random(seed)
+    bits = ["Hot take from the timeline:", "Trending brain says:", "the feed is “big mad”", "don’t",
+            "it’s giving ‘main character’", "—", "–", "——", " — ", "…",
+            "café", "naïve", "Beyoncé", "Pokémon", "\U0001F525", "\U0001F480\U0001F480",
+            "中文", "é", " ", "ＡＢＣ", "ﬁre", "x²", "½",
+            "«", "»", "−", "‐", "″", "\n", "\n\n\n\n", "\r\n", "\t", "  ",
+            "2019-2020", "(12 days)", "Confidence: Low/Medium/High — vibes-only, not facts."]
+    words = "the timeline says this is happening loudly with memes and vibes only not facts".split()
+    out = []
+    for _ in range(n):
+        parts = [rng.choice([" ", "\n", ""])]
+        for _ in range(rng.randint(20, 120)):
+            parts.append(rng.choice(bits) if rng.random() < 0.3 else rng.choice(words))
+            parts.append(rng.choice([" ", " ", " ", "", "\n"]))
+        out.append("".join(parts))
+    return out
+
+
+def check(paths=(), n: int = 400) -> bool:
+    """Equivalence on every codepoint, a synthetic corpus and any saved responses; then timings."""
+    import json, time
+    from pathlib import Path
+
+    bad = 0
+    warm = dict(TABLE)
+    for cp in range(0x110000):
+        if 0xD800 <= cp < 0xE000:
+            continue
+        c = chr(cp)
+        for s in (f"a{c}b", f"a{c}{c}b", f"{c}—{c}"):
+            if to_ascii(s) != _expected(s):
+                bad += 1
+                if bad <= 5:
+                    print(f"  codepoint U+{cp:04X}: {to_ascii(s)!r} != {_expected(s)!r}")
+    print(("✅" if not bad else "❌") + f" per-codepoint: {bad} mismatches")
+    TABLE.clear()
+    TABLE.update(warm)  # the sweep filled the table to its cap; time from a normal one
+    _RUNS.clear()
+
+    texts = _corpus(n)
+    for p in paths:
+        lines = Path(p).read_text(encoding="utf-8").splitlines()
+        for line in lines:
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError:
+                texts.append("\n".join(lines))
+                break
+            if isinstance(row, dict):
+                texts += [row[k] for k in ("raw", "text", "message", "prophecy") if isinstance(row.get(k), str)]
+    one = sum(to_ascii(t) != _expected(t) for t in texts)
+    print(("✅" if not one else "❌") + f" one-shot: {one}/{len(texts)} responses differ")
+
+    def per_call(fn, items, reps=5):
+        best = float("inf")
+        for _ in range(reps):
+            t0 = time.perf_counter()
+            for x in items:
+                fn(x)
+            best = min(best, time.perf_counter() - t0)
+        return best / len(items) * 1e6
+
+    ascii_texts = [_legacy(t) for t in texts]
+    typical = [t.replace("dont", "don’t").replace(" - ", " — ") for t in ascii_texts]  # a few curly quotes and dashes
+    print(f"  dense non-ASCII ({len(texts)}):  legacy {per_call(_legacy, texts):.1f}us  to_ascii {per_call(to_ascii, texts):.1f}us")
+    print(f"  typical response:       legacy {per_call(_legacy, typical):.1f}us  to_ascii {per_call(to_ascii, typical):.1f}us")
+    print(f"  ASCII-only response:    legacy {per_call(_legacy, ascii_texts):.1f}us  to_ascii {per_call(to_ascii, ascii_texts):.1f}us")
+    return not (bad or one)
+
+
+if __name__ == "__main__":
+    import argparse, sys
+    ap = argparse.ArgumentParser(description="ASCII sanitizer tools.")
+    ap.add_argument("cmd", choices=["check"])
+    ap.add_argument("paths", nargs="*", help="saved responses: JSONL with raw/text/message/prophecy fields, or plain text")
+    ap.add_argument("--n", type=int, default=400, help="synthetic responses to generate")
+    args = ap.parse_args()
+    sys.exit(0 if check(args.paths, args.n) else 1)
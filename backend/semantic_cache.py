@@ -0,0 +1,170 @@
+# semantic_cache.py
+"""
+Semantic response cache for /brew: paraphrases ("will AI take my job" vs
+"is AI taking jobs") reuse a stored generation instead of a new LLM call.
+
+Entries are (question embedding, answer) pairs in one in-memory ring buffer
+of TEATIME_SEMANTIC_ITEMS rows, tagged with a partition id for
+(mode, window, k) so answers never cross modes or windows (ids of
+partitions with no rows left in the ring are dropped). A lookup is one
+masked matrix-vector product against the partition's unit-normalised rows;
+the best match is reused when cosine >= TEATIME_SEMANTIC_THRESHOLD and it
+is younger than TEATIME_SEMANTIC_TTL_S. TEATIME_SEMANTIC_CACHE=0 turns it off.
+
+Tuning: every lookup's best similarity goes into teatime_semantic_similarity
+(hits and misses alike) and hits/misses into teatime_cache_requests_total
+{cache="semantic"}. To try thresholds offline against real traffic:
+
+    TEATIME_QUERY_LOG=logs/query_log.jsonl uvicorn app:app   # collect questions
+    python semantic_cache.py tune [--log logs/query_log.jsonl]
+"""
+from __future__ import annotations
+import os, threading, time
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+import metrics
+
+ENABLED = os.getenv("TEATIME_SEMANTIC_CACHE", "1").lower() not in ("0", "false", "no")
+THRESHOLD = float(os.getenv("TEATIME_SEMANTIC_THRESHOLD", "0.92"))
+MAX_ITEMS = int(os.getenv("TEATIME_SEMANTIC_ITEMS", "2048"))
+TTL_S = float(os.getenv("TEATIME_SEMANTIC_TTL_S", "3600"))
+
+
+class SemanticCache:
+    def __init__(self, max_items: int = MAX_ITEMS, threshold: float = THRESHOLD, ttl: float = TTL_S):
+        self.max_items, self.threshold, self.ttl = max(1, max_items), threshold, ttl
+        self._lock = threading.Lock()
+        self._reset(0)
+
+    def _reset(self, dim: int):
+        self.dim = dim
+        self._E = np.zeros((self.max_items, dim), dtype=np.float32)
+        self._part = np.full(self.max_items, -1, dtype=np.int64)
+        self._expires = np.zeros(self.max_items, dtype=np.float64)
+        self._vals: List[Optional[Tuple[str, Any]]] = [None] * self.max_items
+        self._next = 0
+        self._parts: Dict[Hashable, int] = {}
+        self._next_pid = 0
+
+    def __len__(self) -> int:
+        return int((self._part >= 0).sum())
+
+    @staticmethod
+    def _unit(emb: np.ndarray) -> np.ndarray:
+        v = np.asarray(emb, dtype=np.float32).ravel()
+        return v / (np.linalg.norm(v) + 1e-8)
+
+    def lookup(self, emb: np.ndarray, part: Hashable) -> Optional[Tuple[Any, str, float]]:
+        """(answer, original question, similarity) of the closest live entry in `part` above the threshold."""
+        q = self._unit(emb)
+        with self._lock:
+            pid = self._parts.get(part)
+            best, sim = -1, -1.0
+            if pid is not None and q.shape[0] == self.dim:
+                idx = np.flatnonzero((self._part == pid) & (self._expires > time.monotonic()))
+                if len(idx):
+                    sims = self._E[idx] @ q
+                    j = int(np.argmax(sims))
+                    best, sim = int(idx[j]), float(sims[j])
+            hit = best >= 0 and sim >= self.threshold
+            val = self._vals[best] if hit else None
+        if best >= 0:
+            metrics.semantic_similarity(sim)
+        metrics.cache_event("semantic", hit)
+        if not hit or val is None:
+            return None
+        return val[1], val[0], sim
+
+    def add(self, emb: np.ndarray, part: Hashable, question: str, answer: Any):
+        q = self._unit(emb)
+        with self._lock:
+            if q.shape[0] != self.dim:
+                self._reset(q.shape[0])  # new embedding model; old vectors are not comparable
+            i = self._next % self.max_items  # ring buffer: the oldest entry goes first
+            self._part[i] = -1
+            pid = self._parts.get(part)
+            if pid is None:
+                if len(self._parts) >= self.max_items:
+                    # more ids than rows: forget partitions whose rows have all been overwritten
+                    live = set(np.unique(self._part).tolist())
+                    self._parts = {p: j for p, j in self._parts.items() if j in live}
+                pid = self._parts[part] = self._next_pid
+                self._next_pid += 1
+            self._E[i], self._part[i], self._expires[i] = q, pid, time.monotonic() + self.ttl
+            self._vals[i] = (question, answer)
+            self._next += 1
+
+    def clear(self):
+        with self._lock:
+            self._reset(self.dim)
+
+
+CACHE = SemanticCache()
+
+
+def tune(log_path: Optional[str] = None, thresholds=(0.8, 0.85, 0.88, 0.9, 0.92, 0.94, 0.96, 0.98)) -> Dict[str, Any]:
+    """
+    Replay logged /brew questions in order through a fresh cache (no threshold)
+    and report, per threshold, the share of questions that would have been a
+    hit, plus sample pairs near the current threshold to eyeball.
+    """
+    import json
+    from pathlib import Path
+    import query_log
+    from llm_client import embed_texts
+
+    path = Path(log_path) if log_path else query_log.LOG.path
+    if path is None or not path.exists():
+        return {"questions": 0}
+    entries = []
+    with path.open("r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                e = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if e.get("endpoint") == "brew" and e.get("q"):
+                entries.append(e)
+    if not entries:
+        return {"questions": 0}
+    uniq = list(dict.fromkeys(e["q"] for e in entries))
+    vecs: Dict[str, np.ndarray] = {}
+    for i in range(0, len(uniq), 128):
+        for q, v in zip(uniq[i:i + 128], embed_texts(uniq[i:i + 128])):
+            vecs[q] = np.asarray(v, dtype=np.float32)
+
+    sc = SemanticCache(max_items=MAX_ITEMS, threshold=-1.0, ttl=float("inf"))
+    best: List[float] = []
+    near: List[Tuple[float, str, str]] = []
+    seen = set()
+    for e in entries:
+        part = (e.get("mode") or "wacky", e.get("start"), e.get("end"), e.get("k"))
+        if (e["q"], part) in seen:
+            continue  # exact repeats are the exact-match cache's job
+        seen.add((e["q"], part))
+        m = sc.lookup(vecs[e["q"]], part)
+        if m is not None:
+            best.append(m[2])
+            if abs(m[2] - THRESHOLD) < 0.03:
+                near.append((round(m[2], 3), e["q"], m[1]))
+        sc.add(vecs[e["q"]], part, e["q"], e["q"])
+    n = len(seen)
+    b = np.asarray(best)
+    return {
+        "questions": n,
+        "hit_rate": {str(t): round(float((b >= t).sum()) / n, 3) for t in thresholds},
+        "near_threshold": sorted(near, reverse=True)[:20],
+    }
+
+
+if __name__ == "__main__":
+    import argparse, json, sys
+    ap = argparse.ArgumentParser(description="Semantic cache tools.")
+    ap.add_argument("cmd", choices=["tune"])
+    ap.add_argument("--log", default=None, help="query log JSONL (default TEATIME_QUERY_LOG)")
+    args = ap.parse_args()
+    res = tune(args.log)
+    print(json.dumps(res, indent=2, ensure_ascii=False))
+    sys.exit(0 if res["questions"] else 1)
@@ -0,0 +1,153 @@
+# serve.py
+"""
+Multi-worker serving on one shared corpus.
+
+    python serve.py --workers 4 [--host 127.0.0.1] [--port 8000] [--app app:app]
+
+The parent builds (or refreshes) the read-only snapshot in data/snapshot/
+once, then starts uvicorn workers with TEATIME_SNAPSHOT pointing at it. Each
+worker's engine memory-maps the same files (see snapshot.py), so another
+worker costs its Python heap, not another copy of the corpus and embedding
+matrix. --no-snapshot keeps the old behaviour: every worker loads its own
+TrendRetriever from the CSV / embedding files.
+
+    python serve.py compare --workers 4 --scale 10 [--dim 256]
+
+runs both modes on a bench corpus (bench.make_corpus) against a local stub
+upstream: time until every worker has finished startup, then per-worker
+RSS / PSS / private memory after a round of /search traffic. PSS splits
+shared pages between the processes mapping them, so sum(PSS) is what the
+workers really cost together. Linux only (/proc).
+"""
+from __future__ import annotations
+import json, os, socket, subprocess, sys, threading, time
+from pathlib import Path
+from typing import Any, Dict, List
+
+BACKEND = Path(__file__).resolve().parent
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _children(pid: int) -> List[int]:
+    out = []
+    for d in Path("/proc").iterdir():
+        if d.name.isdigit():
+            try:
+                stat = (d / "stat").read_text()
+            except OSError:
+                continue
+            if int(stat.rsplit(")", 1)[1].split()[1]) == pid:
+                out.append(int(d.name))
+    return out
+
+
+def _mem(pid: int) -> Dict[str, float]:
+    """RSS / PSS / private (USS) in MB from /proc/<pid>/smaps_rollup."""
+    kb: Dict[str, int] = {}
+    for line in Path(f"/proc/{pid}/smaps_rollup").read_text().splitlines()[1:]:
+        k, v = line.split(":", 1)
+        kb[k] = int(v.split()[0])
+    return {
+        "rss_mb": round(kb.get("Rss", 0) / 1024, 1),
+        "pss_mb": round(kb.get("Pss", 0) / 1024, 1),
+        "private_mb": round((kb.get("Private_Clean", 0) + kb.get("Private_Dirty", 0)) / 1024, 1),
+    }
+
+
+def serve(app: str, host: str, port: int, workers: int, use_snapshot: bool = True):
+    import uvicorn
+    if use_snapshot:
+        import snapshot
+        os.environ["TEATIME_SNAPSHOT"] = str(snapshot.ensure().resolve())
+    else:
+        os.environ.pop("TEATIME_SNAPSHOT", None)
+    uvicorn.run(app, host=host, port=port, workers=workers, app_dir=str(BACKEND))
+
+
+def _run_mode(root: Path, workers: int, use_snapshot: bool, stub_url: str, requests_per_worker: int) -> Dict[str, Any]:
+    import requests
+    port = _free_port()
+    env = {**os.environ, "OPENROUTER_API_KEY": "stub", "OPENROUTER_BASE_URL": stub_url,
+           "TEATIME_QUERY_LOG": "", "TEATIME_WARMUP_TOP": "0", "PYTHONUNBUFFERED": "1"}
+    cmd = [sys.executable, str(BACKEND / "serve.py"), "--workers", str(workers), "--port", str(port)]
+    if not use_snapshot:
+        cmd.append("--no-snapshot")
+    if use_snapshot:
+        # the snapshot is built once up front, like a deploy step; startup below is attach time
+        subprocess.run([sys.executable, str(BACKEND / "snapshot.py"), "build"], cwd=root, env=env,
+                       check=True, stdout=subprocess.DEVNULL)
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(cmd, cwd=root, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    ready = threading.Event()
+    started: List[float] = []
+
+    def watch():
+        for line in proc.stdout:
+            if "Application startup complete" in line:
+                started.append(time.perf_counter() - t0)
+                if len(started) == workers:
+                    ready.set()
+
+    threading.Thread(target=watch, daemon=True).start()
+    try:
+        if not ready.wait(600):
+            raise RuntimeError(f"workers did not start ({len(started)}/{workers})")
+        startup_s = started[-1]
+        url = f"http://127.0.0.1:{port}"
+        for i in range(requests_per_worker * workers):
+            requests.post(f"{url}/search", json={"query": f"taylor swift nba {i}", "k": 10}, timeout=60).raise_for_status()
+        time.sleep(0.5)
+        per_worker = [_mem(p) for p in _children(proc.pid) if "resource_tracker" not in Path(f"/proc/{p}/cmdline").read_text()]
+    finally:
+        proc.terminate()
+        proc.wait(30)
+    return {
+        "startup_s": round(startup_s, 2),
+        "workers": per_worker,
+        "total_pss_mb": round(sum(w["pss_mb"] for w in per_worker), 1),
+        "mean_rss_mb": round(sum(w["rss_mb"] for w in per_worker) / max(1, len(per_worker)), 1),
+    }
+
+
+def compare(workers: int, scale: int, dim: int, requests_per_worker: int = 8) -> Dict[str, Any]:
+    import bench
+    from stub_upstream import start_stub
+    root = bench.make_corpus(scale, dim)
+    stub = start_stub(dim=dim)
+    res = {"workers": workers, "scale": scale, "dim": dim}
+    for name, snap in (("per_worker_load", False), ("shared_snapshot", True)):
+        res[name] = _run_mode(root, workers, snap, stub.base_url, requests_per_worker)
+    stub.shutdown()
+    return res
+
+
+if __name__ == "__main__":
+    import argparse
+    if len(sys.argv) > 1 and sys.argv[1] == "compare":
+        ap = argparse.ArgumentParser(description="Compare startup time and per-worker memory: per-worker load vs shared snapshot.")
+        ap.add_argument("cmd", choices=["compare"])
+        ap.add_argument("--workers", type=int, default=4)
+        ap.add_argument("--scale", type=int, default=10, help="bench corpus size (x the real CSV)")
+        ap.add_argument("--dim", type=int, default=256, help="synthetic embedding width")
+        ap.add_argument("--requests", type=int, default=8, help="/search calls per worker before measuring")
+        args = ap.parse_args()
+        res = compare(args.workers, args.scale, args.dim, args.requests)
+        print(json.dumps(res, indent=2))
+        a, b = res["per_worker_load"], res["shared_snapshot"]
+        print(f"✅ startup {a['startup_s']}s -> {b['startup_s']}s, "
+              f"mean RSS {a['mean_rss_mb']} -> {b['mean_rss_mb']} MB, total PSS {a['total_pss_mb']} -> {b['total_pss_mb']} MB")
+        sys.exit(0)
+
+    ap = argparse.ArgumentParser(description="Serve the API with N workers attached to one shared corpus snapshot.")
+    ap.add_argument("--app", default="app:app")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8000)
+    ap.add_argument("--workers", type=int, default=int(os.getenv("TEATIME_WORKERS", "2")))
+    ap.add_argument("--no-snapshot", action="store_true", help="every worker loads its own corpus (old behaviour)")
+    args = ap.parse_args()
+    serve(args.app, args.host, args.port, args.workers, use_snapshot=not args.no_snapshot)
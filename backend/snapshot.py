@@ -0,0 +1,160 @@
+# snapshot.py
+"""
+Read-only corpus snapshot for multi-worker serving (see serve.py).
+
+write() dumps a loaded TrendRetriever into data/snapshot/ as plain .npy files
+plus meta.json: topic stats, the date-sorted row columns, timeline rollups
+and the row-normalised embedding matrix. String tables (topics) are one
+newline-joined UTF-8 blob each. read() opens every array with
+np.load(mmap_mode="r"), so N workers attached to one snapshot share those
+pages through the OS page cache instead of each holding a private copy;
+only the topic list, its id dict and the keyword blob are per worker.
+
+A snapshot is written to a temp dir and renamed into place, so a worker never
+sees half of one. It is stale when the trends CSV / trends.sqlite or the
+embedding files are newer than its meta.json.
+
+    python snapshot.py build [--force]
+"""
+from __future__ import annotations
+import json, os, shutil, sys, time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+import trend_db
+from retriever import DATA_DIR, EMB_PATH, IDX_PATH, TRENDS_MIN
+
+SNAPSHOT_DIR = Path(os.getenv("TEATIME_SNAPSHOT_DIR", str(DATA_DIR / "snapshot")))
+VERSION = 2
+
+
+class Snapshot:
+    def __init__(self, path: Path, meta: Dict[str, Any], arrays: Dict[str, np.ndarray]):
+        self.path, self.meta, self.arrays = path, meta, arrays
+
+    def group(self, prefix: str) -> Dict[str, np.ndarray]:
+        p = prefix + "."
+        return {k[len(p):]: v for k, v in self.arrays.items() if k.startswith(p)}
+
+    def strings(self, name: str) -> List[str]:
+        blob = self.arrays.get(name)
+        if blob is None or not blob.size:
+            return []
+        return blob.tobytes().decode("utf-8").split("\n")
+
+    def nbytes(self) -> int:
+        return sum(a.nbytes for a in self.arrays.values())
+
+
+def _sources() -> List[Path]:
+    src = [EMB_PATH, IDX_PATH]
+    src.append(trend_db.DB_PATH if trend_db.enabled() else TRENDS_MIN)
+    return [p for p in src if p.exists()]
+
+
+def _blob(strings: List[str]) -> np.ndarray:
+    if any("\n" in s for s in strings):
+        raise ValueError("snapshot string tables cannot contain newlines")
+    return np.frombuffer("\n".join(strings).encode("utf-8"), dtype=np.uint8)
+
+
+def is_stale(path: Path = SNAPSHOT_DIR) -> bool:
+    meta = path / "meta.json"
+    if not meta.exists():
+        return True
+    try:
+        if json.loads(meta.read_text(encoding="utf-8")).get("version") != VERSION:
+            return True
+    except (OSError, json.JSONDecodeError):
+        return True
+    built = meta.stat().st_mtime
+    return any(p.stat().st_mtime > built for p in _sources())
+
+
+def write(R, path: Path = SNAPSHOT_DIR) -> Path:
+    """Dump retriever R to `path` (atomically replaces an existing snapshot)."""
+    arrays: Dict[str, np.ndarray] = {f"stats.{k}": v for k, v in R.stats.arrays().items()}
+    if R.rows is not None:
+        arrays.update({f"rows.{k}": v for k, v in R.rows.arrays().items()})
+    arrays.update({f"rollups.{k}": v for k, v in R.rollups.a.items() if k != "topics"})
+    arrays["topics"] = _blob(R.stats.topics)
+    arrays["rollup_topics"] = _blob(R.rollups.topics)
+    if R.emb is not None and R.index is not None:
+        arrays["emb_normed"] = np.ascontiguousarray(R._normed_emb(), dtype=np.float32)
+        arrays["index_topics"] = _blob([it["topic"] for it in R.index])
+
+    tmp = path.with_name(f"{path.name}.tmp{os.getpid()}")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    for name, a in arrays.items():
+        np.save(tmp / f"{name}.npy", np.asarray(a))
+    meta = {
+        "version": VERSION,
+        "built_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "store": "sqlite" if R.db is not None else "memory",
+        "csv_start": R.csv_start,
+        "csv_end": R.csv_end,
+        "topics": len(R.stats.topics),
+        "rows": len(R.rows) if R.rows is not None else None,
+        "has_embeddings": "emb_normed" in arrays,
+    }
+    (tmp / "meta.json").write_text(json.dumps(meta, indent=2), encoding="utf-8")
+
+    # swap: workers still mapping the old files keep them until they exit
+    old = path.with_name(f"{path.name}.old{os.getpid()}")
+    if path.exists():
+        path.replace(old)
+    tmp.replace(path)
+    shutil.rmtree(old, ignore_errors=True)
+    return path
+
+
+def read(path: Optional[Path] = None) -> Snapshot:
+    path = Path(path or SNAPSHOT_DIR)
+    meta = json.loads((path / "meta.json").read_text(encoding="utf-8"))
+    if meta.get("version") != VERSION:
+        raise ValueError(f"{path}: snapshot version {meta.get('version')} != {VERSION}; rebuild it")
+    arrays: Dict[str, np.ndarray] = {}
+    for p in path.glob("*.npy"):
+        try:
+            arrays[p.stem] = np.load(p, mmap_mode="r")
+        except ValueError:
+            arrays[p.stem] = np.load(p)  # empty arrays cannot be mapped
+    return Snapshot(path, meta, arrays)
+
+
+def ensure(path: Path = SNAPSHOT_DIR, force: bool = False) -> Path:
+    """Build the snapshot from the source files if it is missing or stale."""
+    if force or is_stale(path):
+        from retriever import TrendRetriever
+        t0 = time.perf_counter()
+        write(TrendRetriever(), path)
+        print(f"[snapshot] built {path} in {time.perf_counter() - t0:.2f}s")
+    return path
+
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="Build the shared read-only corpus snapshot used by serve.py workers.")
+    ap.add_argument("cmd", choices=["build", "info"])
+    ap.add_argument("--path", default=str(SNAPSHOT_DIR))
+    ap.add_argument("--force", action="store_true", help="rebuild even if the snapshot is up to date")
+    args = ap.parse_args()
+    path = Path(args.path)
+    if args.cmd == "build":
+        if not _sources():
+            print(f"Missing {TRENDS_MIN}")
+            sys.exit(2)
+        t0 = time.perf_counter()
+        ensure(path, force=args.force)
+        snap = read(path)
+        print(f"✅ {path}: {snap.meta['topics']} topics, {snap.nbytes() / 1e6:.1f} MB of arrays ({time.perf_counter() - t0:.2f}s)")
+        sys.exit(0)
+    if is_stale(path):
+        print(f"❌ {path} is missing or stale; run: python snapshot.py build")
+        sys.exit(1)
+    snap = read(path)
+    print(json.dumps({**snap.meta, "arrays_mb": round(snap.nbytes() / 1e6, 1)}, indent=2))
+    sys.exit(0)
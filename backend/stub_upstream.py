@@ -0,0 +1,155 @@
+# stub_upstream.py
+"""
+Local stand-in for the OpenRouter endpoints we call, for offline builds,
+benchmarks and failure testing. Point clients at it with:
+
+    OPENROUTER_BASE_URL=http://127.0.0.1:8765/api/v1
+
+Endpoints:
+- POST /api/v1/embeddings        -> deterministic hash-seeded vectors
+- POST /api/v1/chat/completions  -> canned ASCII answer
+
+Latency and failures can be injected per server (--latency/--error-rate),
+per model (--model NAME=LATENCY,ERROR_RATE), as a slow tail on a fraction
+of calls (--tail-rate/--tail-latency), or per request via `X-Stub-Latency` /
+`X-Stub-Error-Rate` headers.
+"""
+from __future__ import annotations
+import json, hashlib, random, threading, time, sys
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+DIM = 1536
+
+
+def stub_vector(text: str, dim: int = DIM) -> list[float]:
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    v = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    v /= np.linalg.norm(v) + 1e-8
+    return v.tolist()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: "StubServer"
+
+    def log_message(self, fmt, *args):  # keep benchmark output clean
+        pass
+
+    def _send(self, code: int, body: dict, headers: Optional[dict] = None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        try:
+            self.end_headers()
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # caller gave up (deadline / hedged request); expected under injected latency
+
+    def do_POST(self):
+        n = int(self.headers.get("Content-Length") or 0)
+        payload = json.loads(self.rfile.read(n) or b"{}")
+        self.server.requests += 1
+
+        base_latency, base_error = self.server.models.get(payload.get("model"), (self.server.latency, self.server.error_rate))
+        latency = float(self.headers.get("X-Stub-Latency") or base_latency)
+        error_rate = float(self.headers.get("X-Stub-Error-Rate") or base_error)
+        if self.server.tail_rate > 0 and random.random() < self.server.tail_rate:
+            latency += self.server.tail_latency
+        if latency > 0:
+            time.sleep(latency)
+        if error_rate > 0 and random.random() < error_rate:
+            self.server.errors += 1
+            code = random.choice([429, 500, 503])
+            return self._send(code, {"error": {"message": "stub injected failure", "code": code}}, {"Retry-After": "0"})
+
+        if self.path.endswith("/embeddings"):
+            texts = payload.get("input") or []
+            if isinstance(texts, str):
+                texts = [texts]
+            data = [{"object": "embedding", "index": i, "embedding": stub_vector(t, self.server.dim)} for i, t in enumerate(texts)]
+            n_tok = sum(len(t) // 4 + 1 for t in texts)
+            return self._send(200, {"data": data, "model": payload.get("model"), "usage": {"prompt_tokens": n_tok, "total_tokens": n_tok}})
+
+        if self.path.endswith("/chat/completions"):
+            msgs = payload.get("messages") or []
+            text = self.server.reply or (
+                "Hot take from the timeline:\n"
+                "The feed says this is happening, loudly, with memes.\n"
+                "Trending bits I used:\n"
+                "- stub topic - 2020-01-01 to 2020-01-02 (2 days)\n"
+                "Confidence: Low - vibes-only, not facts."
+            )
+            prompt_tok = sum(len(m.get("content", "")) // 4 + 1 for m in msgs)
+            return self._send(200, {
+                "id": f"stub-{self.server.requests}",
+                "model": payload.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": prompt_tok, "completion_tokens": len(text) // 4 + 1,
+                          "total_tokens": prompt_tok + len(text) // 4 + 1},
+            })
+
+        self._send(404, {"error": {"message": f"no stub for {self.path}"}})
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, addr: Tuple[str, int], latency: float = 0.0, error_rate: float = 0.0,
+                 dim: int = DIM, reply: Optional[str] = None,
+                 models: Optional[Dict[str, Tuple[float, float]]] = None,
+                 tail_rate: float = 0.0, tail_latency: float = 0.0):
+        super().__init__(addr, _Handler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.models = dict(models or {})  # model -> (latency, error_rate), overrides the server defaults
+        self.tail_rate = tail_rate
+        self.tail_latency = tail_latency
+        self.dim = dim
+        self.reply = reply
+        self.requests = 0
+        self.errors = 0
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/api/v1"
+
+
+def start_stub(host: str = "127.0.0.1", port: int = 0, **kw) -> StubServer:
+    """Start a stub on a background thread (port 0 = pick a free one)."""
+    srv = StubServer((host, port), **kw)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    return srv
+
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="Local OpenRouter stub (embeddings + chat).")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--latency", type=float, default=0.0, help="seconds added to every call")
+    ap.add_argument("--error-rate", type=float, default=0.0, help="fraction of calls that fail with 429/5xx")
+    ap.add_argument("--model", action="append", default=[], metavar="NAME=LATENCY,ERROR_RATE",
+                    help="per-model latency/error rate, e.g. openai/gpt-4o=2.0,0.1 (repeatable)")
+    ap.add_argument("--tail-rate", type=float, default=0.0, help="fraction of calls that get --tail-latency extra")
+    ap.add_argument("--tail-latency", type=float, default=0.0)
+    ap.add_argument("--dim", type=int, default=DIM)
+    args = ap.parse_args()
+    models = {}
+    for spec in args.model:
+        name, _, vals = spec.rpartition("=")
+        lat, _, err = vals.partition(",")
+        models[name] = (float(lat or 0), float(err or 0))
+    srv = StubServer((args.host, args.port), latency=args.latency, error_rate=args.error_rate, dim=args.dim,
+                     models=models, tail_rate=args.tail_rate, tail_latency=args.tail_latency)
+    print(f"[stub] serving {srv.base_url}")
+    try:
+        srv.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    sys.exit(0)
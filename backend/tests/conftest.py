@@ -0,0 +1,16 @@
+# conftest.py
+"""
+Backend modules are flat scripts that read Path("data") relative to the
+working directory, so tests import them from backend/ and run from there.
+"""
+from __future__ import annotations
+import os, sys
+from pathlib import Path
+
+BACKEND = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND))
+os.chdir(BACKEND)
+# no query log, warm-up or per-client throttling for test traffic
+os.environ["TEATIME_QUERY_LOG"] = ""
+os.environ["TEATIME_WARMUP_TOP"] = "0"
+os.environ["TEATIME_CLIENT_RPS"] = "0"
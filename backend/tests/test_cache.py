@@ -0,0 +1,90 @@
+# test_cache.py
+"""cache.RedisCache / RespClient against resp_stub."""
+from __future__ import annotations
+import time
+
+import numpy as np
+import pytest
+
+import cache
+import metrics
+from resp_stub import start_resp_stub
+
+
+@pytest.fixture
+def resp():
+    servers = []
+
+    def start(maxmemory: int = 0):
+        srv = start_resp_stub(maxmemory=maxmemory)
+        servers.append(srv)
+        return srv
+
+    yield start
+    for srv in servers:
+        srv.shutdown()
+        srv.server_close()
+
+
+def _redis(srv, name: str = "t", ttl=None) -> cache.RedisCache:
+    return cache.RedisCache(name, max_items=1024, ttl=ttl, client=cache.RespClient(srv.url))
+
+
+def test_round_trip(resp):
+    c = _redis(resp())
+    vec = np.arange(6, dtype=np.float32).reshape(2, 3)
+    c.set("json", {"prophecy": "hot take ’", "ingredients": [{"topic": "#x", "score": 0.5}]})
+    c.set("vec", vec)
+    assert c.get("json") == {"prophecy": "hot take ’", "ingredients": [{"topic": "#x", "score": 0.5}]}
+    got = c.get("vec")
+    assert got.dtype == np.float32 and np.array_equal(got, vec)
+    assert c.get("missing", "dflt") == "dflt"
+    assert "json" in c and len(c) == 2
+    c.clear()
+    assert len(c) == 0 and c.get("json") is None
+
+
+def test_ttl_expiry(resp):
+    c = _redis(resp(), ttl=0.05)
+    c.set("short", 1)
+    c.set("long", 2, ttl=60)
+    assert c.get("short") == 1
+    time.sleep(0.1)
+    assert c.get("short") is None
+    assert c.get("long") == 2
+
+
+def test_lru_eviction_past_maxmemory(resp):
+    srv = resp(maxmemory=4096)
+    c = _redis(srv)
+    blob = "x" * 400
+    c.set("keep", blob)
+    for i in range(20):
+        c.get("keep")  # recently used, so never the eviction victim
+        c.set(f"k{i}", blob)
+    assert srv.store.evicted > 0
+    assert srv.store.used <= 4096
+    assert c.get("keep") == blob
+    assert c.get("k19") == blob
+    assert c.get("k0") is None
+
+
+def test_server_gone_mid_request_is_a_miss(resp, monkeypatch):
+    srv = resp()
+    c = _redis(srv)
+    c.set("a", 1)
+    assert c.get("a") == 1
+    errors = metrics.UPSTREAM_ERRORS.get(op="cache", status="redis")
+
+    def drop(cmd):
+        raise ConnectionResetError  # the handler closes the socket without replying
+    monkeypatch.setattr(srv, "dispatch", drop)
+    assert c.get("a", "miss") == "miss"
+    c.set("b", 2)  # swallowed, not raised
+    assert len(c) == 0
+
+    srv.shutdown()
+    srv.server_close()  # now refuse new connections too
+    assert c.get("a", "miss") == "miss"
+    assert c._warned
+    assert metrics.UPSTREAM_ERRORS.get(op="cache", status="redis") > errors
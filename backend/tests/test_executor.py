@@ -0,0 +1,76 @@
+# test_executor.py
+"""Offloading to the executor pools (TEATIME_OFFLOAD) changes where work runs, not what comes back."""
+from __future__ import annotations
+import random
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app as teatime
+import cache
+import executor
+import llm_client
+import metrics
+from stub_upstream import start_stub
+
+PREDICT = [{"prompt": "will ai take my job"},
+           {"prompt": "super bowl halftime", "date_range": {"start": "2020-01-01T00:00:00.000Z", "end": "2020-12-31T00:00:00.000Z"}}]
+SEARCH = [{"query": "super bowl", "k": 5}, {"query": "nba finals", "start": "2019-01-01", "end": "2021-12-31"}]
+
+
+@pytest.fixture(scope="module")
+def client():
+    srv = start_stub(dim=8)
+    mp = pytest.MonkeyPatch()
+    mp.setenv("OPENROUTER_API_KEY", "test")
+    mp.setattr(llm_client, "OPENROUTER_API_KEY", "test")
+    mp.setattr(llm_client, "BASE_URL", srv.base_url)
+    with TestClient(teatime.app) as c:
+        yield c
+    mp.undo()
+    srv.shutdown()
+    srv.server_close()
+
+
+def _pool_calls(pool: str) -> float:
+    s = metrics.STAGE_SECONDS._series.get((("stage", f"{pool}_wait"),))
+    return sum(s[:-1]) if s else 0.0
+
+
+def _run(client, monkeypatch, offload: bool):
+    monkeypatch.setattr(executor, "OFFLOAD", offload)
+    cache.RETRIEVAL.clear()
+    out = []
+    for body in PREDICT:
+        random.seed(0)  # /api/predict samples trends with the module RNG
+        r = client.post("/api/predict", json=body)
+        assert r.status_code == 200
+        out.append(("predict", r.json(), r.headers))
+    for body in SEARCH:
+        r = client.post("/search", json=body)
+        assert r.status_code == 200
+        out.append(("search", r.json(), r.headers))
+    return out
+
+
+def test_same_payloads_with_offload_on_and_off(client, monkeypatch):
+    before = (_pool_calls("cpu"), _pool_calls("io"))
+    inline = _run(client, monkeypatch, offload=False)
+    assert (_pool_calls("cpu"), _pool_calls("io")) == before  # really inline
+    pooled = _run(client, monkeypatch, offload=True)
+    assert _pool_calls("cpu") == before[0] + len(PREDICT) and _pool_calls("io") == before[1] + len(PREDICT)
+    assert all(body["message"].startswith("Hot take") for n, body, _ in pooled if n == "predict")  # the stub answered
+    assert [(n, body) for n, body, _ in pooled] == [(n, body) for n, body, _ in inline]
+
+
+@pytest.mark.parametrize("offload", [False, True])
+def test_spans_and_tokens_survive_the_thread_hop(client, monkeypatch, offload):
+    monkeypatch.setattr(executor, "OFFLOAD", offload)
+    random.seed(0)
+    r = client.post("/api/predict", json=PREDICT[0])
+    assert r.status_code == 200
+    stages = {part.split(";")[0] for part in r.headers["Server-Timing"].split(", ")}
+    # csv_load/relevance are recorded on the CPU pool, llm_call wraps the I/O pool call,
+    # and the token totals are added from the I/O pool thread
+    assert {"csv_load", "relevance", "llm_call", "total"} <= stages
+    assert "prompt=" in r.headers["X-Teatime-Tokens"]
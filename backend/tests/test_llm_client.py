@@ -0,0 +1,107 @@
+# test_llm_client.py
+"""Circuit breaker, hedging and failover in llm_client, against stub_upstream."""
+from __future__ import annotations
+import random, time
+
+import pytest
+import requests
+
+import llm_client
+import metrics
+from stub_upstream import start_stub
+
+PRIMARY, BACKUP = "stub/primary", "stub/backup"
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """Start a stub with the given options and point llm_client at it, with fresh breakers."""
+    servers = []
+
+    def start(backups=(), hedge=False, **kw):
+        srv = start_stub(dim=8, **kw)
+        servers.append(srv)
+        monkeypatch.setattr(llm_client, "BASE_URL", srv.base_url)
+        monkeypatch.setattr(llm_client, "OPENROUTER_API_KEY", "test")
+        monkeypatch.setattr(llm_client, "CHAT_MODEL", PRIMARY)
+        monkeypatch.setattr(llm_client, "BACKUP_MODELS", list(backups))
+        monkeypatch.setattr(llm_client, "HEDGE", hedge)
+        monkeypatch.setattr(llm_client, "HEDGE_DELAY_S", 0.1)
+        monkeypatch.setattr(llm_client, "_breakers", {})
+        monkeypatch.setattr(llm_client, "_latency", {})
+        return srv
+
+    yield start
+    for srv in servers:
+        srv.shutdown()
+        srv.server_close()
+
+
+def _events(event: str, model: str) -> float:
+    return metrics.LLM_EVENTS.get(event=event, model=model)
+
+
+def test_breaker_opens_after_consecutive_failures(upstream):
+    srv = upstream(error_rate=1.0)
+    for _ in range(llm_client.BREAKER_FAILURES):
+        with pytest.raises(requests.HTTPError):
+            llm_client.chat("s", "u", timeout=5)
+    assert llm_client.breaker(PRIMARY).state == "open"
+
+    sent = srv.requests
+    with pytest.raises(llm_client.CircuitOpen):
+        llm_client.chat("s", "u", timeout=5)
+    assert srv.requests == sent  # an open breaker does not call upstream
+
+
+def test_breaker_half_open_trial_closes_on_success(upstream):
+    srv = upstream(error_rate=1.0)
+    b = llm_client.breaker(PRIMARY)
+    for _ in range(llm_client.BREAKER_FAILURES):
+        with pytest.raises(requests.HTTPError):
+            llm_client.chat("s", "u", timeout=5)
+    srv.error_rate = 0.0
+    b.opened_at -= b.cooldown  # cooldown over
+    assert b.state == "half_open"
+    assert llm_client.chat("s", "u", timeout=5)
+    assert b.state == "closed"
+
+
+def test_failover_goes_to_next_model(upstream):
+    srv = upstream(backups=[BACKUP], models={PRIMARY: (0.0, 1.0)})
+    before = _events("failover", BACKUP)
+    text, usage = llm_client.chat_with_usage("s", "u", timeout=5)
+    assert text and usage["model"] == BACKUP
+    assert _events("failover", BACKUP) == before + 1
+    assert srv.errors == 1
+
+
+def test_hedge_wins_on_slow_primary(upstream):
+    tail = 2.0
+    upstream(hedge=True, tail_rate=0.5, tail_latency=tail)
+    # the stub draws random() once per call: pick a seed where the first call
+    # lands in the tail and the hedge (the second call) does not
+    seed = next(s for s in range(1000) if (lambda r: r.random() < 0.5 <= r.random())(random.Random(s)))
+    random.seed(seed)
+    before = _events("hedge", PRIMARY)
+    t0 = time.monotonic()
+    text, usage = llm_client.chat_with_usage("s", "u", timeout=5)
+    assert text and usage["model"] == PRIMARY
+    assert time.monotonic() - t0 < tail / 2
+    assert _events("hedge", PRIMARY) == before + 1
+
+
+def test_no_hedge_when_primary_is_fast(upstream):
+    upstream(hedge=True)
+    before = _events("hedge", PRIMARY)
+    llm_client.chat("s", "u", timeout=5)
+    assert _events("hedge", PRIMARY) == before
+
+
+def test_spent_budget_is_not_sent(upstream):
+    srv = upstream()
+    with pytest.raises(requests.Timeout):
+        llm_client.chat("s", "u", timeout=0)
+    with pytest.raises(requests.Timeout):
+        llm_client.embed_texts(["x"], timeout=0)
+    assert srv.requests == 0
@@ -0,0 +1,62 @@
+# test_sanitize.py
+"""sanitize.to_ascii against the old NFKD pipeline (sanitize._legacy)."""
+from __future__ import annotations
+
+import pytest
+
+import sanitize
+
+
+@pytest.fixture(autouse=True)
+def fresh_tables():
+    table, runs = dict(sanitize.TABLE), dict(sanitize._RUNS)
+    yield
+    sanitize.TABLE.clear()
+    sanitize.TABLE.update(table)
+    sanitize._RUNS.clear()
+    sanitize._RUNS.update(runs)
+
+
+def test_matches_legacy_on_synthetic_responses():
+    texts = sanitize._corpus(300)
+    assert [sanitize.to_ascii(t) for t in texts] == [sanitize._expected(t) for t in texts]
+
+
+def test_matches_legacy_per_codepoint():
+    # every codepoint below U+3000 plus a stride through the rest (the full sweep is `sanitize.py check`)
+    cps = [*range(0x3000), *range(0x3000, 0x110000, 61)]
+    bad = []
+    for cp in cps:
+        if 0xD800 <= cp < 0xE000:
+            continue
+        c = chr(cp)
+        for s in (f"a{c}b", f"a{c}{c}b", f"{c}—{c}"):
+            if sanitize.to_ascii(s) != sanitize._expected(s):
+                bad.append((hex(cp), s))
+    assert bad == []
+
+
+@pytest.mark.parametrize("text", [
+    "cafe\u0301 cafe\u0301\u0301",                     # base + combining accents
+    "e\u0301\u2014e\u0301",                            # combining mark next to an em dash
+    "\ufb01re \ufb02ow",                                # ligatures decompose to two letters
+    "\U0001F468\u200d\U0001F469\u200d\U0001F467 fam",  # ZWJ emoji sequence
+    "\U0001F1FA\U0001F1F8 flag",                        # regional indicator pair
+    "\u1100\u1161\u11a8 jamo",                          # decomposed Hangul
+    "x\u00b2 \u00bd \u2153",                            # superscript / fractions
+    "a \u2013\u2014\ufe31 b",                           # mixed dash run collapses to one "-"
+    "\u201chot\u201d take \u2019s \u00abq\u00bb \u2026",
+    "\n\n\n\nlead\n\n\n\n\ntrail  \n\n",
+])
+def test_matches_legacy_on_multi_codepoint_sequences(text):
+    assert sanitize.to_ascii(text) == sanitize._expected(text)
+
+
+def test_punctuation_maps_instead_of_dropping():
+    assert sanitize.to_ascii("\u201cdon\u2019t\u201d \u2014 wait\u2026") == '"don\'t" - wait...'
+    assert sanitize._legacy("\u201cdon\u2019t\u201d") == "dont"  # what the old one did
+
+
+def test_ascii_passthrough_and_non_str():
+    assert sanitize.to_ascii("  plain ascii\n") == "plain ascii"
+    assert sanitize.to_ascii(None) == ""
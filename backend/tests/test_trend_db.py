@@ -0,0 +1,47 @@
+# test_trend_db.py
+from __future__ import annotations
+import functools
+
+import pytest
+
+import retriever
+import trend_db
+
+QUERIES = ["super bowl", "world day", "veterans day", "will ai take my job", "the new iphone", "monday motivation", "nba finals",
+           "taylor swift", "election night results", "love island"]
+WINDOWS = [(None, None), ("2020-01-01", "2020-12-31"), ("2024-06-01", "2024-09-30")]
+
+
+@pytest.fixture(scope="module")
+def stores(tmp_path_factory):
+    if not trend_db.TRENDS_CSV.exists():
+        pytest.skip(f"no {trend_db.TRENDS_CSV}")
+    db = tmp_path_factory.mktemp("db") / "trends.sqlite"
+    trend_db.build(out=db)
+    mem = retriever.TrendRetriever()
+    mp = pytest.MonkeyPatch()
+    mp.setattr(trend_db, "enabled", lambda: True)
+    mp.setattr(trend_db, "TrendDB", functools.partial(trend_db.TrendDB, db))
+    try:
+        sql = retriever.TrendRetriever()
+    finally:
+        mp.undo()
+    assert mem.db is None and sql.db is not None
+    return mem, sql
+
+
+@pytest.mark.parametrize("query", QUERIES)
+@pytest.mark.parametrize("window", WINDOWS)
+def test_keyword_search_matches_memory_store(stores, query, window):
+    mem, sql = stores
+    for k in (8, 50):
+        assert sql.keyword_search(query, k, *window) == mem.keyword_search(query, k, *window)
+
+
+def test_common_word_is_not_cut_alphabetically(stores):
+    mem, sql = stores
+    # "day" hits ~570 topics; the best "world day" matches sort late A-Z, past any fixed limit
+    assert len(sql.db.keyword_topics(["world", "day"], None, None)) > 256
+    got = sql.keyword_search("world day", k=10)
+    assert got == mem.keyword_search("world day", k=10)
+    assert all("world" in it["topic"].lower() for it in got)
@@ -0,0 +1,41 @@
+# test_windows.py
+"""Date windows: a bad one is a 400, an empty one is a 200 with nothing in it."""
+from __future__ import annotations
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app as teatime
+
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(teatime.app) as c:
+        yield c
+
+
+@pytest.mark.parametrize("params", [
+    {"start": "2021-06-01", "end": "2021-01-01"},
+    {"start": "2021-06-01T12:00:00.000Z", "end": "2021-05-31T23:00:00.000Z"},
+    {"start": "June 2021"},
+])
+def test_bad_window_is_rejected(client, params):
+    assert client.post("/search", json={"query": "super bowl", **params}).status_code == 400
+    assert client.get("/timeline", params=params).status_code == 400
+
+
+def test_bad_predict_range_is_rejected(client, monkeypatch):
+    monkeypatch.setenv("OPENROUTER_API_KEY", "test")  # checked first; the 400 comes before any upstream call
+    r = client.post("/api/predict", json={"prompt": "x", "date_range": {"start": "2021-06-01T00:00:00.000Z",
+                                                                         "end": "2021-01-01T00:00:00.000Z"}})
+    assert r.status_code == 400
+
+
+def test_single_day_and_open_ended_windows_are_fine(client):
+    for params in ({"start": "2021-01-01", "end": "2021-01-01"}, {"start": "2021-01-01"}, {"end": "2021-01-01"}):
+        assert client.post("/search", json={"query": "super bowl", **params}).status_code == 200
+
+
+def test_window_outside_the_corpus_is_empty_not_an_error(client):
+    r = client.post("/search", json={"query": "super bowl", "start": "1990-01-01", "end": "1990-12-31"})
+    assert r.status_code == 200
@@ -0,0 +1,251 @@
+# trend_db.py
+"""
+Optional SQLite backend for the trend corpus.
+
+Schema:
+- topics(id, topic, first_seen, last_seen, days_seen)
+- trends(date, rank, topic_id)        indexed on date and (topic_id, date)
+- topics_fts                          FTS5 (trigram) over topics.topic
+
+Enable with TEATIME_STORE=sqlite after `python trend_db.py build`.
+TrendRetriever and server.load_trends_from_csv then query the database
+through a small pool of read-only connections instead of holding every row
+in Python lists.
+"""
+from __future__ import annotations
+import csv, logging, os, queue, sqlite3, sys, threading, time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Iterable, Iterator, Tuple
+
+DATA_DIR = Path("data")
+TRENDS_CSV = DATA_DIR / "trends_min_us.csv"
+DB_PATH = DATA_DIR / "trends.sqlite"
+
+log = logging.getLogger("teatime.trend_db")
+
+POOL_SIZE = int(os.getenv("TEATIME_DB_POOL", "4"))
+# FTS5 trigram needs >= 3 chars; shorter tokens fall back to LIKE
+_MIN_FTS_TOKEN = 3
+
+SCHEMA = """
+CREATE TABLE topics (
+    id INTEGER PRIMARY KEY,
+    topic TEXT NOT NULL UNIQUE,
+    first_seen TEXT NOT NULL,
+    last_seen TEXT NOT NULL,
+    days_seen INTEGER NOT NULL
+);
+CREATE TABLE trends (
+    date TEXT NOT NULL,
+    rank INTEGER NOT NULL,
+    topic_id INTEGER NOT NULL REFERENCES topics(id)
+);
+CREATE INDEX idx_trends_date ON trends(date, rank);
+CREATE INDEX idx_trends_topic ON trends(topic_id, date);
+CREATE VIRTUAL TABLE topics_fts USING fts5(topic, content='topics', content_rowid='id', tokenize='trigram');
+"""
+
+
+def enabled() -> bool:
+    """True when TEATIME_STORE=sqlite and the database is at least as new as the CSV."""
+    if os.getenv("TEATIME_STORE", "").lower() != "sqlite" or not DB_PATH.exists():
+        return False
+    if TRENDS_CSV.exists() and DB_PATH.stat().st_mtime < TRENDS_CSV.stat().st_mtime:
+        log.warning("%s is older than %s; rebuild with `python trend_db.py build`", DB_PATH, TRENDS_CSV)
+        return False
+    return True
+
+
+def build(src: Path = TRENDS_CSV, out: Path = DB_PATH) -> Tuple[int, int]:
+    rows = []
+    with src.open("r", encoding="utf-8", newline="") as f:
+        for r in csv.DictReader(f):
+            d, t = r["date"].strip(), r["topic"].strip()
+            if d and t:
+                rows.append((d, int(r["rank"]), t))
+
+    topic_dates: Dict[str, set] = {}
+    for d, _, t in rows:
+        topic_dates.setdefault(t, set()).add(d)
+    topic_id = {t: i for i, t in enumerate(topic_dates, start=1)}
+
+    tmp = out.with_suffix(".sqlite.tmp")
+    tmp.unlink(missing_ok=True)
+    con = sqlite3.connect(tmp)
+    try:
+        con.executescript(SCHEMA)
+        con.executemany(
+            "INSERT INTO topics(id, topic, first_seen, last_seen, days_seen) VALUES (?, ?, ?, ?, ?)",
+            ((topic_id[t], t, min(ds), max(ds), len(ds)) for t, ds in topic_dates.items()),
+        )
+        con.executemany(
+            "INSERT INTO trends(date, rank, topic_id) VALUES (?, ?, ?)",
+            ((d, rk, topic_id[t]) for d, rk, t in sorted(rows, key=lambda x: (x[0], x[1]))),
+        )
+        con.execute("INSERT INTO topics_fts(topics_fts) VALUES ('rebuild')")
+        con.commit()
+        con.execute("ANALYZE")
+        con.execute("VACUUM")
+    finally:
+        con.close()
+    tmp.replace(out)
+    return len(rows), len(topic_id)
+
+
+class TrendDB:
+    """Read-only access to trends.sqlite through a bounded connection pool."""
+
+    def __init__(self, path: Path = DB_PATH, pool_size: int = POOL_SIZE):
+        self.path = path
+        self._pool: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._free = pool_size
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        con = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+        con.execute("PRAGMA query_only = ON")
+        con.execute("PRAGMA mmap_size = 268435456")
+        return con
+
+    @contextmanager
+    def conn(self) -> Iterator[sqlite3.Connection]:
+        try:
+            con = self._pool.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                grow = self._free > 0
+                self._free -= grow
+            # otherwise wait for a connection to come back
+            con = self._connect() if grow else self._pool.get()
+        try:
+            yield con
+        finally:
+            self._pool.put(con)
+
+    def _all(self, sql: str, params: Iterable[Any] = ()) -> list:
+        with self.conn() as con:
+            return con.execute(sql, tuple(params)).fetchall()
+
+    # --- corpus metadata ---
+    def bounds(self) -> Tuple[str, str]:
+        return tuple(self._all("SELECT min(date), max(date) FROM trends")[0])
+
+    def topic_count(self) -> int:
+        return self._all("SELECT count(*) FROM topics")[0][0]
+
+    # --- queries used by TrendRetriever / server ---
+    def rows_in_window(self, start: Optional[str], end: Optional[str]) -> List[Dict[str, str]]:
+        rs = self._all(
+            "SELECT tr.date, tr.rank, tp.topic FROM trends tr JOIN topics tp ON tp.id = tr.topic_id "
+            "WHERE tr.date BETWEEN ? AND ? ORDER BY tr.date, tr.rank",
+            (start or "0000-01-01", end or "9999-12-31"),
+        )
+        return [{"date": d, "rank": str(rk), "topic": t} for d, rk, t in rs]
+
+    def iter_rows(self) -> Iterator[Dict[str, str]]:
+        """Every trend row, streamed (for building in-memory summaries)."""
+        with self.conn() as con:
+            cur = con.execute(
+                "SELECT tr.date, tr.rank, tp.topic FROM trends tr JOIN topics tp ON tp.id = tr.topic_id ORDER BY tr.date, tr.rank")
+            for d, rk, t in cur:
+                yield {"date": d, "rank": str(rk), "topic": t}
+
+    def iter_topic_days(self) -> Iterator[Tuple[str, List[Tuple[str, int]]]]:
+        """(topic, [(date, best rank that day), ...] by date), streamed one topic at a time."""
+        with self.conn() as con:
+            cur = con.execute(
+                "SELECT tp.topic, tr.date, min(tr.rank) FROM trends tr JOIN topics tp ON tp.id = tr.topic_id "
+                "GROUP BY tr.topic_id, tr.date ORDER BY tr.topic_id, tr.date")
+            topic, days = None, []
+            for t, d, rk in cur:
+                if t != topic:
+                    if days:
+                        yield topic, days
+                    topic, days = t, []
+                days.append((d, rk))
+            if days:
+                yield topic, days
+
+    def topics_in_window(self, topics: List[str], start: Optional[str], end: Optional[str]) -> List[str]:
+        """Subset of topics (order kept) that trended at least once in [start, end]."""
+        if not topics:
+            return []
+        s, e = start or "0000-01-01", end or "9999-12-31"
+        allowed = set()
+        for i in range(0, len(topics), 500):  # stay under SQLITE_MAX_VARIABLE_NUMBER
+            chunk = topics[i:i+500]
+            marks = ",".join("?" * len(chunk))
+            allowed.update(t for (t,) in self._all(
+                f"SELECT tp.topic FROM topics tp WHERE tp.topic IN ({marks}) AND EXISTS ("
+                "SELECT 1 FROM trends tr WHERE tr.topic_id = tp.id AND tr.date BETWEEN ? AND ?)",
+                (*chunk, s, e),
+            ))
+        return [t for t in topics if t in allowed]
+
+    def keyword_topics(self, tokens: List[str], start: Optional[str], end: Optional[str],
+                       limit: Optional[int] = None) -> List[str]:
+        """
+        Topics containing any token (case-insensitive substring), restricted to
+        the window. Unranked: with a limit the cut is arbitrary, so callers that
+        rank (TrendRetriever.keyword_search) fetch every match.
+        """
+        tokens = [t for t in tokens if t]
+        if not tokens:
+            return []
+        long_toks = [t for t in tokens if len(t) >= _MIN_FTS_TOKEN]
+        short_toks = [t for t in tokens if len(t) < _MIN_FTS_TOKEN]
+        match_sql, params = [], []
+        if long_toks:
+            match_sql.append("tp.id IN (SELECT rowid FROM topics_fts WHERE topics_fts MATCH ?)")
+            params.append(" OR ".join('"' + t.replace('"', '""') + '"' for t in long_toks))
+        for t in short_toks:
+            match_sql.append("lower(tp.topic) LIKE ? ESCAPE '\\'")
+            params.append("%" + t.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%")
+        where = "(" + " OR ".join(match_sql) + ")"
+        if start or end:
+            where += " AND EXISTS (SELECT 1 FROM trends tr WHERE tr.topic_id = tp.id AND tr.date BETWEEN ? AND ?)"
+            params += [start or "0000-01-01", end or "9999-12-31"]
+        sql = f"SELECT tp.topic FROM topics tp WHERE {where} ORDER BY tp.topic"
+        if limit is not None:
+            sql, params = sql + " LIMIT ?", [*params, limit]
+        rs = self._all(sql, params)
+        return [t for (t,) in rs]
+
+    def window_stats(self, topics: List[str], start: Optional[str], end: Optional[str]) -> Dict[str, Tuple[str, str, int]]:
+        """topic -> (first, last, distinct days) inside [start, end], for the topics that trended in it."""
+        s, e = start or "0000-01-01", end or "9999-12-31"
+        out: Dict[str, Tuple[str, str, int]] = {}
+        for i in range(0, len(topics), 500):
+            chunk = topics[i:i+500]
+            marks = ",".join("?" * len(chunk))
+            for t, first, last, n in self._all(
+                "SELECT tp.topic, min(tr.date), max(tr.date), count(DISTINCT tr.date) "
+                f"FROM topics tp JOIN trends tr ON tr.topic_id = tp.id WHERE tp.topic IN ({marks}) "
+                "AND tr.date BETWEEN ? AND ? GROUP BY tp.id",
+                (*chunk, s, e),
+            ):
+                out[t] = (first, last, n)
+        return out
+
+    def topic_dates(self, topic: str, start: Optional[str] = None, end: Optional[str] = None) -> List[str]:
+        rs = self._all(
+            "SELECT DISTINCT tr.date FROM trends tr JOIN topics tp ON tp.id = tr.topic_id "
+            "WHERE tp.topic = ? AND tr.date BETWEEN ? AND ? ORDER BY tr.date",
+            (topic, start or "0000-01-01", end or "9999-12-31"),
+        )
+        return [d for (d,) in rs]
+
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="Build the SQLite trend store from trends_min_us.csv.")
+    ap.add_argument("cmd", choices=["build"])
+    args = ap.parse_args()
+    if not TRENDS_CSV.exists():
+        print(f"Missing {TRENDS_CSV}")
+        sys.exit(2)
+    t0 = time.perf_counter()
+    n_rows, n_topics = build()
+    print(f"✅ Wrote {DB_PATH} ({n_rows} rows, {n_topics} topics) in {time.perf_counter() - t0:.2f}s")
+    sys.exit(0)
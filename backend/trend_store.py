@@ -0,0 +1,183 @@
+# trend_store.py
+"""
+Columnar (Arrow/Parquet) copy of the trend corpus.
+
+- trends_min_us.parquet:        date: date32, rank: int8, topic: dictionary<string>
+- trends_topic_summary.parquet: topic, first_seen/last_seen: date32, days_seen: int32,
+                                years_active: list<int16>, example_dates: list<date32>
+
+The retriever loads the whole trend table once at startup (date windows are
+then answered from memory), so this is a faster-to-parse copy of the CSV, not
+a per-request store. Readers fall back to the CSV/JSON files when pyarrow is
+missing or the Parquet copy is older than its source.
+
+    python trend_store.py build     # (re)write the parquet files
+    python trend_store.py compare   # load-time / size vs CSV + JSON
+"""
+from __future__ import annotations
+import csv, json, time, sys
+from datetime import date
+from pathlib import Path
+from typing import List, Dict, Any
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    HAS_ARROW = True
+except ImportError:
+    HAS_ARROW = False
+
+DATA_DIR = Path("data")
+TRENDS_CSV = DATA_DIR / "trends_min_us.csv"
+SUMMARY_JSON = DATA_DIR / "trends_topic_summary.json"
+TRENDS_PARQUET = DATA_DIR / "trends_min_us.parquet"
+SUMMARY_PARQUET = DATA_DIR / "trends_topic_summary.parquet"
+
+
+def _fresh(pq_path: Path, src: Path) -> bool:
+    return HAS_ARROW and pq_path.exists() and (not src.exists() or pq_path.stat().st_mtime >= src.stat().st_mtime)
+
+
+def trends_parquet_ready() -> bool:
+    return _fresh(TRENDS_PARQUET, TRENDS_CSV)
+
+
+def summary_parquet_ready() -> bool:
+    return _fresh(SUMMARY_PARQUET, SUMMARY_JSON)
+
+
+def _trend_schema():
+    return pa.schema([
+        ("date", pa.date32()),
+        ("rank", pa.int8()),
+        ("topic", pa.dictionary(pa.int32(), pa.string())),
+    ])
+
+
+def write_trends_parquet(src: Path = TRENDS_CSV, out: Path = TRENDS_PARQUET) -> int:
+    dates, ranks, topics = [], [], []
+    with src.open("r", encoding="utf-8", newline="") as f:
+        for r in csv.DictReader(f):
+            dates.append(date.fromisoformat(r["date"]))
+            ranks.append(int(r["rank"]))
+            topics.append(r["topic"])
+    order = sorted(range(len(dates)), key=lambda i: (dates[i], ranks[i]))
+    table = pa.table({
+        "date": pa.array([dates[i] for i in order], pa.date32()),
+        "rank": pa.array([ranks[i] for i in order], pa.int8()),
+        "topic": pa.array([topics[i] for i in order], pa.string()).dictionary_encode(),
+    }, schema=_trend_schema())
+    out.parent.mkdir(parents=True, exist_ok=True)
+    pq.write_table(table, out, compression="zstd")
+    return table.num_rows
+
+
+def write_summary_parquet(src: Path = SUMMARY_JSON, out: Path = SUMMARY_PARQUET) -> int:
+    summary = json.loads(src.read_text(encoding="utf-8"))
+    table = pa.table({
+        "topic": pa.array([s["topic"] for s in summary], pa.string()),
+        "first_seen": pa.array([date.fromisoformat(s["first_seen"]) for s in summary], pa.date32()),
+        "last_seen": pa.array([date.fromisoformat(s["last_seen"]) for s in summary], pa.date32()),
+        "days_seen": pa.array([s["days_seen"] for s in summary], pa.int32()),
+        "years_active": pa.array([[int(y) for y in s["years_active"]] for s in summary], pa.list_(pa.int16())),
+        "example_dates": pa.array([[date.fromisoformat(d) for d in s["example_dates"]] for s in summary], pa.list_(pa.date32())),
+    })
+    out.parent.mkdir(parents=True, exist_ok=True)
+    pq.write_table(table, out, compression="zstd")
+    return table.num_rows
+
+
+def read_trend_table(path: Path = TRENDS_PARQUET):
+    return pq.read_table(path)
+
+
+def read_trend_rows(path: Path = TRENDS_PARQUET) -> List[Dict[str, str]]:
+    """Same shape as the CSV readers: [{"date": "YYYY-MM-DD", "rank": "1", "topic": ...}]."""
+    t = read_trend_table(path)
+    ds = t.column("date").cast(pa.string()).to_pylist()
+    rs = t.column("rank").cast(pa.string()).to_pylist()
+    ts = t.column("topic").cast(pa.string()).to_pylist()
+    return [{"date": d, "rank": r, "topic": tp} for d, r, tp in zip(ds, rs, ts)]
+
+
+def read_summary(path: Path = SUMMARY_PARQUET) -> List[Dict[str, Any]]:
+    """Same shape as trends_topic_summary.json."""
+    t = pq.read_table(path)
+    cols = {
+        "topic": t.column("topic").to_pylist(),
+        "first_seen": t.column("first_seen").cast(pa.string()).to_pylist(),
+        "last_seen": t.column("last_seen").cast(pa.string()).to_pylist(),
+        "days_seen": t.column("days_seen").to_pylist(),
+        "years_active": t.column("years_active").to_pylist(),
+        "example_dates": t.column("example_dates").to_pylist(),
+    }
+    return [{
+        "topic": cols["topic"][i],
+        "first_seen": cols["first_seen"][i],
+        "last_seen": cols["last_seen"][i],
+        "days_seen": cols["days_seen"][i],
+        "years_active": [str(y) for y in cols["years_active"][i]],
+        "example_dates": [d.isoformat() for d in cols["example_dates"][i]],
+    } for i in range(t.num_rows)]
+
+
+def build() -> int:
+    if not HAS_ARROW:
+        print("❌ pyarrow is not installed (pip install pyarrow)")
+        return 2
+    if not TRENDS_CSV.exists():
+        print(f"Missing {TRENDS_CSV}")
+        return 2
+    n = write_trends_parquet()
+    print(f"✅ Wrote {TRENDS_PARQUET} ({n} rows)")
+    if SUMMARY_JSON.exists():
+        n = write_summary_parquet()
+        print(f"✅ Wrote {SUMMARY_PARQUET} ({n} topics)")
+    return 0
+
+
+def _best_of(fn, repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def compare() -> Dict[str, Any]:
+    """Load time (best of 5) and on-disk size: CSV/JSON vs Parquet."""
+    def csv_all():
+        with TRENDS_CSV.open("r", encoding="utf-8", newline="") as f:
+            return [{"date": r["date"], "rank": r["rank"], "topic": r["topic"]} for r in csv.DictReader(f)]
+
+    out: Dict[str, Any] = {
+        "trends": {
+            "csv_bytes": TRENDS_CSV.stat().st_size,
+            "parquet_bytes": TRENDS_PARQUET.stat().st_size,
+            "csv_load_s": _best_of(csv_all),
+            "parquet_load_s": _best_of(read_trend_rows),
+            "parquet_arrow_only_s": _best_of(read_trend_table),
+        }
+    }
+    if SUMMARY_PARQUET.exists():
+        out["summary"] = {
+            "json_bytes": SUMMARY_JSON.stat().st_size,
+            "parquet_bytes": SUMMARY_PARQUET.stat().st_size,
+            "json_load_s": _best_of(lambda: json.loads(SUMMARY_JSON.read_text(encoding="utf-8"))),
+            "parquet_load_s": _best_of(read_summary),
+        }
+    return out
+
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="Build or benchmark the Parquet copy of the trend corpus.")
+    ap.add_argument("cmd", choices=["build", "compare"])
+    args = ap.parse_args()
+    if args.cmd == "build":
+        sys.exit(build())
+    if not (HAS_ARROW and TRENDS_PARQUET.exists()):
+        print("❌ Run `python trend_store.py build` first.")
+        sys.exit(2)
+    print(json.dumps(compare(), indent=2))